@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Чтение бинарного индекса (.meta/.forward/.inverted) через mmap
+
+Формат совпадает с Indexer::save_to_file. Постинг-листы отдаются как
+memoryview поверх отображенного файла, без копирования; сжатые
+(FLAG_COMPRESSED) и битовые карты (FLAG_BITMAPS) декодируются при обращении.
+"""
+
+import itertools
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+INDEX_MAGIC = 0x49444558
+INDEX_VERSION = 0x0002
+FLAG_COMPRESSED = 0x0001
+FLAG_STEMMED = 0x0002
+FLAG_POSITIONAL = 0x0004
+FLAG_DOC_TABLE = 0x0008
+FLAG_BITMAPS = 0x0010
+FLAG_TERM_TABLE = 0x0020
+
+# Сжатые постинг-листы (encode_postings в indexer.h): [varint payload_size] и
+# u32 doc_id (payload_size == 4 * df), varint дельты (df <= POSTING_BLOCK_SIZE)
+# или блоки [u32 last_doc_id][u16 block_size][varint дельты]
+POSTING_BLOCK_SIZE = 128
+POSTING_BLOCK_HEADER = 6
+
+# Представление постингов терма при FLAG_BITMAPS (encode_bitmap в indexer.h):
+# битовая карта - [u32 num_containers] и контейнеры по 65536 doc_id
+# [u16 chunk][u16 type][u32 cardinality] + u16 low[] или u64 words[1024]
+POSTING_LIST = 0
+POSTING_BITMAP = 1
+BITMAP_CONTAINER_ARRAY = 0
+BITMAP_CONTAINER_WORDS = 1
+BITMAP_CHUNK_BYTES = 1024 * 8
+
+# struct IndexMetadata из indexer.h (с выравниванием uint64_t timestamp)
+META_STRUCT = struct.Struct('<IHHIIQIIII256s')
+
+IndexMetadata = namedtuple('IndexMetadata', [
+    'magic', 'version', 'flags', 'total_documents', 'total_unique_terms',
+    'timestamp', 'forward_offset', 'forward_size', 'inverted_offset',
+    'inverted_size', 'reserved'
+])
+
+Document = namedtuple('Document', [
+    'doc_id', 'url', 'title', 'content_length', 'token_count', 'unique_terms'
+])
+
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_DOC_TAIL = struct.Struct('<III')
+_CONTAINER = struct.Struct('<HHI')
+
+# Номера установленных битов для каждого значения байта
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+EMPTY_POSTINGS = memoryview(b'').cast('I')
+
+
+def read_metadata(meta_path):
+    """Прочитать и проверить IndexMetadata из файла .meta"""
+    with open(meta_path, 'rb') as f:
+        data = f.read(META_STRUCT.size)
+
+    if len(data) != META_STRUCT.size:
+        raise ValueError(f"Поврежден файл метаданных: {meta_path}")
+
+    metadata = IndexMetadata(*META_STRUCT.unpack(data))
+    if metadata.magic != INDEX_MAGIC:
+        raise ValueError(f"Неверная сигнатура индекса: {meta_path}")
+    if metadata.version != INDEX_VERSION:
+        raise ValueError(f"Версия индекса {meta_path}: 0x{metadata.version:04x}, "
+                         f"поддерживается 0x{INDEX_VERSION:04x} - перестройте индекс")
+
+    return metadata
+
+
+def read_varint(data, pos):
+    """(значение, смещение после него) для varint в data с позиции pos"""
+    value = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return value, pos
+        shift += 7
+
+
+def decode_postings(payload, count):
+    """Декодировать count doc_id сжатого постинг-листа"""
+    if len(payload) == 4 * count:
+        return array('I', payload)
+
+    doc_ids = array('I', bytes(4 * count))
+    blocks = count > POSTING_BLOCK_SIZE
+    pos = 0
+    prev = 0
+    n = 0
+
+    while n < count:
+        if blocks:
+            pos += POSTING_BLOCK_HEADER
+        end = min(n + POSTING_BLOCK_SIZE, count)
+
+        while n < end:
+            b = payload[pos]
+            pos += 1
+            delta = b & 0x7F
+            shift = 7
+
+            while b & 0x80:
+                b = payload[pos]
+                pos += 1
+                delta |= (b & 0x7F) << shift
+                shift += 7
+
+            prev += delta
+            doc_ids[n] = prev
+            n += 1
+
+    return doc_ids
+
+
+def decode_bitmap(payload, count):
+    """Развернуть контейнеры битовой карты в отсортированный список doc_id"""
+    doc_ids = array('I')
+    num_containers = _U32.unpack_from(payload, 0)[0]
+    pos = 4
+
+    for _ in range(num_containers):
+        chunk, kind, cardinality = _CONTAINER.unpack_from(payload, pos)
+        pos += _CONTAINER.size
+        base = chunk << 16
+
+        if kind == BITMAP_CONTAINER_ARRAY:
+            lows = array('H', payload[pos:pos + cardinality * 2])
+            doc_ids.extend(base + low for low in lows)
+            pos += cardinality * 2
+        else:
+            words = payload[pos:pos + BITMAP_CHUNK_BYTES]
+            for i, byte in enumerate(words):
+                if byte:
+                    start = base + i * 8
+                    doc_ids.extend(start + bit for bit in _BYTE_BITS[byte])
+            pos += BITMAP_CHUNK_BYTES
+
+    if len(doc_ids) != count:
+        raise ValueError("Поврежден постинг-лист в виде битовой карты")
+
+    return doc_ids
+
+
+def _map_file(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class IndexReader:
+    """Индекс, отображенный в память, с поиском термов как в IndexLoader"""
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.metadata = read_metadata(f"{base_path}.meta")
+
+        self._forward = _map_file(f"{base_path}.forward")
+        self._inverted = _map_file(f"{base_path}.inverted")
+        self._inverted_view = memoryview(self._inverted)
+        self.compressed = bool(self.metadata.flags & FLAG_COMPRESSED)
+        self.bitmaps = bool(self.metadata.flags & FLAG_BITMAPS)
+
+        if self.metadata.flags & FLAG_DOC_TABLE:
+            self._doc_offsets = self._map_doc_table()
+        else:
+            self._doc_offsets = self._scan_forward()
+        if self.metadata.flags & FLAG_TERM_TABLE:
+            self._term_offsets = self._map_term_table()
+        else:
+            self._term_offsets = self._scan_inverted()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Закрыть файлы; полученные ранее memoryview должны быть освобождены"""
+        if isinstance(self._doc_offsets, memoryview):
+            self._doc_offsets.release()
+        if isinstance(self._term_offsets, memoryview):
+            self._term_offsets.release()
+        self._inverted_view.release()
+        self._forward.close()
+        self._inverted.close()
+
+    @property
+    def total_documents(self):
+        return self.metadata.total_documents
+
+    @property
+    def total_terms(self):
+        return len(self._term_offsets)
+
+    def _map_doc_table(self):
+        # Таблица offsets[0..max_doc_id] сразу после заголовка .forward
+        max_doc_id = _U32.unpack_from(self._forward, 4)[0]
+        return memoryview(self._forward)[8:8 + (max_doc_id + 1) * 4].cast('I')
+
+    def _scan_forward(self):
+        # Индекс без таблицы смещений: один проход по записям, doc_id -> смещение
+        data = self._forward
+        num_docs = _U32.unpack_from(data, 0)[0]
+        offsets = {}
+        pos = 8
+
+        for _ in range(num_docs):
+            doc_id = _U32.unpack_from(data, pos)[0]
+            offsets[doc_id] = pos
+
+            url_length = _U16.unpack_from(data, pos + 4)[0]
+            title_pos = pos + 6 + url_length
+            title_length = _U16.unpack_from(data, title_pos)[0]
+            pos = title_pos + 2 + title_length + _DOC_TAIL.size
+
+        return offsets
+
+    def _map_term_table(self):
+        # Таблица u64 смещений записей термов в конце .inverted: открытие
+        # индекса не зависит от размера словаря
+        num_terms = _U32.unpack_from(self._inverted, 0)[0]
+        start = len(self._inverted) - num_terms * 8
+        return self._inverted_view[start:].cast('Q')
+
+    def _scan_inverted(self):
+        # Индекс без таблицы термов - один проход по словарю. Запоминаем только
+        # смещения записей термов, сами строки читаются из mmap при бинарном поиске
+        data = self._inverted
+        num_terms = _U32.unpack_from(data, 0)[0]
+        offsets = [0] * num_terms
+        pos = 8
+
+        for i in range(num_terms):
+            offsets[i] = pos
+            term_length = _U16.unpack_from(data, pos)[0]
+            df = _U32.unpack_from(data, pos + 2 + term_length)[0]
+            pos += 2 + term_length + 4
+
+            encoding = POSTING_LIST
+            if self.bitmaps:
+                encoding = data[pos]
+                pos += 1
+
+            if encoding == POSTING_BITMAP:
+                payload_size = _U32.unpack_from(data, pos)[0]
+                pos += 4 + payload_size
+            elif self.compressed:
+                payload_size, pos = read_varint(data, pos)
+                pos += payload_size
+            else:
+                pos += df * 4
+
+        return offsets
+
+    def _postings_record(self, index):
+        # (df, представление, начало данных постингов)
+        pos = self._term_offsets[index]
+        term_length = _U16.unpack_from(self._inverted, pos)[0]
+        pos += 2 + term_length
+        df = _U32.unpack_from(self._inverted, pos)[0]
+        pos += 4
+
+        encoding = POSTING_LIST
+        if self.bitmaps:
+            encoding = self._inverted[pos]
+            pos += 1
+
+        return df, encoding, pos
+
+    def is_bitmap(self, index):
+        """Хранится ли постинг-лист терма битовой картой"""
+        return self._postings_record(index)[1] == POSTING_BITMAP
+
+    def bitmap_payload(self, index):
+        """Контейнеры битовой карты терма (bytes) или None для списка"""
+        df, encoding, start = self._postings_record(index)
+        if encoding != POSTING_BITMAP:
+            return None
+
+        payload_size = _U32.unpack_from(self._inverted, start)[0]
+        return self._inverted[start + 4:start + 4 + payload_size]
+
+    def _term_at(self, index):
+        pos = self._term_offsets[index]
+        term_length = _U16.unpack_from(self._inverted, pos)[0]
+        return self._inverted[pos + 2:pos + 2 + term_length]
+
+    def find_term(self, term):
+        """Номер терма в словаре или None (бинарный поиск, как strcmp в C++)"""
+        if isinstance(term, str):
+            term = term.encode('utf-8')
+
+        left = 0
+        right = len(self._term_offsets) - 1
+
+        while left <= right:
+            mid = (left + right) // 2
+            current = self._term_at(mid)
+
+            if term == current:
+                return mid
+            elif term < current:
+                right = mid - 1
+            else:
+                left = mid + 1
+
+        return None
+
+    def term(self, index):
+        return self._term_at(index).decode('utf-8', errors='replace')
+
+    def document_frequency(self, term):
+        index = self.find_term(term)
+        if index is None:
+            return 0
+
+        pos = self._term_offsets[index]
+        term_length = _U16.unpack_from(self._inverted, pos)[0]
+        return _U32.unpack_from(self._inverted, pos + 2 + term_length)[0]
+
+    def postings_at(self, index):
+        """Постинг-лист терма по номеру: memoryview('I') без копирования
+        (для сжатых списков и битовых карт - поверх только что
+        декодированного массива)"""
+        df, encoding, start = self._postings_record(index)
+
+        if encoding == POSTING_BITMAP:
+            payload_size = _U32.unpack_from(self._inverted, start)[0]
+            payload = self._inverted[start + 4:start + 4 + payload_size]
+            return memoryview(decode_bitmap(payload, df))
+
+        if self.compressed:
+            payload_size, start = read_varint(self._inverted, start)
+            payload = self._inverted[start:start + payload_size]
+            return memoryview(decode_postings(payload, df))
+
+        return self._inverted_view[start:start + df * 4].cast('I')
+
+    def postings(self, term):
+        """Постинг-лист терма (пустой, если терм не найден)"""
+        index = self.find_term(term)
+        if index is None:
+            return EMPTY_POSTINGS
+        return self.postings_at(index)
+
+    def iter_terms(self):
+        for index in range(len(self._term_offsets)):
+            yield self.term(index), self.postings_at(index)
+
+    def _doc_offset(self, doc_id):
+        if isinstance(self._doc_offsets, dict):
+            return self._doc_offsets.get(doc_id)
+        if doc_id >= len(self._doc_offsets):
+            return None
+        return self._doc_offsets[doc_id] or None
+
+    def document_ids(self):
+        """Отсортированные doc_id документов, которые есть в .forward
+
+        После слияния (build_index --merge) и при разреженных doc_id реестра
+        номера идут с пропусками, поэтому это не 1..total_documents.
+        """
+        if isinstance(self._doc_offsets, dict):
+            return array('I', sorted(self._doc_offsets))
+        table = self._doc_offsets
+        return array('I', itertools.compress(range(len(table)), table))
+
+    def _read_document(self, pos):
+        # (Document, смещение следующей записи)
+        data = self._forward
+        doc_id = _U32.unpack_from(data, pos)[0]
+        url_length = _U16.unpack_from(data, pos + 4)[0]
+        url = data[pos + 6:pos + 6 + url_length]
+
+        title_pos = pos + 6 + url_length
+        title_length = _U16.unpack_from(data, title_pos)[0]
+        title = data[title_pos + 2:title_pos + 2 + title_length]
+
+        tail_pos = title_pos + 2 + title_length
+        content_length, token_count, unique_terms = _DOC_TAIL.unpack_from(data, tail_pos)
+
+        return Document(
+            doc_id,
+            url.decode('utf-8', errors='replace'),
+            title.decode('utf-8', errors='replace'),
+            content_length,
+            token_count,
+            unique_terms
+        ), tail_pos + _DOC_TAIL.size
+
+    def get_document(self, doc_id):
+        pos = self._doc_offset(doc_id)
+        if pos is None:
+            return None
+        return self._read_document(pos)[0]
+
+    def iter_documents(self):
+        """Документы в порядке записи в .forward"""
+        num_docs, max_doc_id = struct.unpack_from('<II', self._forward, 0)
+        pos = 8
+        if self.metadata.flags & FLAG_DOC_TABLE:
+            pos += (max_doc_id + 1) * 4
+
+        for _ in range(num_docs):
+            doc, pos = self._read_document(pos)
+            yield doc
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Использование: python3 index_reader.py <index_base> <терм> [терм ...]")
+        sys.exit(1)
+
+    with IndexReader(sys.argv[1]) as reader:
+        print(f"Документов: {reader.total_documents}, Термов: {reader.total_terms}")
+
+        for term in sys.argv[2:]:
+            postings = reader.postings(term.lower())
+            print(f"{term}: {len(postings)} документов")
+
+            for doc_id in postings[:10]:
+                doc = reader.get_document(doc_id)
+                if doc:
+                    print(f"  {doc_id:6d}. {doc.title}")
+            postings.release()
+
+
+if __name__ == '__main__':
+    main()
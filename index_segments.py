@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Манифест сегментов индекса (инкрементальная индексация)
+
+<index>.segments перечисляет сегменты от старых к новым строками
+"<base> <имя>": имя - базовое имя файлов сегмента относительно каталога
+индекса, глобальный doc_id = base + локальный doc_id сегмента. Первый
+сегмент - основной индекс (base 0), дальше - дельта-сегменты с новыми и
+измененными документами и результаты их слияния. Сегменты читает
+SegmentSet (searcher.h) и InProcessSearcher (query_eval.py).
+
+Строка "# watermark <unix time>" - время, до которого изменения из MongoDB
+уже попали в сегменты. Без манифеста индекс - один сегмент.
+
+Удаленные документы сегмента и старые версии замененных отмечаются в
+<сегмент>.deleted: [u32 max_doc_id][u64 words[max_doc_id / 64 + 1]], бит
+локального doc_id (read_deleted_docs в indexer.h). Слияние сегментов
+отбрасывает такие документы. Отметки ставятся по глобальным doc_id из
+реестра (doc_registry.py): сегмент находится по base, бит - прямо в карте,
+без просмотра документов сегмента.
+"""
+
+import bisect
+import os
+import struct
+from array import array
+from collections import namedtuple
+
+from index_reader import IndexReader
+
+SEGMENTS_SUFFIX = '.segments'
+DELETED_SUFFIX = '.deleted'
+
+SegmentEntry = namedtuple('SegmentEntry', ['base', 'name'])
+
+
+def manifest_path(index_path):
+    return f"{index_path}{SEGMENTS_SUFFIX}"
+
+
+def segment_path(index_path, name):
+    """Базовый путь файлов сегмента по имени из манифеста"""
+    return os.path.join(os.path.dirname(index_path), name)
+
+
+def read_manifest(index_path):
+    """(список SegmentEntry, watermark) или (None, None), если манифеста нет"""
+    try:
+        with open(manifest_path(index_path), 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None, None
+
+    entries = []
+    watermark = None
+
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[:2] == ['#', 'watermark']:
+            watermark = int(parts[2])
+        elif len(parts) == 2 and not line.startswith('#'):
+            entries.append(SegmentEntry(int(parts[0]), parts[1]))
+
+    return entries, watermark
+
+
+def write_manifest(index_path, entries, watermark=None):
+    """Атомарно заменить манифест: читатели видят старый или новый набор"""
+    path = manifest_path(index_path)
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("# base name\n")
+        if watermark is not None:
+            f.write(f"# watermark {watermark}\n")
+        for entry in entries:
+            f.write(f"{entry.base} {entry.name}\n")
+
+    os.replace(tmp_path, path)
+
+
+def load_segments(index_path):
+    """Список (base, путь) сегментов для поиска; (0, index_path) без манифеста"""
+    entries, _ = read_manifest(index_path)
+    if entries is None:
+        return [(0, index_path)]
+
+    if not entries:
+        raise ValueError(f"В манифесте нет сегментов: {manifest_path(index_path)}")
+
+    segments = [(entry.base, segment_path(index_path, entry.name)) for entry in entries]
+    check_segments(segments)
+    return segments
+
+
+def check_segments(segments):
+    """ValueError, если диапазоны doc_id сегментов ((base, путь)) пересекаются -
+    например, основной индекс перестроен мимо update_index.py rebuild"""
+    for (base, path), (next_base, next_path) in zip(segments, segments[1:]):
+        end = base + max_doc_id(path)
+        if end > next_base:
+            raise ValueError(f"Сегмент {path} (doc_id до {end}) пересекается с {next_path} "
+                             f"(base {next_base}): перестройте индекс через update_index.py rebuild")
+
+
+def read_deleted(path):
+    """Отсортированные локальные doc_id, удаленные из сегмента path"""
+    try:
+        with open(f"{path}{DELETED_SUFFIX}", 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return array('I')
+
+    max_doc_id = struct.unpack_from('<I', data, 0)[0]
+    words = (max_doc_id >> 6) + 1
+    bits = data[4:4 + words * 8]
+    if len(bits) != words * 8:
+        raise ValueError(f"Поврежден файл удаленных документов: {path}{DELETED_SUFFIX}")
+
+    doc_ids = array('I')
+    for i, byte in enumerate(bits):
+        if byte:
+            doc_ids.extend(i * 8 + bit for bit in range(8) if byte >> bit & 1)
+    return doc_ids
+
+
+def max_doc_id(path):
+    """Максимальный локальный doc_id сегмента (заголовок .forward)"""
+    with open(f"{path}.forward", 'rb') as f:
+        return struct.unpack('<II', f.read(8))[1]
+
+
+def write_deleted(path, doc_ids):
+    """Атомарно записать <path>.deleted с битами doc_ids"""
+    max_doc_id = max(doc_ids, default=0)
+    bits = bytearray(((max_doc_id >> 6) + 1) * 8)
+    for doc_id in doc_ids:
+        bits[doc_id >> 3] |= 1 << (doc_id & 7)
+    _write_bits(path, max_doc_id, bits)
+
+
+def mark_deleted(path, doc_ids):
+    """Добавить биты локальных doc_ids в <path>.deleted; число новых отметок"""
+    try:
+        with open(f"{path}{DELETED_SUFFIX}", 'rb') as f:
+            data = f.read()
+        max_doc_id = struct.unpack_from('<I', data, 0)[0]
+        bits = bytearray(data[4:])
+    except FileNotFoundError:
+        max_doc_id = 0
+        bits = bytearray(8)
+
+    marked = 0
+    for doc_id in doc_ids:
+        if doc_id > max_doc_id:
+            max_doc_id = doc_id
+            bits.extend(bytes(((max_doc_id >> 6) + 1) * 8 - len(bits)))
+
+        mask = 1 << (doc_id & 7)
+        if not bits[doc_id >> 3] & mask:
+            bits[doc_id >> 3] |= mask
+            marked += 1
+
+    if marked:
+        _write_bits(path, max_doc_id, bits)
+    return marked
+
+
+def _write_bits(path, max_doc_id, bits):
+    tmp_path = f"{path}{DELETED_SUFFIX}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<I', max_doc_id))
+        f.write(bits)
+    os.replace(tmp_path, f"{path}{DELETED_SUFFIX}")
+
+
+def delete_documents(segments, doc_ids):
+    """Отметить удаленными глобальные doc_ids в сегментах ((base, путь) по
+    возрастанию base, как load_segments); число новых отметок. doc_id вне
+    диапазонов сегментов (еще не проиндексированные) пропускаются."""
+    bases = [base for base, _ in segments]
+    by_segment = {}
+
+    for doc_id in doc_ids:
+        # Сегмент с наибольшим base < doc_id
+        i = bisect.bisect_left(bases, doc_id) - 1
+        if i >= 0:
+            by_segment.setdefault(i, []).append(doc_id - bases[i])
+
+    marked = 0
+    for i, local_ids in by_segment.items():
+        path = segments[i][1]
+        limit = max_doc_id(path)
+        marked += mark_deleted(path, [doc_id for doc_id in local_ids if doc_id <= limit])
+
+    return marked
+
+
+def find_urls(segments, urls):
+    """Глобальные doc_id документов с URL из urls - проходом по всем
+    документам сегментов; для обновлений без реестра (update_index.py
+    add --tsv)"""
+    urls = set(urls)
+    found = []
+
+    for base, path in segments:
+        with IndexReader(path) as reader:
+            found.extend(base + doc.doc_id for doc in reader.iter_documents() if doc.url in urls)
+
+    return found
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш результатов поиска для веб-интерфейса
+
+Ограниченный LRU-кэш с временем жизни записей. Ключ - нормализованный
+запрос. Поколение индекса определяется полем timestamp в IndexMetadata,
+inode файла .meta (build_index заменяет файлы индекса через rename, так
+что перестроение в ту же секунду тоже видно) и временем изменения
+манифеста сегментов: после перестроения индекса,
+добавления или слияния сегментов кэш сбрасывается автоматически.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from index_reader import read_metadata
+from index_segments import manifest_path
+
+
+def normalize_query(query):
+    """Ключ кэша: пробелы схлопнуты, ASCII в нижнем регистре (как в BooleanQueryParser)"""
+    # bytes.split()/lower() работают только с ASCII - как isspace/tolower в C++
+    words = query.encode('utf-8').lower().split()
+    return b' '.join(words).decode('utf-8')
+
+
+class QueryCache:
+    """LRU/TTL кэш результатов с привязкой к поколению индекса"""
+
+    def __init__(self, index_path, max_entries=1000, ttl=300, check_interval=1.0):
+        self.meta_path = f"{index_path}.meta"
+        self.segments_path = manifest_path(index_path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._meta_stat = None
+        self._meta_timestamp = None
+        self.generation = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _read_generation(self):
+        try:
+            stat = os.stat(self.meta_path)
+            meta_stat = (stat.st_ino, stat.st_mtime_ns)
+            if meta_stat != self._meta_stat:
+                self._meta_timestamp = read_metadata(self.meta_path).timestamp
+                self._meta_stat = meta_stat
+        except (OSError, ValueError):
+            # Индекс перестраивается прямо сейчас - оставляем текущее поколение
+            return self.generation
+
+        try:
+            segments_mtime = os.stat(self.segments_path).st_mtime_ns
+        except OSError:
+            segments_mtime = None
+
+        return (self._meta_timestamp, self._meta_stat[0], segments_mtime)
+
+    def refresh(self):
+        """Проверить поколение индекса; True, если индекс перестроен и кэш сброшен"""
+        now = time.time()
+
+        with self._lock:
+            if now - self._last_check < self.check_interval:
+                return False
+            self._last_check = now
+
+            generation = self._read_generation()
+            if generation == self.generation:
+                return False
+
+            changed = self.generation is not None
+            self.generation = generation
+            if changed:
+                self._entries.clear()
+                self.invalidations += 1
+            return changed
+
+    def get(self, key):
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value, generation=None):
+        """Сохранить результат; устаревшее поколение (индекс сменился во время поиска) не кэшируется"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'generation': self.generation
+            }
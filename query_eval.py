@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Булев поиск в процессе Python поверх index_reader
+
+Грамматика и разбор повторяют BooleanQueryParser и QueryEvaluator из
+searcher.h/search.cpp: неявное И, &&, ||, ! и скобки. Операции над
+постинг-листами выполняются векторно над отсортированными массивами
+uint32 (NumPy), без поэлементных циклов в Python.
+"""
+
+import struct
+import sys
+import time
+
+import numpy as np
+
+from index_reader import (
+    BITMAP_CHUNK_BYTES, BITMAP_CONTAINER_ARRAY, IndexReader
+)
+from index_segments import load_segments, read_deleted
+
+TOKEN_WORD = 'WORD'
+TOKEN_AND = 'AND'
+TOKEN_OR = 'OR'
+TOKEN_NOT = 'NOT'
+TOKEN_LPAREN = 'LPAREN'
+TOKEN_RPAREN = 'RPAREN'
+TOKEN_END = 'END'
+
+EMPTY = np.empty(0, dtype=np.uint32)
+
+MAX_WORD_BYTES = 255
+
+
+def _is_word_byte(c):
+    # isalnum() в локали "C", дефис, апостроф и все байты UTF-8 >= 128
+    return (48 <= c <= 57 or 65 <= c <= 90 or 97 <= c <= 122 or
+            c == 0x2D or c == 0x27 or c >= 128)
+
+
+def tokenize_query(query):
+    """Список токенов (тип, слово) так же, как BooleanQueryParser::next_token"""
+    if isinstance(query, str):
+        query = query.encode('utf-8')
+
+    tokens = []
+    pos = 0
+    n = len(query)
+
+    while True:
+        while pos < n and query[pos] in b' \t\n\v\f\r':
+            pos += 1
+
+        if pos >= n:
+            tokens.append((TOKEN_END, None))
+            return tokens
+
+        c = query[pos]
+
+        if c == 0x28:
+            tokens.append((TOKEN_LPAREN, None))
+            pos += 1
+        elif c == 0x29:
+            tokens.append((TOKEN_RPAREN, None))
+            pos += 1
+        elif c == 0x21:
+            tokens.append((TOKEN_NOT, None))
+            pos += 1
+        elif query[pos:pos + 2] == b'||':
+            tokens.append((TOKEN_OR, None))
+            pos += 2
+        elif query[pos:pos + 2] == b'&&':
+            tokens.append((TOKEN_AND, None))
+            pos += 2
+        else:
+            start = pos
+            while pos < n and _is_word_byte(query[pos]):
+                pos += 1
+
+            if pos == start:
+                pos += 1
+                continue
+
+            # Слово обрезается до 255 байт, в нижний регистр - только ASCII
+            word = query[start:pos][:MAX_WORD_BYTES].lower()
+            tokens.append((TOKEN_WORD, word))
+
+
+_CONTAINER = struct.Struct('<HHI')
+
+
+def bitmap_to_array(payload):
+    """Контейнеры битовой карты (FLAG_BITMAPS) -> отсортированный массив doc_id"""
+    num_containers = struct.unpack_from('<I', payload, 0)[0]
+    pos = 4
+    parts = []
+
+    for _ in range(num_containers):
+        chunk, kind, cardinality = _CONTAINER.unpack_from(payload, pos)
+        pos += _CONTAINER.size
+        base = np.uint32(chunk << 16)
+
+        if kind == BITMAP_CONTAINER_ARRAY:
+            lows = np.frombuffer(payload, dtype='<u2', count=cardinality, offset=pos)
+            pos += cardinality * 2
+        else:
+            words = np.frombuffer(payload, dtype=np.uint8, count=BITMAP_CHUNK_BYTES, offset=pos)
+            lows = np.flatnonzero(np.unpackbits(words, bitorder='little'))
+            pos += BITMAP_CHUNK_BYTES
+
+        parts.append(lows.astype(np.uint32) + base)
+
+    if not parts:
+        return EMPTY
+    return np.concatenate(parts)
+
+
+def intersect(a, b):
+    """Пересечение отсортированных массивов: бинарный поиск короткого в длинном"""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return EMPTY
+
+    idx = np.searchsorted(b, a)
+    idx[idx == len(b)] = 0
+    return a[b[idx] == a]
+
+
+def union(a, b):
+    if len(a) == 0:
+        return b
+    if len(b) == 0:
+        return a
+    return np.union1d(a, b).astype(np.uint32, copy=False)
+
+
+def difference(a, b):
+    """Элементы a, которых нет в b"""
+    if len(a) == 0 or len(b) == 0:
+        return a
+
+    idx = np.searchsorted(b, a)
+    idx[idx == len(b)] = 0
+    return a[b[idx] != a]
+
+
+def and_pair(a, b):
+    """A && B над парами (массив, дополнение) как PostingList в searcher.h:
+    дополнение хранится как список исключенных doc_id, без построения"""
+    (left, left_not), (right, right_not) = a, b
+    if left_not and right_not:
+        return union(left, right), True
+    if left_not:
+        return difference(right, left), False
+    if right_not:
+        return difference(left, right), False
+    return intersect(left, right), False
+
+
+def or_pair(a, b):
+    """A || B над парами (массив, дополнение): !X || Y = !(X без Y)"""
+    (left, left_not), (right, right_not) = a, b
+    if left_not and right_not:
+        return intersect(left, right), True
+    if left_not:
+        return difference(left, right), True
+    if right_not:
+        return difference(right, left), True
+    return union(left, right), False
+
+
+class QueryEvaluator:
+    """Рекурсивный спуск по токенам запроса с вычислением над массивами
+
+    Разбор возвращает пары (массив doc_id, дополнение): отрицание только
+    переворачивает флаг, а полный список документов строится один раз в
+    evaluate, если дополнение осталось на верхнем уровне.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self._all_docs = None
+
+    def postings(self, word):
+        index = self.reader.find_term(word)
+        if index is None:
+            return EMPTY
+
+        # Битовая карта раскладывается векторно, без цикла index_reader
+        payload = self.reader.bitmap_payload(index) if self.reader.bitmaps else None
+        if payload is not None:
+            return bitmap_to_array(payload)
+
+        view = self.reader.postings_at(index)
+        if len(view) == 0:
+            return EMPTY
+        return np.frombuffer(view, dtype=np.uint32)
+
+    def all_documents(self):
+        # Отрицание, как в C++, строится по doc_id, которые есть в индексе
+        if self._all_docs is None:
+            self._all_docs = np.frombuffer(self.reader.document_ids(), dtype=np.uint32)
+        return self._all_docs
+
+    def evaluate_pair(self, query):
+        """(массив doc_id, дополнение): при дополнении результат - все
+        документы, кроме массива"""
+        self._tokens = tokenize_query(query)
+        self._pos = 0
+        return self._parse_expression()
+
+    def evaluate(self, query, exclude=EMPTY):
+        """Отсортированный массив doc_id результата без doc_id из exclude"""
+        doc_ids, complemented = self.evaluate_pair(query)
+        if complemented:
+            return difference(self.all_documents(), union(doc_ids, exclude))
+        return difference(doc_ids, exclude)
+
+    @property
+    def _current(self):
+        return self._tokens[self._pos][0]
+
+    def _advance(self):
+        if self._pos < len(self._tokens) - 1:
+            self._pos += 1
+
+    def _parse_expression(self):
+        left = self._parse_term()
+
+        while self._current == TOKEN_OR:
+            self._advance()
+            left = or_pair(left, self._parse_term())
+
+        return left
+
+    def _parse_term(self):
+        left = self._parse_factor()
+
+        while self._current in (TOKEN_AND, TOKEN_WORD):
+            if self._current == TOKEN_AND:
+                self._advance()
+
+            # A && !B - разность A и B, без построения дополнения B
+            left = and_pair(left, self._parse_factor())
+
+        return left
+
+    def _parse_factor(self):
+        token, word = self._tokens[self._pos]
+
+        if token == TOKEN_NOT:
+            self._advance()
+            doc_ids, complemented = self._parse_factor()
+            return doc_ids, not complemented
+
+        if token == TOKEN_LPAREN:
+            self._advance()
+            result = self._parse_expression()
+            if self._current == TOKEN_RPAREN:
+                self._advance()
+            return result
+
+        if token == TOKEN_WORD:
+            self._advance()
+            return self.postings(word), False
+
+        return EMPTY, False
+
+
+class InProcessSearcher:
+    """Поиск для веб-интерфейса без внешних процессов
+
+    Запрос выполняется в каждом сегменте индекса (index_segments.py),
+    результаты сегментов идут подряд в глобальных doc_id; удаленные
+    документы (<сегмент>.deleted) отбрасываются.
+    """
+
+    def __init__(self, index_path):
+        segments = load_segments(index_path)
+        self.bases = [base for base, _ in segments]
+        self.readers = [IndexReader(path) for _, path in segments]
+        self.hidden = [np.array(read_deleted(path), dtype=np.uint32) for _, path in segments]
+
+    @property
+    def reader(self):
+        """Основной индекс (первый сегмент)"""
+        return self.readers[0]
+
+    @property
+    def total_documents(self):
+        return sum(reader.total_documents - len(hidden)
+                   for reader, hidden in zip(self.readers, self.hidden))
+
+    def get_document(self, doc_id):
+        """Документ по глобальному doc_id"""
+        for base, reader in zip(reversed(self.bases), reversed(self.readers)):
+            if doc_id > base:
+                return reader.get_document(doc_id - base)
+        return None
+
+    def evaluate(self, query):
+        """Отсортированный массив глобальных doc_id результата"""
+        parts = []
+        for base, reader, hidden in zip(self.bases, self.readers, self.hidden):
+            doc_ids = QueryEvaluator(reader).evaluate(query, hidden)
+            parts.append(doc_ids + np.uint32(base) if base else doc_ids)
+
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def search(self, query, offset=0, limit=50, timeout=None):
+        """Всего найдено и результаты из окна [offset, offset + limit)"""
+        start = time.time()
+        doc_ids = self.evaluate(query)
+        engine_time = (time.time() - start) * 1000
+
+        results = []
+        for doc_id in doc_ids[offset:offset + limit]:
+            doc = self.get_document(int(doc_id))
+            if doc:
+                results.append({
+                    'doc_id': int(doc_id),
+                    'title': doc.title[:200],
+                    'url': doc.url
+                })
+
+        return {
+            'total': len(doc_ids),
+            'engine_time_ms': engine_time,
+            'results': results
+        }
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Использование: python3 query_eval.py <index_base> <запрос>")
+        sys.exit(1)
+
+    searcher = InProcessSearcher(sys.argv[1])
+    result = searcher.search(sys.argv[2])
+
+    print(f"Найдено документов: {result['total']} ({result['engine_time_ms']:.3f} мс)\n")
+    for i, item in enumerate(result['results'], 1):
+        print(f"{i:3d}. {item['title']}")
+        print(f"     {item['url']}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,34 +3,8 @@
 import json
 import os
 import re
-from html.parser import HTMLParser
 
-class HTMLTextExtractor(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.text_parts = []
-        self.skip_tags = {'script', 'style', 'head'}
-        self.current_tag = None
-    
-    def handle_starttag(self, tag, attrs):
-        self.current_tag = tag
-    
-    def handle_endtag(self, tag):
-        self.current_tag = None
-    
-    def handle_data(self, data):
-        if self.current_tag not in self.skip_tags:
-            text = data.strip()
-            if text:
-                self.text_parts.append(text)
-    
-    def get_text(self):
-        return ' '.join(self.text_parts)
-
-def extract_text_from_html(html_content):
-    parser = HTMLTextExtractor()
-    parser.feed(html_content)
-    return parser.get_text()
+from html_text import html_to_text
 
 def count_words(text):
     words = re.findall(r'\w+', text)
@@ -59,7 +33,7 @@ def analyze_directory(directory):
             data = json.load(f)
         
         content = data.get('content', '')
-        text = extract_text_from_html(content)
+        text = html_to_text(content)
         
         text_size = len(text.encode('utf-8'))
         word_count = count_words(text)
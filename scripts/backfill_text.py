@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Дозаполнение clean_text, title, word_count и text_hash у документов MongoDB
+
+Роботы сохраняют эти поля при обкачке (html_text.text_fields). Документам,
+скачанным раньше, и документам с другой TEXT_VERSION (после изменения
+очистки) поля пересчитываются из html_content (или wikitext) в пуле
+процессов. crawl_date не меняется: содержимое страницы то же, дельта-выгрузка
+их не подхватит.
+
+Использование: python3 backfill_text.py [--jobs N] [--limit N]
+"""
+
+import argparse
+import os
+from multiprocessing import Pool
+from pymongo import MongoClient, UpdateOne
+
+from html_text import TEXT_VERSION, document_text_fields
+from wiki_api import batches
+
+CURSOR_BATCH = 200      # документов с HTML за один запрос к MongoDB
+CLEAN_BATCH = 32        # документов в одном задании пула
+
+
+def fields_batch(batch):
+    """(_id, поля) для пачки документов - в процессе пула"""
+    return [(doc['_id'], document_text_fields(doc)) for doc in batch]
+
+
+def backfill(collection, jobs=None, limit=None):
+    """Пересчитать поля текста; число обновленных документов"""
+    stale = {'text_version': {'$ne': TEXT_VERSION}}
+    total = collection.count_documents(stale)
+    if limit:
+        total = min(total, limit)
+    print(f"Документов без текста текущей версии: {total}")
+
+    query = collection.find(
+        stale, {'url': 1, 'html_content': 1, 'wikitext': 1, 'content_format': 1}
+    ).batch_size(CURSOR_BATCH)
+    if limit:
+        query = query.limit(limit)
+
+    updated = 0
+    with Pool(jobs or os.cpu_count() or 1) as pool:
+        # Порядок не важен: каждая пачка записывается, как только готова
+        for result in pool.imap_unordered(fields_batch, batches(query, CLEAN_BATCH)):
+            collection.bulk_write(
+                [UpdateOne({'_id': doc_id}, {'$set': fields}) for doc_id, fields in result],
+                ordered=False
+            )
+            previous = updated
+            updated += len(result)
+            if updated // 1000 > previous // 1000:
+                print(f"  Обновлено: {updated}/{total}")
+
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--jobs', type=int, default=None, help='процессов очистки')
+    parser.add_argument('--limit', type=int, default=None, help='не больше N документов')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=27017)
+    args = parser.parse_args()
+
+    client = MongoClient(args.host, args.port)
+    collection = client['turkish_wiki_search']['documents']
+    try:
+        updated = backfill(collection, args.jobs, args.limit)
+        print(f"\nОбновлено документов: {updated}")
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение индекса без сжатия и со сжатыми постинг-листами (--compress)
+
+Строит оба индекса из одного TSV во временном каталоге и сравнивает
+размер .inverted, время загрузки ./search, скорость пакетного поиска
+по tests/search_queries.txt и скорость чтения постингов в index_reader.
+
+Запуск из корня проекта: python3 scripts/benchmark_compression.py indexer_input.tsv
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_reader import IndexReader
+
+QUERIES_FILE = 'tests/search_queries.txt'
+ROUNDS = 20
+
+
+def load_queries(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f
+                if line.strip() and not line.startswith('#')]
+
+
+def build(input_file, index_path, compress):
+    cmd = ['./build_index', input_file, index_path, '--stemming']
+    if compress:
+        cmd.append('--compress')
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+
+def run_search(index_path, queries):
+    """Время загрузки индекса (мс) и время пакета запросов (с)"""
+    batch = '\n'.join(queries * ROUNDS) + '\n'
+
+    start = time.time()
+    result = subprocess.run(
+        ['./search', index_path, '--json', '--limit', '10'],
+        input=batch,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    total_time = time.time() - start
+
+    lines = result.stdout.splitlines()
+    ready = json.loads(lines[0])
+    engine_ms = sum(json.loads(line)['time_ms'] for line in lines[1:])
+
+    return ready['load_time_ms'], total_time, engine_ms
+
+
+def read_all_postings(index_path):
+    """Время чтения всех постинг-листов через index_reader (с)"""
+    with IndexReader(index_path) as reader:
+        start = time.time()
+        count = 0
+        for index in range(reader.total_terms):
+            postings = reader.postings_at(index)
+            count += len(postings)
+            postings.release()
+        return time.time() - start, count
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Использование: python3 scripts/benchmark_compression.py <input.tsv>")
+        sys.exit(1)
+
+    input_file = sys.argv[1]
+    queries = load_queries(QUERIES_FILE)
+
+    print("=" * 70)
+    print("СЖАТИЕ ПОСТИНГ-ЛИСТОВ")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = []
+
+        for name, compress in (('без сжатия', False), ('--compress', True)):
+            index_path = os.path.join(tmp, 'index_compressed' if compress else 'index_raw')
+            build(input_file, index_path, compress)
+
+            size = os.path.getsize(f"{index_path}.inverted")
+            load_ms, batch_time, engine_ms = run_search(index_path, queries)
+            read_time, postings = read_all_postings(index_path)
+            rows.append((name, size, load_ms, batch_time, engine_ms, read_time, postings))
+
+        total_queries = len(queries) * ROUNDS
+        print(f"\nЗапросов в пакете: {total_queries}\n")
+        print(f"{'Индекс':<12} {'.inverted':>12} {'Загрузка':>10} {'Пакет':>9} "
+              f"{'Поиск':>9} {'Запр/с':>9} {'Чтение Py':>10}")
+
+        for name, size, load_ms, batch_time, engine_ms, read_time, postings in rows:
+            print(f"{name:<12} {size:>12,} {load_ms:>8.1f}мс {batch_time:>8.3f}с "
+                  f"{engine_ms:>7.1f}мс {total_queries / batch_time:>9.0f} "
+                  f"{read_time:>9.3f}с")
+
+        raw_size, compressed_size = rows[0][1], rows[1][1]
+        print(f"\nПостингов: {rows[0][6]:,}")
+        print(f"Сжатие .inverted: {raw_size / compressed_size:.2f}x "
+              f"({compressed_size / rows[0][6]:.2f} байт на doc_id)")
+
+
+if __name__ == '__main__':
+    main()
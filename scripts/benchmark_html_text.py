@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение очистки HTML: однопроходный html_text.py и прежняя strip_html
+
+Прежняя очистка - четыре прохода re.sub по документу, текст служебных
+блоков (источники, навигационные шаблоны, ссылки [değiştir]) остается, а
+сущности просто вырезаются. Скрипт берет HTML статей из MongoDB (или из
+JSON-файлов с полем content), очищает каждую статью обоими способами и
+сравнивает время и объем текста, который уходит в индекс.
+
+Запуск из корня проекта:
+    python3 scripts/benchmark_html_text.py [--limit 500]
+    python3 scripts/benchmark_html_text.py --json data/source1_regular
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from html_text import html_title, html_to_text
+
+ROUNDS = 3
+
+
+def legacy_strip_html(html_text):
+    text = re.sub(r'<[^>]+>', ' ', html_text)
+    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
+    text = re.sub(r'&#\d+;', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def legacy_title(html_text):
+    match = re.search(r'<h[12]>(.*?)</h[12]>', html_text)
+    if match:
+        return legacy_strip_html(match.group(1))
+
+    text = legacy_strip_html(html_text)
+    if len(text) > 100:
+        return text[:97] + "..."
+    return text if text else "Untitled"
+
+
+def legacy_clean(html_text):
+    return legacy_title(html_text), legacy_strip_html(html_text)
+
+
+def single_pass_clean(html_text):
+    text = html_to_text(html_text)
+    return html_title(html_text, text), text
+
+
+def load_mongo(limit):
+    from pymongo import MongoClient
+
+    client = MongoClient('localhost', 27017, serverSelectionTimeoutMS=5000)
+    collection = client['turkish_wiki_search']['documents']
+    pages = [doc.get('html_content', '')
+             for doc in collection.find({}, {'html_content': 1, '_id': 0}).limit(limit)]
+    client.close()
+    return pages
+
+
+def load_json(directory):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                pages.append(json.load(f).get('content', ''))
+    return pages
+
+
+def measure(clean, pages):
+    """Лучшее из ROUNDS время (с) и суммарный объем текста (байт)"""
+    best = None
+    for _ in range(ROUNDS):
+        start = time.time()
+        texts = [clean(page)[1] for page in pages]
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, sum(len(text.encode('utf-8')) for text in texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение очистки HTML')
+    parser.add_argument('--limit', type=int, default=500, help='статей из MongoDB')
+    parser.add_argument('--json', help='каталог JSON-статей вместо MongoDB')
+    args = parser.parse_args()
+
+    pages = load_json(args.json) if args.json else load_mongo(args.limit)
+    if not pages:
+        print("Нет статей для сравнения")
+        sys.exit(1)
+
+    html_bytes = sum(len(page.encode('utf-8')) for page in pages)
+
+    print("=" * 70)
+    print("ОЧИСТКА HTML")
+    print("=" * 70)
+    print(f"\nСтатей: {len(pages)}, HTML: {html_bytes / 1024 / 1024:.1f} МБ\n")
+    print(f"{'Очистка':<14} {'Время':>9} {'МБ/с':>8} {'Текст':>12}")
+
+    rows = []
+    for name, clean in (('re.sub x4', legacy_clean), ('html_text', single_pass_clean)):
+        elapsed, text_bytes = measure(clean, pages)
+        rows.append((elapsed, text_bytes))
+        print(f"{name:<14} {elapsed:>8.3f}с {html_bytes / 1024 / 1024 / elapsed:>8.1f} "
+              f"{text_bytes:>12,}")
+
+    (old_time, old_text), (new_time, new_text) = rows
+    print(f"\nУскорение: {old_time / new_time:.2f}x")
+    print(f"Текста в индекс: {new_text / old_text * 100:.1f}% от прежнего")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Время выполнения булевых запросов в ./search
+
+Каждый запрос из tests/search_queries.txt выполняется ROUNDS раз в одном
+процессе (--json), берется медиана time_ms. Вторым аргументом можно
+передать другой бинарник ./search (например, собранный из предыдущей
+версии) - тогда выводится сравнение. Его вывод читается как текст (строки
+"Найдено: N документов (T мс)"), поэтому подходит и ./search без --json.
+
+Запуск из корня проекта:
+    python3 scripts/benchmark_search.py index_stemmed [./search_old]
+"""
+
+import json
+import re
+import statistics
+import subprocess
+import sys
+
+QUERIES_FILE = 'tests/search_queries.txt'
+ROUNDS = 50
+
+# Текстовый вывод: пакетный режим и запрос из командной строки
+FOUND_RE = re.compile(r'^Найдено(?: документов)?: (\d+)(?: документов)? \(([\d.]+) мс\)')
+
+
+def load_queries(path):
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and line not in queries:
+                queries.append(line)
+    return queries
+
+
+def measure(search_bin, index_path, queries, text=False):
+    """Запрос -> (всего найдено, медиана time_ms); text - разбирать текстовый
+    вывод вместо --json"""
+    batch = '\n'.join(q for q in queries for _ in range(ROUNDS)) + '\n'
+
+    result = subprocess.run(
+        [search_bin, index_path] + ([] if text else ['--json']),
+        input=batch,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    times = {}
+    totals = {}
+
+    def record(query, total, ms):
+        times.setdefault(query, []).append(ms)
+        totals[query] = total
+
+    if text:
+        query = None
+        for line in result.stdout.splitlines():
+            if line.startswith('Запрос: '):
+                query = line[len('Запрос: '):]
+                continue
+            match = FOUND_RE.match(line)
+            if match and query is not None:
+                record(query, int(match.group(1)), float(match.group(2)))
+                query = None
+    else:
+        # Первая строка - сведения об индексе
+        for line in result.stdout.splitlines()[1:]:
+            response = json.loads(line)
+            record(response['query'], response['total'], response['time_ms'])
+
+    return {q: (totals[q], statistics.median(times[q])) for q in queries}
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Использование: python3 scripts/benchmark_search.py <index_base> [baseline_search]")
+        sys.exit(1)
+
+    index_path = sys.argv[1]
+    baseline_bin = sys.argv[2] if len(sys.argv) > 2 else None
+    queries = load_queries(QUERIES_FILE)
+
+    current = measure('./search', index_path, queries)
+    baseline = measure(baseline_bin, index_path, queries, text=True) if baseline_bin else None
+
+    print("=" * 78)
+    print(f"ВРЕМЯ ЗАПРОСОВ (медиана из {ROUNDS}, мс)")
+    print("=" * 78)
+
+    if baseline:
+        print(f"{'Запрос':<36} {'Найдено':>8} {'Было':>9} {'Стало':>9} {'Ускорение':>10}")
+    else:
+        print(f"{'Запрос':<36} {'Найдено':>8} {'Время':>9}")
+
+    for q in queries:
+        total, ms = current[q]
+
+        if baseline:
+            base_total, base_ms = baseline[q]
+            mark = '' if base_total == total else '  РАСХОЖДЕНИЕ'
+            speedup = f"{base_ms / ms:.1f}x" if ms > 0 else '-'
+            print(f"{q:<36} {total:>8} {base_ms:>9.3f} {ms:>9.3f} {speedup:>10}{mark}")
+        else:
+            print(f"{q:<36} {total:>8} {ms:>9.3f}")
+
+    print(f"\nСумма медиан: {sum(ms for _, ms in current.values()):.3f} мс", end='')
+    if baseline:
+        print(f" (было {sum(ms for _, ms in baseline.values()):.3f} мс)")
+    else:
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,14 @@ import sys
 import yaml
 import time
 import hashlib
-import urllib.request
 import urllib.parse
 import json
-import re
 from datetime import datetime, timedelta
 from pymongo import MongoClient, ASCENDING
+
+from html_text import CONTENT_FIELDS, FORMAT_HTML, FORMAT_WIKITEXT, text_fields
+from http_client import MAX_RESPONSE_BYTES, HttpClient
+from wiki_api import batches, fetch_revisions
 import logging
 import os
 
@@ -30,6 +32,17 @@ class WikipediaCrawler:
             'errors': 0
         }
         
+        # Постоянные соединения с API на поток, ответы в gzip
+        self.http = HttpClient(
+            self.config['wikipedia']['user_agent'],
+            timeout=self.config['logic']['request_timeout'],
+            max_bytes=self.config['logic'].get('max_response_bytes', MAX_RESPONSE_BYTES)
+        )
+        
+        # parse - HTML каждой статьи отдельным запросом, batch - викитекст
+        # пачки статей одним запросом (wiki_api.py)
+        self.fetch_mode = self.config['logic'].get('fetch_mode', 'parse')
+        
         self.logger.info("Робот инициализирован")
     
     def _setup_logging(self):
@@ -86,12 +99,7 @@ class WikipediaCrawler:
         
         for attempt in range(max_retries):
             try:
-                req = urllib.request.Request(url)
-                req.add_header('User-Agent', self.config['wikipedia']['user_agent'])
-                
-                timeout = self.config['logic']['request_timeout']
-                with urllib.request.urlopen(req, timeout=timeout) as response:
-                    return response.read().decode('utf-8')
+                return self.http.get(url)
             except Exception as e:
                 self.logger.warning(f"Попытка {attempt + 1}/{max_retries} не удалась: {e}")
                 if attempt < max_retries - 1:
@@ -197,18 +205,52 @@ class WikipediaCrawler:
             if 'parse' in data and 'text' in data['parse']:
                 return {
                     'html': data['parse']['text']['*'],
-                    'title': data['parse']['displaytitle'],
+                    'title': data['parse'].get('displaytitle') or title,
                     'pageid': data['parse']['pageid']
                 }
+            # Страница удалена из Википедии (в отличие от сетевой ошибки)
+            if data.get('error', {}).get('code') == 'missingtitle':
+                return {'missing': True}
             return None
         except Exception as e:
             self.logger.error(f"Ошибка получения статьи {title}: {e}")
             return None
     
-    def count_words(self, html_content):
-        text = re.sub('<[^<]+?>', '', html_content)
-        words = re.findall(r'\w+', text)
-        return len(words)
+    def fetch_articles(self, titles):
+        """{название: статья} для пачки названий (prop=revisions, викитекст)"""
+        base_url = self.config['wikipedia']['base_url']
+        try:
+            return fetch_revisions(
+                lambda url: json.loads(self.fetch_with_retry(url)), base_url, titles
+            )
+        except Exception as e:
+            self.logger.error(f"Ошибка получения пачки из {len(titles)} статей: {e}")
+            return {}
+    
+    def iter_articles(self, titles):
+        """(название, статья или None) по списку названий: по одному запросу
+        на статью или на пачку статей в зависимости от fetch_mode"""
+        delay = self.config['logic']['delay_between_requests']
+        
+        if self.fetch_mode == 'batch':
+            for batch in batches(titles):
+                articles = self.fetch_articles(batch)
+                time.sleep(delay)
+                for title in batch:
+                    yield title, articles.get(title)
+        else:
+            for title in titles:
+                article = self.fetch_article(title)
+                time.sleep(delay)
+                yield title, article
+    
+    def article_content(self, article):
+        """(текст страницы, его формат) или (None, None), если текста нет"""
+        if article and 'html' in article:
+            return article['html'], FORMAT_HTML
+        if article and 'wikitext' in article:
+            return article['wikitext'], FORMAT_WIKITEXT
+        return None, None
     
     def calculate_hash(self, content):
         return hashlib.md5(content.encode('utf-8')).hexdigest()
@@ -220,15 +262,31 @@ class WikipediaCrawler:
         
         return age_days >= reindex_period
     
-    def save_document(self, url, html_content, source, force_update=False):
+    def save_document(self, url, html_content, source, fields=None, force_update=False,
+                      content_format=FORMAT_HTML, page_title=None, title_html=None):
+        # Очищенный текст (html_text.text_fields) хранится рядом с HTML,
+        # выгрузка для индекса берет его готовым; викитекст пакетного режима
+        # хранится в поле wikitext, content_format - какое из полей свежее
+        # (второе не стирается и остается от прежнего режима).
+        # page_title - название, по которому статья запрошена из API: title
+        # очищен для показа и может с ним не совпадать. Без готовых fields
+        # title берется из title_html (displaytitle) или page_title, а не из
+        # URL: в нем процент-кодировка и подчеркивания
         normalized_url = self.normalize_url(url)
         content_hash = self.calculate_hash(html_content)
         current_timestamp = int(time.time())
+        if fields is None:
+            fields = text_fields(html_content, normalized_url, title_html or page_title,
+                                 content_format=content_format)
+        if page_title:
+            fields = {**fields, 'page_title': page_title}
+        content_field = CONTENT_FIELDS[content_format]
         
         existing = self.collection.find_one({'url': normalized_url})
         
         if existing:
-            if existing.get('content_hash') == content_hash and not force_update:
+            if (existing.get('content_hash') == content_hash and not force_update
+                    and 'delete_date' not in existing):
                 self.logger.debug(f"Документ не изменился: {normalized_url}")
                 self.stats['skipped'] += 1
                 return 'skipped'
@@ -237,11 +295,14 @@ class WikipediaCrawler:
                 {'url': normalized_url},
                 {
                     '$set': {
-                        'html_content': html_content,
+                        content_field: html_content,
+                        'content_format': content_format,
                         'content_hash': content_hash,
                         'crawl_date': current_timestamp,
-                        'update_date': current_timestamp
-                    }
+                        'update_date': current_timestamp,
+                        **fields
+                    },
+                    '$unset': {'delete_date': ''}
                 }
             )
             self.logger.info(f"Обновлен: {normalized_url}")
@@ -250,11 +311,13 @@ class WikipediaCrawler:
         else:
             document = {
                 'url': normalized_url,
-                'html_content': html_content,
+                content_field: html_content,
+                'content_format': content_format,
                 'source': source,
                 'content_hash': content_hash,
                 'crawl_date': current_timestamp,
-                'create_date': current_timestamp
+                'create_date': current_timestamp,
+                **fields
             }
             
             self.collection.insert_one(document)
@@ -262,6 +325,22 @@ class WikipediaCrawler:
             self.stats['new'] += 1
             return 'new'
     
+    def mark_deleted(self, url):
+        # Документ остается в базе с delete_date; crawl_date сдвигается,
+        # чтобы дельта-выгрузка (export_for_indexer_tsv.py) увидела удаление
+        current_timestamp = int(time.time())
+        
+        self.collection.update_one(
+            {'url': url},
+            {
+                '$set': {
+                    'crawl_date': current_timestamp,
+                    'delete_date': current_timestamp
+                }
+            }
+        )
+        self.logger.info(f"Удален: {url}")
+    
     def crawl_source(self, source_config):
         source_name = source_config['name']
         source_type = source_config.get('type', 'wikipedia_category')
@@ -284,19 +363,20 @@ class WikipediaCrawler:
                 batch = min(100, target_count - processed)
                 titles = self.get_random_articles(batch)
                 
-                for title in titles:
+                for title, article in self.iter_articles(titles):
                     try:
                         total_docs = self.collection.count_documents({})
                         if total_docs >= target:
                             self.logger.info(f"Достигнуто целевое количество документов: {target}")
                             return
                         
-                        article = self.fetch_article(title)
-                        
-                        if not article or 'html' not in article:
+                        content, content_format = self.article_content(article)
+                        if content is None:
                             continue
                         
-                        word_count = self.count_words(article['html'])
+                        fields = text_fields(content, title_html=article['title'],
+                                             content_format=content_format)
+                        word_count = fields['word_count']
                         min_words = self.config['logic']['min_words']
                         
                         if word_count < min_words:
@@ -304,13 +384,12 @@ class WikipediaCrawler:
                             continue
                         
                         url = f"https://tr.wikipedia.org/wiki/{urllib.parse.quote(title)}"
-                        self.save_document(url, article['html'], source_name)
+                        self.save_document(url, content, source_name, fields,
+                                           content_format=content_format, page_title=title)
                         
                         processed += 1
                         self.stats['processed'] += 1
                         
-                        time.sleep(self.config['logic']['delay_between_requests'])
-                        
                         if self.stats['processed'] % 10 == 0:
                             self.print_stats()
                         
@@ -329,7 +408,7 @@ class WikipediaCrawler:
             titles = self.get_category_members(category, limit=5000)
         
         processed = 0
-        for title in titles:
+        for title, article in self.iter_articles(titles):
             try:
                 total_docs = self.collection.count_documents({})
                 target = self.config['logic']['target_document_count']
@@ -338,12 +417,13 @@ class WikipediaCrawler:
                     self.logger.info(f"Достигнуто целевое количество документов: {target}")
                     return
                 
-                article = self.fetch_article(title)
-                
-                if not article or 'html' not in article:
+                content, content_format = self.article_content(article)
+                if content is None:
                     continue
                 
-                word_count = self.count_words(article['html'])
+                fields = text_fields(content, title_html=article['title'],
+                                     content_format=content_format)
+                word_count = fields['word_count']
                 min_words = self.config['logic']['min_words']
                 
                 if word_count < min_words:
@@ -351,13 +431,12 @@ class WikipediaCrawler:
                     continue
                 
                 url = f"https://tr.wikipedia.org/wiki/{urllib.parse.quote(title)}"
-                self.save_document(url, article['html'], source_name)
+                self.save_document(url, content, source_name, fields,
+                                   content_format=content_format, page_title=title)
                 
                 processed += 1
                 self.stats['processed'] += 1
                 
-                time.sleep(self.config['logic']['delay_between_requests'])
-                
                 if processed % 10 == 0:
                     self.print_stats()
                 
@@ -375,35 +454,44 @@ class WikipediaCrawler:
         reindex_period = self.config['logic']['reindex_period_days']
         cutoff_timestamp = int(time.time()) - (reindex_period * 86400)
         
-        old_docs = self.collection.find({
-            'crawl_date': {'$lt': cutoff_timestamp}
-        })
+        old_docs = self.collection.find(
+            {'crawl_date': {'$lt': cutoff_timestamp}},
+            {'url': 1, 'source': 1, 'page_title': 1}
+        )
         
         count = 0
-        for doc in old_docs:
-            try:
+        # Пачками: в режиме batch вся пачка скачивается одним запросом
+        for docs in batches(old_docs):
+            by_title = {}
+            for doc in docs:
                 url = doc['url']
-                title = url.split('/wiki/')[-1] if '/wiki/' in url else None
-                
-                if not title:
+                if '/wiki/' not in url:
+                    continue
+                # Название для API - сохраненное при обкачке: title очищен для
+                # показа (DISPLAYTITLE), а URL хранится в нижнем регистре и
+                # годится только для документов, сохраненных без page_title
+                title = doc.get('page_title') or urllib.parse.unquote(url.split('/wiki/')[-1])
+                by_title[title] = doc
+            
+            for title, article in self.iter_articles(list(by_title)):
+                doc = by_title[title]
+                try:
+                    content, content_format = self.article_content(article)
+                    
+                    if content is not None:
+                        self.save_document(doc['url'], content, doc['source'], force_update=True,
+                                           content_format=content_format, page_title=title,
+                                           title_html=article['title'])
+                        count += 1
+                    elif article and article.get('missing'):
+                        self.mark_deleted(doc['url'])
+                    
+                except KeyboardInterrupt:
+                    self.logger.info("Получен сигнал остановки")
+                    raise
+                except Exception as e:
+                    self.logger.error(f"Ошибка переобкачки {doc['url']}: {e}")
                     continue
-                
-                title = urllib.parse.unquote(title)
-                
-                article = self.fetch_article(title)
-                
-                if article and 'html' in article:
-                    self.save_document(url, article['html'], doc['source'], force_update=True)
-                    count += 1
-                
-                time.sleep(self.config['logic']['delay_between_requests'])
-                
-            except KeyboardInterrupt:
-                self.logger.info("Получен сигнал остановки")
-                raise
-            except Exception as e:
-                self.logger.error(f"Ошибка переобкачки {doc['url']}: {e}")
-                continue
         
         self.logger.info(f"Переобкачано документов: {count}")
     
@@ -447,6 +535,7 @@ class WikipediaCrawler:
             self.logger.error(f"Критическая ошибка: {e}", exc_info=True)
         finally:
             self.client.close()
+            self.http.close()
             self.logger.info("Соединение с БД закрыто")
 
 def main():
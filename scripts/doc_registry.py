@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Постоянный реестр doc_id документов
+
+Коллекция doc_ids в MongoDB: {url, doc_id, content_hash}. doc_id
+назначаются монотонно и не используются повторно, поэтому полная выгрузка,
+дельта-сегменты (update_index.py) и слитые сегменты живут в одном
+пространстве doc_id: глобальный doc_id документа в индексе равен его
+doc_id в реестре.
+
+doc_id привязан к версии документа: пока content_hash не меняется, URL
+сохраняет doc_id; новая версия получает следующий свободный doc_id (старая
+версия в сегменте скрывается через .deleted), удаленная страница
+выписывается из реестра. Новые документы пачки
+нумеруются в порядке выгрузки - выгрузка идет по возрастанию URL, поэтому
+соседние doc_id получают близкие страницы.
+
+Поэтому doc_id полной выгрузки идут с пропусками. Отрицание (!терм) в
+./search и query_eval.py строится по doc_id, которые есть в индексе, а не
+по 1..max_doc_id, так что пропуски не попадают в результаты и total.
+
+Реестр пишет один процесс выгрузки за раз (update_index.py - под
+SegmentLock).
+"""
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+REGISTRY_COLLECTION = 'doc_ids'
+BATCH_SIZE = 1000
+
+
+class DocIdRegistry:
+    """doc_id по URL и content_hash документа"""
+
+    def __init__(self, db):
+        self.collection = db[REGISTRY_COLLECTION]
+        self.collection.create_index([('url', ASCENDING)], unique=True)
+        self.collection.create_index([('doc_id', ASCENDING)], unique=True)
+
+        last = self.collection.find_one({}, {'doc_id': 1}, sort=[('doc_id', DESCENDING)])
+        self.next_id = last['doc_id'] + 1 if last else 1
+        # Прежние doc_id измененных документов - их версии в сегментах
+        # скрываются через .deleted
+        self.replaced = []
+
+    def assign(self, docs, min_doc_id=1):
+        """doc_id для пачки документов MongoDB (нужны url и content_hash)
+
+        doc_id меньше min_doc_id уже лежат в прежних сегментах: для
+        неизмененного документа с таким doc_id возвращается None (выгружать
+        его не нужно), измененный получает новый doc_id.
+        """
+        self.next_id = max(self.next_id, min_doc_id)
+
+        urls = [doc['url'] for doc in docs]
+        known = {
+            entry['url']: entry
+            for entry in self.collection.find({'url': {'$in': urls}}, {'_id': 0})
+        }
+
+        doc_ids = []
+        updates = []
+
+        for doc in docs:
+            url = doc['url']
+            content_hash = doc.get('content_hash')
+            entry = known.get(url)
+
+            if entry and entry.get('content_hash') == content_hash:
+                doc_ids.append(entry['doc_id'] if entry['doc_id'] >= min_doc_id else None)
+                continue
+
+            if entry:
+                self.replaced.append(entry['doc_id'])
+            doc_id = self.next_id
+            self.next_id += 1
+            known[url] = {'url': url, 'doc_id': doc_id, 'content_hash': content_hash}
+            updates.append(UpdateOne(
+                {'url': url},
+                {'$set': {'doc_id': doc_id, 'content_hash': content_hash}},
+                upsert=True
+            ))
+            doc_ids.append(doc_id)
+
+        if updates:
+            self.collection.bulk_write(updates, ordered=True)
+
+        return doc_ids
+
+    def lookup(self, urls):
+        """{url: doc_id} для известных реестру URL"""
+        return {
+            entry['url']: entry['doc_id']
+            for entry in self.collection.find({'url': {'$in': list(urls)}}, {'_id': 0})
+        }
+
+    def forget(self, urls):
+        """Убрать удаленные документы: вернувшийся URL получит новый doc_id;
+        список их прежних doc_id"""
+        if not urls:
+            return []
+        doc_ids = list(self.lookup(urls).values())
+        self.collection.delete_many({'url': {'$in': list(urls)}})
+        return doc_ids
+
+    def iter_assigned(self, query, min_doc_id=1):
+        """(doc_id, документ) по курсору query, пачками по BATCH_SIZE;
+        документы с doc_id None пропускаются"""
+        batch = []
+
+        for doc in query:
+            batch.append(doc)
+            if len(batch) == BATCH_SIZE:
+                yield from self._assigned(batch, min_doc_id)
+                batch = []
+
+        if batch:
+            yield from self._assigned(batch, min_doc_id)
+
+    def _assigned(self, batch, min_doc_id):
+        for doc_id, doc in zip(self.assign(batch, min_doc_id), batch):
+            if doc_id is not None:
+                yield doc_id, doc
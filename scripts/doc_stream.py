@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Форматы потока документов на входе build_index
+
+Формат выбирается по имени файла:
+    *.tsv, прочие  - строка "doc_id\\turl\\ttitle\\tcontent" на документ;
+                     табуляции и переводы строк в полях заменяются пробелами
+    *.docs         - заголовок DOCS_MAGIC, затем кадр на документ:
+                     [u32 doc_id][u32 url_len][u32 title_len][u32 content_len]
+                     [url][title][content], строки UTF-8 без ограничения длины
+    *.docs.gz      - тот же поток кадров, сжатый gzip; может состоять из
+                     нескольких склеенных gzip-членов, поэтому пачки документов
+                     сжимаются параллельно и пишутся подряд
+
+build_index читает все три варианта (DocumentReader в build_index.cpp).
+"""
+
+import gzip
+import struct
+
+DOCS_MAGIC = b'SDOCS\x00\x01\n'
+FRAME_HEADER = struct.Struct('<IIII')
+
+FORMAT_TSV = 'tsv'
+FORMAT_FRAMED = 'docs'
+FORMAT_FRAMED_GZ = 'docs.gz'
+
+GZIP_LEVEL = 6
+
+
+def stream_format(path):
+    if path.endswith('.docs.gz'):
+        return FORMAT_FRAMED_GZ
+    if path.endswith('.docs'):
+        return FORMAT_FRAMED
+    return FORMAT_TSV
+
+
+def safe_text(text):
+    return text.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+
+
+def stream_header(fmt):
+    """Байты в начале файла формата fmt"""
+    if fmt == FORMAT_FRAMED:
+        return DOCS_MAGIC
+    if fmt == FORMAT_FRAMED_GZ:
+        return gzip.compress(DOCS_MAGIC, GZIP_LEVEL)
+    return b''
+
+
+def encode_documents(records, fmt):
+    """Байты пачки документов (doc_id, url, title, content) в формате fmt"""
+    if fmt == FORMAT_TSV:
+        return ''.join(
+            f"{doc_id}\t{safe_text(url)}\t{safe_text(title)}\t{safe_text(content)}\n"
+            for doc_id, url, title, content in records
+        ).encode('utf-8')
+
+    chunks = []
+    for doc_id, url, title, content in records:
+        fields = [url.encode('utf-8'), title.encode('utf-8'), content.encode('utf-8')]
+        chunks.append(FRAME_HEADER.pack(doc_id, *map(len, fields)))
+        chunks.extend(fields)
+    data = b''.join(chunks)
+
+    if fmt == FORMAT_FRAMED_GZ:
+        return gzip.compress(data, GZIP_LEVEL)
+    return data
+
+
+def frame_offsets(f):
+    """Смещения начала кадров несжатого потока *.docs (после заголовка)"""
+    if f.read(len(DOCS_MAGIC)) != DOCS_MAGIC:
+        raise ValueError("Файл не является потоком кадров документов")
+
+    offsets = []
+    while True:
+        position = f.tell()
+        header = f.read(FRAME_HEADER.size)
+        if not header:
+            return offsets
+        if len(header) != FRAME_HEADER.size:
+            raise ValueError(f"Оборванный кадр в позиции {position}")
+
+        offsets.append(position)
+        _, url_len, title_len, content_len = FRAME_HEADER.unpack(header)
+        f.seek(url_len + title_len + content_len, 1)
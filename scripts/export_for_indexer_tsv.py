@@ -1,80 +1,251 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
 import sys
-import re
-from pymongo import MongoClient
+import time
+from collections import deque
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+from pymongo import ASCENDING, MongoClient
 
-def strip_html(html_text):
-    text = re.sub(r'<[^>]+>', ' ', html_text)
-    text = re.sub(r'&[a-zA-Z]+;', ' ', text)
-    text = re.sub(r'&#\d+;', ' ', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+from doc_registry import DocIdRegistry
+from doc_stream import (
+    FORMAT_FRAMED, encode_documents, stream_format, stream_header
+)
+from html_text import document_text_fields, html_title
+from wiki_api import batches
 
-def extract_title_from_html(html_text):
-    match = re.search(r'<h[12]>(.*?)</h[12]>', html_text)
-    if match:
-        return strip_html(match.group(1))
+DELETES_SUFFIX = '.deletes'
+CURSOR_BATCH = 1000     # документов за один запрос к MongoDB
+CLEAN_BATCH = 64        # документов в одном задании пула очистки
+
+# Поля документа для выгрузки: готовый текст вместо HTML
+DOCUMENT_FIELDS = {'url': 1, 'clean_text': 1, 'title': 1, 'content_hash': 1, '_id': 0}
+DOCUMENT_FIELDS_HTML = {'url': 1, 'html_content': 1, 'wikitext': 1, 'content_format': 1,
+                        'content_hash': 1, '_id': 0}
+
+def document_record(doc_id, doc):
+    """(doc_id, url, title, текст) для build_index или None, если текста
+    слишком мало
+
+    Текст и название обычно уже сохранены роботом (html_text.text_fields);
+    HTML разбирается только для документов без них.
+    """
+    url = doc.get('url', '')
+    
+    if 'clean_text' in doc:
+        clean_text = doc['clean_text']
+        title = doc.get('title') or html_title('', clean_text)
+    else:
+        fields = document_text_fields(doc)
+        clean_text = fields['clean_text']
+        title = fields['title']
     
-    text = strip_html(html_text)
-    if len(text) > 100:
-        return text[:97] + "..."
-    return text if text else "Untitled"
+    if not clean_text or len(clean_text) < 100:
+        return None
+    
+    return doc_id, url, title, clean_text
+
+def with_text(collection, docs):
+    """Документы курсора; у сохраненных до появления clean_text (см.
+    backfill_text.py) HTML дочитывается одним запросом $in на пачку из
+    CURSOR_BATCH документов"""
+    for batch in batches(docs, CURSOR_BATCH):
+        missing = [doc['url'] for doc in batch if 'clean_text' not in doc]
+        if missing:
+            found = {
+                doc['url']: doc
+                for doc in collection.find({'url': {'$in': missing}}, DOCUMENT_FIELDS_HTML)
+            }
+            batch = [doc if 'clean_text' in doc else found.get(doc['url'], doc) for doc in batch]
+        yield from batch
+
+def clean_batch(batch, fmt):
+    """Закодированная в формате fmt пачка (doc_id, документ) и число
+    документов в ней - в процессе пула"""
+    records = [record for record in (document_record(doc_id, doc) for doc_id, doc in batch)
+               if record is not None]
+    return encode_documents(records, fmt), len(records)
 
-def safe_text(text):
-    return text.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+def write_documents(f, items, fmt, jobs=None, total=None):
+    """Очистить HTML документов items ((doc_id, документ)) в пуле процессов и
+    записать их в двоичный файл f в формате fmt (doc_stream.py) в исходном
+    порядке; число записанных документов
 
-def export_for_indexer(output_file='indexer_input.tsv', limit=None):
+    Документы читает из MongoDB текущий процесс, очищает и кодирует (для
+    *.docs.gz - и сжимает) пул из jobs процессов, пишет снова текущий. В
+    работе не больше двух пачек на процесс пула, поэтому память не растет
+    с размером выгрузки.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    exported = 0
+    pending = deque()
+    batch = []
+    
+    f.write(stream_header(fmt))
+    
+    def write_next():
+        nonlocal exported
+        data, count = pending.popleft().get()
+        f.write(data)
+        previous = exported
+        exported += count
+        if total and exported // 1000 > previous // 1000:
+            print(f"  Экспортировано: {exported}/{total}")
     
+    with Pool(jobs) as pool:
+        for item in items:
+            batch.append(item)
+            if len(batch) < CLEAN_BATCH:
+                continue
+            
+            pending.append(pool.apply_async(clean_batch, (batch, fmt)))
+            batch = []
+            if len(pending) >= 2 * jobs:
+                write_next()
+        
+        if batch:
+            pending.append(pool.apply_async(clean_batch, (batch, fmt)))
+        while pending:
+            write_next()
+    
+    return exported
+
+def export_documents(f, fmt, limit=None, jobs=None):
+    """Все документы MongoDB в двоичный поток f в формате fmt; число документов"""
     print("Подключение к MongoDB...")
     client = MongoClient('localhost', 27017)
     db = client['turkish_wiki_search']
     collection = db['documents']
+    registry = DocIdRegistry(db)
     
-    total = collection.count_documents({})
+    # Страницы, которые робот отметил удаленными, в индекс не попадают
+    live = {'delete_date': {'$exists': False}}
+    total = collection.count_documents(live)
     print(f"Найдено документов: {total}")
     
     if limit:
         total = min(total, limit)
         print(f"Экспортируем первые {limit} документов")
     
-    print(f"Экспорт в {output_file}...")
+    # doc_id - из реестра, одинаковые для всех выгрузок
+    query = collection.find(live, DOCUMENT_FIELDS).sort('url', ASCENDING).batch_size(CURSOR_BATCH)
     
-    exported = 0
-    with open(output_file, 'w', encoding='utf-8') as f:
-        query = collection.find({}, {'url': 1, 'html_content': 1, '_id': 0})
-        
-        if limit:
-            query = query.limit(limit)
-        
-        for doc_id, doc in enumerate(query, 1):
-            url = doc.get('url', '')
-            html_content = doc.get('html_content', '')
-            
-            title = extract_title_from_html(html_content)
-            clean_text = strip_html(html_content)
-            
-            if not clean_text or len(clean_text) < 100:
-                continue
-            
-            # TSV формат: doc_id \t url \t title \t content
-            line = f"{doc_id}\t{safe_text(url)}\t{safe_text(title)}\t{safe_text(clean_text)}\n"
-            f.write(line)
-            
-            exported += 1
-            
-            if exported % 100 == 0:
-                print(f"  Экспортировано: {exported}/{total}")
+    if limit:
+        query = query.limit(limit)
     
+    docs = registry.iter_assigned(with_text(collection, query))
+    exported = write_documents(f, docs, fmt, jobs, total)
     client.close()
     
     print(f"\nЭкспортировано {exported} документов")
+    return exported
+
+def export_for_indexer(output_file='indexer_input.tsv', limit=None, jobs=None):
+    # "-" - поток кадров в stdout прямо в ./build_index - без промежуточного
+    # файла; сообщения тогда идут в stderr. Пока build_index не успевает
+    # читать, запись в канал блокируется, и выгрузка ждет индексатор
+    if output_file == '-':
+        out = sys.stdout.buffer
+        with redirect_stdout(sys.stderr):
+            exported = export_documents(out, FORMAT_FRAMED, limit, jobs)
+        out.flush()
+        return exported
+    
+    print(f"Экспорт в {output_file}...")
+    with open(output_file, 'wb') as f:
+        exported = export_documents(f, stream_format(output_file), limit, jobs)
     print(f"  Файл: {output_file}")
     
     return exported
 
+def export_changes(output_file, since, base=0, host='localhost', port=27017):
+    """Документы, которые робот добавил, обновил или отметил удаленными
+    начиная с since (crawl_date, unix time) - для дельта-сегмента с данным base.
+
+    Новые и измененные документы (upsert) пишутся в output_file (формат - по
+    имени файла, doc_stream.py), doc_id в нем -
+    локальные: doc_id из реестра минус base. Глобальные doc_id, которые надо
+    скрыть в прежних сегментах (прежние версии измененных документов и
+    удаленные страницы), - по одному в строке в <output_file>.deletes.
+    Возвращает (число upsert, число delete, новый watermark)."""
+    client = MongoClient(host, port)
+    db = client['turkish_wiki_search']
+    collection = db['documents']
+    registry = DocIdRegistry(db)
+    
+    # Все, что робот запишет после начала выборки, попадет в следующую
+    # (документы этой же секунды могут выгрузиться дважды - реестр узнает
+    # неизмененную версию и пропустит ее)
+    watermark = int(time.time())
+    
+    # crawl_date ставится при добавлении, обновлении и удалении документа,
+    # курсор идет по индексу crawl_date, а не по всей коллекции
+    query = collection.find(
+        {'crawl_date': {'$gte': since}},
+        dict(DOCUMENT_FIELDS, delete_date=1)
+    ).hint([('crawl_date', ASCENDING)]).batch_size(CURSOR_BATCH)
+    
+    deleted_urls = []
+    
+    def upserts():
+        for doc in query:
+            if 'delete_date' in doc:
+                deleted_urls.append(doc['url'])
+            else:
+                yield doc
+    
+    with open(output_file, 'wb') as f:
+        items = ((doc_id - base, doc)
+                 for doc_id, doc in registry.iter_assigned(with_text(collection, upserts()), base + 1))
+        exported = write_documents(f, items, stream_format(output_file))
+    
+    stale_ids = registry.replaced + registry.forget(deleted_urls)
+    with open(f"{output_file}{DELETES_SUFFIX}", 'w', encoding='utf-8') as f:
+        for doc_id in sorted(stale_ids):
+            f.write(f"{doc_id}\n")
+    
+    client.close()
+    return exported, len(deleted_urls), watermark
+
+def read_deletes(output_file):
+    """Глобальные doc_id из <output_file>.deletes"""
+    try:
+        with open(f"{output_file}{DELETES_SUFFIX}", 'r', encoding='utf-8') as f:
+            return [int(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def export_delta(output_file):
+    """Дельта-выгрузка с watermark в <output_file>.watermark:
+    только документы, измененные после прошлого запуска"""
+    watermark_path = f"{output_file}.watermark"
+    since = 0
+    if os.path.exists(watermark_path):
+        with open(watermark_path, 'r') as f:
+            since = int(f.read().strip() or 0)
+    
+    print(f"Выгрузка изменений после {since} в {output_file}...")
+    exported, deleted, watermark = export_changes(output_file, since)
+    
+    # watermark сдвигается только после успешной выгрузки
+    with open(watermark_path, 'w') as f:
+        f.write(f"{watermark}\n")
+    
+    print(f"Новых и измененных: {exported}, удаленных: {deleted}")
+    print(f"  Файлы: {output_file}, {output_file}{DELETES_SUFFIX}")
+    return exported, deleted
+
 if __name__ == '__main__':
+    # --delta [файл]: только изменения после прошлой дельта-выгрузки
+    if len(sys.argv) > 1 and sys.argv[1] == '--delta':
+        export_delta(sys.argv[2] if len(sys.argv) > 2 else 'indexer_delta.tsv')
+        sys.exit(0)
+    
+    # Формат - по имени файла: indexer_input.docs.gz - сжатые кадры без
+    # ограничения длины документа (doc_stream.py), иначе TSV; "-" - кадры в
+    # stdout: export_for_indexer_tsv.py - | ./build_index - index
     limit = None
     output_file = 'indexer_input.tsv'
     
@@ -3,14 +3,8 @@
 
 import sys
 from pymongo import MongoClient
-import re
 
-def extract_text_from_html(html):
-    # Удаление тегов
-    text = re.sub(r'<[^>]+>', ' ', html)
-    # Удаление множественных пробелов
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+from html_text import document_text_fields
 
 def main():
     try:
@@ -21,9 +15,12 @@ def main():
         count = collection.count_documents({})
         print(f"# Найдено документов: {count}", file=sys.stderr)
         
-        for doc in collection.find():
-            html = doc.get('html_content', '')
-            text = extract_text_from_html(html)
+        # Текст, сохраненный роботом; HTML читается только у документов без него
+        for doc in collection.find({}, {'clean_text': 1}):
+            text = doc.get('clean_text')
+            if text is None:
+                source = collection.find_one({'_id': doc['_id']}, {'html_content': 1, 'wikitext': 1})
+                text = document_text_fields(source or {})['clean_text']
             
             print(text)
             
@@ -9,12 +9,14 @@ import sys
 import yaml
 import time
 import hashlib
-import urllib.request
 import urllib.parse
 import json
-import re
 from datetime import datetime
 from pymongo import MongoClient, ASCENDING
+
+from html_text import CONTENT_FIELDS, FORMAT_HTML, FORMAT_WIKITEXT, text_fields
+from http_client import MAX_RESPONSE_BYTES, HttpClient
+from wiki_api import batches, fetch_revisions
 import logging
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -40,7 +42,17 @@ class FastWikipediaCrawler:
         }
         self.stats_lock = threading.Lock()
         
+        # Постоянные соединения с API на поток, ответы в gzip
+        self.http = HttpClient(
+            self.config['wikipedia']['user_agent'],
+            timeout=self.config['logic']['request_timeout'],
+            max_bytes=self.config['logic'].get('max_response_bytes', MAX_RESPONSE_BYTES)
+        )
+        
         self.num_workers = self.config['logic'].get('num_workers', 5)
+        # parse - HTML каждой статьи отдельным запросом, batch - викитекст
+        # пачки статей одним запросом (wiki_api.py)
+        self.fetch_mode = self.config['logic'].get('fetch_mode', 'parse')
         self.logger.info(f"Робот инициализирован с {self.num_workers} потоками")
     
     def _setup_logging(self):
@@ -97,12 +109,7 @@ class FastWikipediaCrawler:
         
         for attempt in range(max_retries):
             try:
-                req = urllib.request.Request(url)
-                req.add_header('User-Agent', self.config['wikipedia']['user_agent'])
-                
-                timeout = self.config['logic']['request_timeout']
-                with urllib.request.urlopen(req, timeout=timeout) as response:
-                    return response.read().decode('utf-8')
+                return self.http.get(url)
             except Exception as e:
                 if attempt < max_retries - 1:
                     time.sleep(0.5)
@@ -165,7 +172,7 @@ class FastWikipediaCrawler:
             if 'parse' in data and 'text' in data['parse']:
                 return {
                     'html': data['parse']['text']['*'],
-                    'title': data['parse']['displaytitle'],
+                    'title': data['parse'].get('displaytitle') or title,
                     'pageid': data['parse']['pageid']
                 }
             return None
@@ -173,25 +180,44 @@ class FastWikipediaCrawler:
             self.logger.debug(f"Ошибка получения статьи {title}: {e}")
             return None
     
-    def count_words(self, html_content):
-        text = re.sub('<[^<]+?>', '', html_content)
-        words = re.findall(r'\w+', text)
-        return len(words)
+    def fetch_articles(self, titles):
+        """{название: статья} для пачки названий (prop=revisions, викитекст)"""
+        base_url = self.config['wikipedia']['base_url']
+        try:
+            return fetch_revisions(
+                lambda url: json.loads(self.fetch_with_retry(url)), base_url, titles
+            )
+        except Exception as e:
+            self.logger.debug(f"Ошибка получения пачки из {len(titles)} статей: {e}")
+            return {}
     
     def calculate_hash(self, content):
         return hashlib.md5(content.encode('utf-8')).hexdigest()
     
-    def save_document(self, url, html_content, source):
-        """Сохранение документа в MongoDB"""
+    def save_document(self, url, html_content, source, fields=None, content_format=FORMAT_HTML,
+                      page_title=None, title_html=None):
+        """Сохранение документа в MongoDB вместе с очищенным текстом
+        (html_text.text_fields), чтобы выгрузка не разбирала HTML заново;
+        викитекст (content_format FORMAT_WIKITEXT) хранится в поле wikitext;
+        поле другого формата не стирается, свежее из них - content_format.
+        page_title - название статьи в API, по нему crawler.py переобкачивает
+        документ; без fields title берется из title_html (displaytitle) или
+        page_title, а не из URL"""
         normalized_url = self.normalize_url(url)
         content_hash = self.calculate_hash(html_content)
         current_timestamp = int(time.time())
+        if fields is None:
+            fields = text_fields(html_content, normalized_url, title_html or page_title,
+                                 content_format=content_format)
+        if page_title:
+            fields = {**fields, 'page_title': page_title}
+        content_field = CONTENT_FIELDS[content_format]
         
         try:
             existing = self.collection.find_one({'url': normalized_url})
             
             if existing:
-                if existing.get('content_hash') == content_hash:
+                if existing.get('content_hash') == content_hash and 'delete_date' not in existing:
                     with self.stats_lock:
                         self.stats['skipped'] += 1
                     return 'skipped'
@@ -200,11 +226,14 @@ class FastWikipediaCrawler:
                     {'url': normalized_url},
                     {
                         '$set': {
-                            'html_content': html_content,
+                            content_field: html_content,
+                            'content_format': content_format,
                             'content_hash': content_hash,
                             'crawl_date': current_timestamp,
-                            'update_date': current_timestamp
-                        }
+                            'update_date': current_timestamp,
+                            **fields
+                        },
+                        '$unset': {'delete_date': ''}
                     }
                 )
                 with self.stats_lock:
@@ -213,11 +242,13 @@ class FastWikipediaCrawler:
             else:
                 document = {
                     'url': normalized_url,
-                    'html_content': html_content,
+                    content_field: html_content,
+                    'content_format': content_format,
                     'source': source,
                     'content_hash': content_hash,
                     'crawl_date': current_timestamp,
-                    'create_date': current_timestamp
+                    'create_date': current_timestamp,
+                    **fields
                 }
                 
                 self.collection.insert_one(document)
@@ -228,22 +259,26 @@ class FastWikipediaCrawler:
             self.logger.error(f"Ошибка сохранения {normalized_url}: {e}")
             return 'error'
     
-    def process_article(self, title, source_name):
-        """Обработка одной статьи (выполняется в потоке)"""
+    def store_article(self, title, article, source_name):
+        """Проверка min_words и сохранение скачанной статьи"""
         try:
-            article = self.fetch_article(title)
-            
-            if not article or 'html' not in article:
+            if article and 'html' in article:
+                content, content_format = article['html'], FORMAT_HTML
+            elif article and 'wikitext' in article:
+                content, content_format = article['wikitext'], FORMAT_WIKITEXT
+            else:
                 return None
             
-            word_count = self.count_words(article['html'])
+            fields = text_fields(content, title_html=article['title'], content_format=content_format)
+            word_count = fields['word_count']
             min_words = self.config['logic']['min_words']
             
             if word_count < min_words:
                 return None
             
             url = f"https://tr.wikipedia.org/wiki/{urllib.parse.quote(title)}"
-            result = self.save_document(url, article['html'], source_name)
+            result = self.save_document(url, content, source_name, fields, content_format,
+                                        page_title=title)
             
             with self.stats_lock:
                 self.stats['processed'] += 1
@@ -256,22 +291,38 @@ class FastWikipediaCrawler:
             self.logger.debug(f"Ошибка обработки {title}: {e}")
             return None
     
+    def process_article(self, title, source_name):
+        """Обработка одной статьи (выполняется в потоке)"""
+        return self.store_article(title, self.fetch_article(title), source_name)
+    
+    def process_batch(self, titles, source_name):
+        """Обработка пачки статей одним запросом к API (выполняется в потоке)"""
+        articles = self.fetch_articles(titles)
+        return [self.store_article(title, articles.get(title), source_name) for title in titles]
+    
     def crawl_parallel(self, titles, source_name):
         """Параллельная обкачка списка статей"""
         total = len(titles)
         self.logger.info(f"Начало параллельной обкачки {total} статей с {self.num_workers} потоками")
         
         with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-            futures = {
-                executor.submit(self.process_article, title, source_name): title 
-                for title in titles
-            }
+            if self.fetch_mode == 'batch':
+                futures = {
+                    executor.submit(self.process_batch, batch, source_name): len(batch)
+                    for batch in batches(titles)
+                }
+            else:
+                futures = {
+                    executor.submit(self.process_article, title, source_name): 1
+                    for title in titles
+                }
             
             completed = 0
             for future in as_completed(futures):
-                completed += 1
+                previous = completed
+                completed += futures[future]
                 
-                if completed % 50 == 0:
+                if completed // 50 > previous // 50:
                     self.print_stats()
                 
                 target = self.config['logic']['target_document_count']
@@ -338,6 +389,7 @@ class FastWikipediaCrawler:
             self.logger.error(f"Критическая ошибка: {e}", exc_info=True)
         finally:
             self.client.close()
+            self.http.close()
             self.logger.info("Соединение с БД закрыто")
 
 def main():
@@ -8,18 +8,19 @@
 import json
 import os
 import time
-import urllib.request
 import urllib.parse
 import re
 
+from http_client import HttpClient
+
+# Одно keep-alive соединение с API на все запросы скрипта
+HTTP = HttpClient('InfoSearchBot/1.0 (Educational Project)', timeout=10)
+
 def fetch_with_retry(url, max_retries=3):
     """Запрос с повторными попытками"""
     for attempt in range(max_retries):
         try:
-            req = urllib.request.Request(url)
-            req.add_header('User-Agent', 'InfoSearchBot/1.0 (Educational Project)')
-            with urllib.request.urlopen(req, timeout=10) as response:
-                return json.loads(response.read().decode('utf-8'))
+            return HTTP.get_json(url)
         except Exception as e:
             if attempt == max_retries - 1:
                 print(f"    Ошибка после {max_retries} попыток: {e}")
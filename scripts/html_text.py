@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Текст статьи Википедии из HTML за один проход
+
+Документ просматривается слева направо один раз: регулярное выражение
+находит начало следующего блока, который не относится к содержанию статьи
+(список источников, навигационные шаблоны, ссылки [değiştir], сноски,
+скрипты), блок пропускается до парного закрывающего тега, теги в остальном
+тексте заменяются пробелами. Сущности (&amp;, &#304;, &nbsp;) раскодируются,
+пробелы схлопываются.
+
+Роботы в пакетном режиме (wiki_api.py) получают не HTML, а викитекст
+статьи; его чистит wikitext_to_text: шаблоны, таблицы, сноски, файлы и
+категории отбрасываются, от ссылок остается подпись.
+
+Роботы сохраняют результат (text_fields) в MongoDB рядом с HTML, поэтому
+export_for_indexer_tsv.py и export_from_mongodb.py обычно берут готовый
+текст; analyze_corpus.py очищает статьи из JSON-файлов. Сравнение с
+прежней очисткой регулярными выражениями - scripts/benchmark_html_text.py.
+"""
+
+import hashlib
+import html
+import re
+import urllib.parse
+
+# Версия очистки в сохраненных полях: после изменения очистки
+# scripts/backfill_text.py пересчитывает документы с другой версией
+TEXT_VERSION = 2
+
+# Теги, содержимое которых никогда не бывает текстом статьи
+SKIP_TAGS = frozenset({'script', 'style', 'head', 'noscript', 'template'})
+
+# Классы служебных блоков HTML из action=parse
+BOILERPLATE_CLASSES = frozenset({
+    'mw-editsection',       # ссылки [değiştir | kaynağı değiştir]
+    'reference',            # номера сносок [1]
+    'reflist',
+    'references',
+    'mw-references-wrap',
+    'navbox',
+    'navbox-styles',
+    'vertical-navbox',
+    'metadata',
+    'noprint',
+    'toc',
+    'catlinks',
+    'mw-empty-elt',
+})
+
+# Теги без закрывающей пары
+VOID_TAGS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr',
+})
+
+# Начало пропускаемого блока: тег из SKIP_TAGS или тег со служебным классом
+# (атрибут class после пробела, не data-class и т.п.)
+BLOCK_RE = re.compile(
+    r'<(?P<skip>' + '|'.join(sorted(SKIP_TAGS)) + r')\b'
+    r'|<(?P<tag>[a-zA-Z][a-zA-Z0-9]*)\b[^>]*?\sclass\s*=\s*["\'][^"\'>]*?(?<![\w-])(?:'
+    + '|'.join(re.escape(name) for name in sorted(BOILERPLATE_CLASSES)) +
+    r')(?![\w-])',
+    re.I
+)
+TAG_RE = re.compile(r'<!--.*?(?:-->|$)|<[^>]*>', re.S)
+TITLE_RE = re.compile(r'<h[12][^>]*>(.*?)</h[12]>', re.S)
+WORD_RE = re.compile(r'\w+')
+
+# Формат исходного текста документа и поле MongoDB, в котором он хранится
+FORMAT_HTML = 'html'
+FORMAT_WIKITEXT = 'wikitext'
+CONTENT_FIELDS = {FORMAT_HTML: 'html_content', FORMAT_WIKITEXT: 'wikitext'}
+
+# Викитекст: самые вложенные шаблон, таблица и ссылка - их убирают изнутри
+# наружу, пока есть что убирать
+WIKI_TEMPLATE_RE = re.compile(r'\{\{(?:(?!\{\{|\}\}).)*\}\}', re.S)
+WIKI_TABLE_RE = re.compile(r'\{\|(?:(?!\{\||\|\}).)*\|\}', re.S)
+WIKI_LINK_RE = re.compile(r'\[\[([^\[\]]*)\]\]')
+WIKI_REF_RE = re.compile(r'<ref\b[^>/]*/>|<ref\b[^>]*>.*?</ref\s*>', re.S | re.I)
+WIKI_EXTERNAL_RE = re.compile(r'\[(?:https?:)?//[^\s\]]*\s*([^\]]*)\]')
+WIKI_MARKUP_RE = re.compile(r"^[=*#:;]+|=+\s*$|__[A-Z]+__", re.M)
+WIKI_QUOTES_RE = re.compile(r"'{2,}")
+
+# Пространства имен, ссылки на которые не являются текстом статьи
+WIKI_SKIP_NAMESPACES = frozenset({
+    'dosya', 'file', 'resim', 'image', 'kategori', 'category', 'medya', 'media',
+})
+
+_pair_patterns = {}
+
+
+def block_end(html_text, tag, start):
+    """Конец блока, открытого тегом tag в позиции start (с вложенными tag);
+    None, если блок не закрыт до конца документа"""
+    tag = tag.lower()
+    if tag in VOID_TAGS:
+        end = html_text.find('>', start)
+        return end + 1 if end >= 0 else len(html_text)
+
+    pattern = _pair_patterns.get(tag)
+    if pattern is None:
+        pattern = re.compile(r'<(/?)' + tag + r'\b[^>]*>', re.I)
+        _pair_patterns[tag] = pattern
+
+    depth = 0
+    for match in pattern.finditer(html_text, start):
+        if match.group(1):
+            depth -= 1
+        elif not match.group(0).endswith('/>'):
+            depth += 1
+        if depth <= 0:
+            return match.end()
+    return None
+
+
+def html_to_text(html_text):
+    """Текст содержания статьи: без тегов, служебных блоков и сущностей"""
+    # Куски HTML между служебными блоками; сами блоки пропускаются целиком
+    parts = []
+    position = 0
+    while True:
+        match = BLOCK_RE.search(html_text, position)
+        if match is None:
+            parts.append(html_text[position:])
+            break
+        parts.append(html_text[position:match.start()])
+        tag = match.group('skip') or match.group('tag')
+        end = block_end(html_text, tag, match.start())
+        if end is None:
+            # Незакрытый блок не поглощает остаток документа: пропускается
+            # только открывающий тег
+            end = html_text.find('>', match.start()) + 1 or len(html_text)
+        position = end
+
+    # Теги разделяют слова, как пробел
+    text = TAG_RE.sub(' ', ' '.join(parts))
+    if '&' in text:
+        text = html.unescape(text)
+    return ' '.join(text.split())
+
+
+def _wiki_link(match):
+    target, _, label = match.group(1).partition('|')
+    namespace, colon, _ = target.partition(':')
+    if colon and namespace.strip().lower() in WIKI_SKIP_NAMESPACES:
+        return ' '
+    # Межъязыковые ссылки [[en:...]] тоже не текст
+    if colon and len(namespace) <= 3 and namespace.islower() and not label:
+        return ' '
+    return label.rpartition('|')[2] if label else target
+
+
+def _remove_nested(pattern, text, replacement=' '):
+    while True:
+        text, count = pattern.subn(replacement, text)
+        if not count:
+            return text
+
+
+def wikitext_to_text(wikitext):
+    """Текст статьи из викитекста: без шаблонов, таблиц, сносок и разметки"""
+    # Сноски и курсив стоят вплотную к словам и знакам препинания
+    text = WIKI_QUOTES_RE.sub('', WIKI_REF_RE.sub('', wikitext))
+    text = TAG_RE.sub(' ', text)
+    text = _remove_nested(WIKI_TEMPLATE_RE, text)
+    text = _remove_nested(WIKI_TABLE_RE, text)
+    text = _remove_nested(WIKI_LINK_RE, text, _wiki_link)
+    text = WIKI_EXTERNAL_RE.sub(r' \1 ', text)
+    text = WIKI_MARKUP_RE.sub(' ', text)
+    if '&' in text:
+        text = html.unescape(text)
+    return ' '.join(text.split())
+
+
+def html_title(html_text, text=None):
+    """Заголовок документа: первый <h1>/<h2> или начало текста text"""
+    match = TITLE_RE.search(html_text)
+    if match:
+        return html_to_text(match.group(1))
+
+    if text is None:
+        text = html_to_text(html_text)
+    if len(text) > 100:
+        return text[:97] + "..."
+    return text if text else "Untitled"
+
+
+def url_title(url):
+    """Название статьи из URL вида .../wiki/<название>"""
+    if '/wiki/' not in url:
+        return ''
+    return urllib.parse.unquote(url.split('/wiki/')[-1]).replace('_', ' ')
+
+
+def text_fields(html_text, url='', title_html=None, content_format=FORMAT_HTML):
+    """Производные поля документа, которые робот хранит рядом с HTML:
+    clean_text, title, word_count, text_hash и text_version
+
+    title - из displaytitle (title_html), иначе из URL, иначе из HTML.
+    Выгрузка берет готовый clean_text и не разбирает HTML повторно.
+    content_format FORMAT_WIKITEXT - в html_text викитекст.
+    """
+    if content_format == FORMAT_WIKITEXT:
+        text = wikitext_to_text(html_text)
+        html_text = ''
+    else:
+        text = html_to_text(html_text)
+    title = (html_to_text(title_html) if title_html else '') or url_title(url)
+
+    return {
+        'clean_text': text,
+        'title': title or html_title(html_text, text),
+        'word_count': len(WORD_RE.findall(text)),
+        'text_hash': hashlib.md5(text.encode('utf-8')).hexdigest(),
+        'text_version': TEXT_VERSION,
+    }
+
+
+def document_text_fields(doc):
+    """text_fields документа MongoDB - из html_content или wikitext"""
+    # При смене fetch_mode поле прежнего формата остается устаревшим:
+    # сначала поле из content_format, которое робот записал последним
+    current = doc.get('content_format')
+    if current in CONTENT_FIELDS and doc.get(CONTENT_FIELDS[current]) is not None:
+        return text_fields(doc[CONTENT_FIELDS[current]], doc.get('url', ''), content_format=current)
+
+    for content_format, field in CONTENT_FIELDS.items():
+        if doc.get(field) is not None:
+            return text_fields(doc[field], doc.get('url', ''), content_format=content_format)
+    return text_fields('', doc.get('url', ''))
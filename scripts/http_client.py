@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP-клиент роботов: постоянные соединения и сжатие ответов
+
+urllib.request.urlopen открывает новое TCP+TLS соединение на каждый запрос.
+HttpClient держит по одному keep-alive соединению на хост в каждом потоке
+(потоки ThreadPoolExecutor не делят соединения и не ждут друг друга),
+запрашивает ответы в gzip и распаковывает их потоком. Размер ответа после
+распаковки ограничен max_bytes, так что битый или слишком большой ответ не
+съедает память.
+
+Соединение, которое сервер закрыл между запросами, открывается заново, и
+запрос повторяется один раз; остальные ошибки - исключения, повторные
+попытки с паузой остаются у вызывающего (fetch_with_retry).
+"""
+
+import http.client
+import json
+import threading
+import urllib.parse
+import zlib
+
+MAX_RESPONSE_BYTES = 32 * 1024 * 1024   # после распаковки
+READ_CHUNK = 64 * 1024
+MAX_REDIRECTS = 5
+
+
+class HttpError(IOError):
+    """Ответ с кодом, отличным от 200"""
+
+    def __init__(self, url, status, reason):
+        super().__init__(f"HTTP {status} {reason}: {url}")
+        self.url = url
+        self.status = status
+
+
+class HttpClient:
+    """GET-запросы по постоянным соединениям, по одному на хост и поток"""
+
+    def __init__(self, user_agent, timeout=10, max_bytes=MAX_RESPONSE_BYTES):
+        self.headers = {
+            'User-Agent': user_agent,
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        }
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._all = []              # все соединения всех потоков - для close()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Тело ответа на GET url в виде str (UTF-8)"""
+        for _ in range(MAX_REDIRECTS + 1):
+            status, reason, location, body = self._request(url)
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if status != 200:
+                raise HttpError(url, status, reason)
+            return body.decode('utf-8')
+        raise HttpError(url, status, 'too many redirects')
+
+    def get_json(self, url):
+        return json.loads(self.get(url))
+
+    def close(self):
+        """Закрыть соединения всех потоков"""
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            conn.close()
+
+    def _connection(self, scheme, netloc):
+        pool = getattr(self._local, 'connections', None)
+        if pool is None:
+            pool = self._local.connections = {}
+
+        conn = pool.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = cls(netloc, timeout=self.timeout)
+            pool[(scheme, netloc)] = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def _drop(self, scheme, netloc):
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+            with self._lock:
+                if conn in self._all:
+                    self._all.remove(conn)
+
+    def _request(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        # Первая попытка может попасть на соединение, которое сервер уже
+        # закрыл по keep-alive таймауту; тогда - одна попытка на новом
+        for attempt in range(2):
+            conn = self._connection(parsed.scheme, parsed.netloc)
+            reused = conn.sock is not None
+            try:
+                conn.request('GET', path, headers=self.headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                    ConnectionResetError, BrokenPipeError):
+                self._drop(parsed.scheme, parsed.netloc)
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                self._drop(parsed.scheme, parsed.netloc)
+                raise
+            break
+
+        try:
+            body = self._read_body(response)
+        except Exception:
+            self._drop(parsed.scheme, parsed.netloc)
+            raise
+
+        if response.will_close:
+            self._drop(parsed.scheme, parsed.netloc)
+
+        return response.status, response.reason, response.getheader('Location'), body
+
+    def _read_body(self, response):
+        """Тело ответа, распакованное и не длиннее max_bytes"""
+        encoding = (response.getheader('Content-Encoding') or '').strip().lower()
+        if encoding == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            decompressor = zlib.decompressobj()
+        else:
+            decompressor = None
+
+        parts = []
+        size = 0
+        while True:
+            chunk = response.read(READ_CHUNK)
+            if not chunk:
+                break
+            if decompressor is not None:
+                # Распаковка не дальше предела: сжатая бомба не развернется
+                chunk = decompressor.decompress(chunk, self.max_bytes - size + 1)
+                if decompressor.unconsumed_tail:
+                    raise IOError(f"ответ больше {self.max_bytes} байт")
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise IOError(f"ответ больше {self.max_bytes} байт")
+            parts.append(chunk)
+
+        if decompressor is not None:
+            tail = decompressor.flush()
+            if size + len(tail) > self.max_bytes:
+                raise IOError(f"ответ больше {self.max_bytes} байт")
+            parts.append(tail)
+        return b''.join(parts)
@@ -37,22 +37,28 @@ def get_stats(collection, config):
     ]):
         sources[doc['_id']] = doc['count']
     
-    # Последние добавленные
-    recent = list(collection.find().sort('create_date', -1).limit(5))
+    # Последние добавленные (HTML и текст не нужны)
+    brief = {'url': 1, 'create_date': 1, 'update_date': 1}
+    recent = list(collection.find({}, brief).sort('create_date', -1).limit(5))
     
     # Недавно обновленные
     updated = list(collection.find(
-        {'update_date': {'$exists': True}}
+        {'update_date': {'$exists': True}}, brief
     ).sort('update_date', -1).limit(5))
     
-    # Средний размер
+    # Размер - из статистики коллекции, без чтения документов
+    coll_stats = collection.database.command('collStats', collection.name)
+    avg_size = coll_stats.get('avgObjSize', 0)
+    total_size = coll_stats.get('size', 0)
+    
+    # Слова - из word_count, который робот сохраняет вместе с текстом
     pipeline = [
-        {'$project': {'size': {'$strLenCP': '$html_content'}}},
-        {'$group': {'_id': None, 'avg': {'$avg': '$size'}, 'total': {'$sum': '$size'}}}
+        {'$match': {'word_count': {'$exists': True}}},
+        {'$group': {'_id': None, 'avg': {'$avg': '$word_count'}, 'total': {'$sum': '$word_count'}}}
     ]
-    size_stats = list(collection.aggregate(pipeline))
-    avg_size = size_stats[0]['avg'] if size_stats else 0
-    total_size = size_stats[0]['total'] if size_stats else 0
+    word_stats = list(collection.aggregate(pipeline))
+    avg_words = word_stats[0]['avg'] if word_stats else 0
+    total_words = word_stats[0]['total'] if word_stats else 0
     
     return {
         'total': total,
@@ -62,7 +68,9 @@ def get_stats(collection, config):
         'recent': recent,
         'updated': updated,
         'avg_size': avg_size,
-        'total_size': total_size
+        'total_size': total_size,
+        'avg_words': avg_words,
+        'total_words': total_words
     }
 
 def print_stats(stats, watch_mode=False):
@@ -99,6 +107,7 @@ def print_stats(stats, watch_mode=False):
     # Размер данных
     print(f"💾 Размер данных: {format_size(stats['total_size'])}")
     print(f"   Средний размер документа: {format_size(stats['avg_size'])}")
+    print(f"   Слов: {stats['total_words']:,}, в среднем на документ: {stats['avg_words']:.0f}")
     print()
     
     # Обновленные
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Параллельное построение индекса по шардам
+
+Вход (TSV или поток кадров *.docs[.gz], doc_stream.py) делится на N частей
+по границам документов (каждая часть - идущий подряд диапазон документов
+входного файла), ./build_index строит по каждой части несжатый индекс-шард
+в отдельном процессе, затем
+./build_index --merge сливает словари и постинг-листы шардов в один
+индекс. Прямой индекс, метаданные (число документов и термов, флаги) и
+итоговое представление постингов (--compress, --bitmaps) получаются те же,
+что при однопроцессном построении.
+
+Запуск из корня проекта:
+    python3 scripts/parallel_build_index.py indexer_input.tsv index_stemmed --stemming [--jobs 4]
+"""
+
+import argparse
+import bisect
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from doc_stream import (
+    DOCS_MAGIC, FORMAT_FRAMED, FORMAT_FRAMED_GZ, frame_offsets, stream_format
+)
+
+BUILD_INDEX = './build_index'
+
+
+def split_points(path, parts):
+    """Смещения начала частей файла, выровненные на начало строки"""
+    size = os.path.getsize(path)
+    points = [0]
+
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, points[-1]))
+            if f.tell() > 0:
+                f.readline()
+            position = f.tell()
+            if position >= size:
+                break
+            if position > points[-1]:
+                points.append(position)
+
+    points.append(size)
+    return points
+
+
+def frame_split_points(path, parts):
+    """Смещения начала частей потока кадров *.docs, выровненные на начало кадра"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offsets = frame_offsets(f)
+
+    points = [len(DOCS_MAGIC)]
+    for i in range(1, parts):
+        j = bisect.bisect_left(offsets, max(size * i // parts, points[-1] + 1))
+        if j >= len(offsets):
+            break
+        points.append(offsets[j])
+
+    points.append(size)
+    return points
+
+
+def write_shards(input_file, tmp, parts):
+    """Разрезать вход на части; пути к файлам частей в порядке документов"""
+    fmt = stream_format(input_file)
+
+    # Сжатый поток режется только после распаковки
+    if fmt == FORMAT_FRAMED_GZ:
+        unpacked = os.path.join(tmp, 'input.docs')
+        with gzip.open(input_file, 'rb') as src, open(unpacked, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        input_file = unpacked
+        fmt = FORMAT_FRAMED
+
+    if fmt == FORMAT_FRAMED:
+        points = frame_split_points(input_file, parts)
+        header = DOCS_MAGIC
+    else:
+        points = split_points(input_file, parts)
+        header = b''
+    paths = []
+
+    with open(input_file, 'rb') as src:
+        for i, (start, end) in enumerate(zip(points, points[1:])):
+            path = os.path.join(tmp, f"shard{i}.{fmt}")
+            src.seek(start)
+            remaining = end - start
+
+            with open(path, 'wb') as dst:
+                dst.write(header)
+                while remaining > 0:
+                    chunk = src.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+
+            paths.append(path)
+
+    return paths
+
+
+def build_shard(tsv_path, shard_base, stemming):
+    """Построить несжатый индекс-шард; (код возврата, вывод build_index)"""
+    cmd = [BUILD_INDEX, tsv_path, shard_base]
+    if stemming:
+        cmd.append('--stemming')
+
+    result = subprocess.run(cmd, capture_output=True, text=True, errors='replace')
+    return result.returncode, result.stdout + result.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Параллельное построение индекса по шардам')
+    parser.add_argument('input', help='TSV или *.docs[.gz]: doc_id, url, title, content')
+    parser.add_argument('output', help='базовое имя индекса')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='число шардов и параллельных процессов')
+    parser.add_argument('--stemming', action='store_true')
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--bitmaps', action='store_true')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"Файл не найден: {args.input}")
+        sys.exit(1)
+
+    jobs = max(1, args.jobs)
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+
+    print("=" * 70)
+    print("ПАРАЛЛЕЛЬНОЕ ПОСТРОЕНИЕ ИНДЕКСА")
+    print("=" * 70)
+
+    start = time.time()
+
+    # Шарды рядом с итоговым индексом: объем как у самого индекса
+    tmp = tempfile.mkdtemp(prefix='shards_', dir=output_dir)
+    try:
+        tsv_paths = write_shards(args.input, tmp, jobs)
+        shard_bases = [os.path.join(tmp, f"shard{i}") for i in range(len(tsv_paths))]
+        split_time = time.time() - start
+        print(f"Шардов: {len(tsv_paths)}, разбиение: {split_time:.2f} сек")
+
+        build_start = time.time()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(
+                lambda item: build_shard(item[0], item[1], args.stemming),
+                zip(tsv_paths, shard_bases)))
+
+        for i, (code, output) in enumerate(results):
+            if code != 0:
+                print(f"Ошибка построения шарда {i}:\n{output}")
+                sys.exit(1)
+
+        build_time = time.time() - build_start
+        print(f"Построение шардов: {build_time:.2f} сек")
+
+        merge_start = time.time()
+        cmd = [BUILD_INDEX, '--merge', args.output] + shard_bases
+        for flag in ('stemming', 'compress', 'bitmaps'):
+            if getattr(args, flag):
+                cmd.append(f"--{flag}")
+
+        result = subprocess.run(cmd, capture_output=True, text=True, errors='replace')
+        if result.returncode != 0:
+            print(f"Ошибка слияния шардов:\n{result.stdout}{result.stderr}")
+            sys.exit(1)
+
+        merge_time = time.time() - merge_start
+        print(f"Слияние: {merge_time:.2f} сек")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"\nОбщее время: {time.time() - start:.2f} сек")
+    print(f"Индекс: {args.output}.meta, {args.output}.forward, {args.output}.inverted")
+
+
+if __name__ == '__main__':
+    main()
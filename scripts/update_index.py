@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Инкрементальное обновление индекса дельта-сегментами
+
+Документы, которые робот добавил или обновил после watermark (crawl_date в
+MongoDB), выгружаются в небольшой дельта-сегмент <index>.seg<N> и
+дописываются в манифест <index>.segments (index_segments.py). Старые версии
+этих документов в предыдущих сегментах отмечаются в <сегмент>.deleted и
+сразу пропадают из результатов; так же скрываются страницы, которые робот
+отметил удаленными (delete_date), и страницы из команды delete. ./search и
+query_eval.py ищут сразу по основному индексу и всем сегментам. doc_id
+выгруженных документов берутся из реестра doc_registry.py, поэтому
+глобальный doc_id в сегментах совпадает с doc_id полной выгрузки, а
+прежние doc_id скрываемых документов реестр отдает сам - сегменты для этого
+не просматриваются. Только add --tsv (без реестра) ищет старые версии по
+URL проходом по документам всех сегментов.
+
+Сегменты сливаются по уровням размера: как только MERGE_FACTOR соседних
+сегментов оказываются на одном уровне (MIN_SEGMENT_DOCS, x MERGE_FACTOR, ...),
+они сливаются в один через ./build_index --merge; сегмент, в котором
+удалено не меньше COMPACT_RATIO документов, переписывается без них.
+Удаленные документы при слиянии отбрасываются. Манифест заменяется
+атомарно; файлы сегментов, выпавших из манифеста, удаляются при следующем
+запуске, когда ни один поисковый процесс их уже не загружает.
+
+Запуск из корня проекта:
+    python3 scripts/update_index.py init index_stemmed [--since UNIX_TIME]
+    python3 scripts/update_index.py add index_stemmed [--tsv delta.tsv]
+    python3 scripts/update_index.py merge index_stemmed
+    python3 scripts/update_index.py delete index_stemmed URL [URL ...]
+    python3 scripts/update_index.py watch index_stemmed --interval 60
+    python3 scripts/update_index.py rebuild index_stemmed [--tsv full.tsv]
+
+rebuild - полное перестроение основного индекса: новый индекс уже содержит
+все документы дельта-сегментов, поэтому манифест сбрасывается до одного
+основного индекса с новым watermark. Перестроение мимо rebuild при
+существующем манифесте дает пересекающиеся диапазоны doc_id, и поиск
+отказывается загружать такой набор сегментов.
+"""
+
+import argparse
+import fcntl
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_reader import FLAG_BITMAPS, FLAG_COMPRESSED, FLAG_STEMMED, read_metadata
+from index_reader import IndexReader
+from index_segments import (
+    SegmentEntry, check_segments, delete_documents, find_urls, manifest_path, max_doc_id, read_deleted,
+    read_manifest, segment_path, write_deleted, write_manifest
+)
+
+BUILD_INDEX = './build_index'
+MERGE_FACTOR = 4
+MIN_SEGMENT_DOCS = 1000
+COMPACT_RATIO = 0.3
+
+
+class SegmentLock:
+    """Эксклюзивная блокировка манифеста на время add/merge"""
+
+    def __init__(self, index_path):
+        self.path = f"{manifest_path(index_path)}.lock"
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'w')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def load_manifest(index_path):
+    entries, watermark = read_manifest(index_path)
+    if entries is None:
+        print(f"Нет манифеста сегментов, сначала: update_index.py init {index_path}")
+        sys.exit(1)
+
+    try:
+        check_segments(segments_of(index_path, entries))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    return entries, watermark
+
+
+def next_segment_name(index_path, entries):
+    prefix = os.path.basename(index_path)
+    pattern = re.compile(re.escape(prefix) + r'\.seg(\d+)\.')
+    used = [0]
+
+    for name in os.listdir(os.path.dirname(os.path.abspath(index_path))):
+        match = pattern.match(name)
+        if match:
+            used.append(int(match.group(1)))
+    for entry in entries:
+        match = pattern.match(entry.name + '.')
+        if match:
+            used.append(int(match.group(1)))
+
+    return f"{prefix}.seg{max(used) + 1}"
+
+
+def remove_unused_segments(index_path, entries):
+    """Удалить файлы сегментов, которых больше нет в манифесте"""
+    prefix = os.path.basename(index_path)
+    pattern = re.compile(re.escape(prefix) + r'\.seg\d+\.(meta|forward|inverted|deleted)$')
+    listed = {entry.name for entry in entries}
+    directory = os.path.dirname(os.path.abspath(index_path))
+
+    for name in os.listdir(directory):
+        if pattern.match(name) and name.rsplit('.', 1)[0] not in listed:
+            os.remove(os.path.join(directory, name))
+
+
+def segments_of(index_path, entries):
+    """(base, путь) сегментов манифеста для delete_documents"""
+    return [(entry.base, segment_path(index_path, entry.name)) for entry in entries]
+
+
+def build_options(index_path, entries):
+    # Стемминг - как в основном индексе; сегменты без сжатия, чтобы их можно
+    # было сливать
+    metadata = read_metadata(f"{segment_path(index_path, entries[0].name)}.meta")
+    return ['--stemming'] if metadata.flags & FLAG_STEMMED else []
+
+
+def rebuild_options(index_path):
+    """Опции build_index по флагам текущего основного индекса"""
+    try:
+        flags = read_metadata(f"{index_path}.meta").flags
+    except FileNotFoundError:
+        return ['--stemming']
+
+    options = []
+    for flag, option in ((FLAG_STEMMED, '--stemming'), (FLAG_COMPRESSED, '--compress'),
+                         (FLAG_BITMAPS, '--bitmaps')):
+        if flags & flag:
+            options.append(option)
+    return options
+
+
+def rebuild(index_path, tsv_path=None):
+    """Полностью перестроить основной индекс и сбросить манифест сегментов"""
+    entries, _ = read_manifest(index_path)
+    options = rebuild_options(index_path)
+    directory = os.path.dirname(os.path.abspath(index_path))
+    name = os.path.basename(index_path)
+
+    # Изменения, пойманные выгрузкой и после нее, доберет следующий add:
+    # повтор URL скрывает прежнюю версию
+    watermark = int(time.time())
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        path = os.path.join(tmp, name)
+        if tsv_path is None:
+            from export_for_indexer_tsv import export_documents
+            from doc_stream import FORMAT_FRAMED
+
+            build = subprocess.Popen([BUILD_INDEX, '-', path] + options,
+                                     stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+            try:
+                export_documents(build.stdin, FORMAT_FRAMED)
+            finally:
+                build.stdin.close()
+            if build.wait() != 0:
+                raise subprocess.CalledProcessError(build.returncode, BUILD_INDEX)
+        else:
+            subprocess.run([BUILD_INDEX, tsv_path, path] + options,
+                           check=True, stdout=subprocess.DEVNULL)
+
+        # Сначала манифест из одного основного индекса: до замены файлов
+        # поиск видит старый индекс без дельт, а не пересекающийся набор.
+        # .meta заменяется последним - по нему поиск замечает новую версию
+        if entries is not None:
+            write_manifest(index_path, [SegmentEntry(0, name)], watermark)
+        for suffix in ('forward', 'inverted', 'meta'):
+            os.replace(f"{path}.{suffix}", f"{index_path}.{suffix}")
+
+    # Отметки удаления относились к doc_id старого индекса
+    try:
+        os.remove(f"{index_path}.deleted")
+    except FileNotFoundError:
+        pass
+
+    if entries is not None:
+        remove_unused_segments(index_path, [SegmentEntry(0, name)])
+        print(f"Манифест сброшен: {name}, watermark {watermark}")
+    print(f"Индекс {index_path} перестроен")
+
+
+def init(index_path, since):
+    if read_manifest(index_path)[0] is not None:
+        print(f"Манифест уже есть: {manifest_path(index_path)}")
+        return
+
+    if since is None:
+        since = read_metadata(f"{index_path}.meta").timestamp
+
+    write_manifest(index_path, [SegmentEntry(0, os.path.basename(index_path))], since)
+    print(f"Создан {manifest_path(index_path)}, watermark {since}")
+
+
+def add_segment(index_path, tsv_path=None):
+    """Построить дельта-сегмент из изменений после watermark (или из TSV)"""
+    entries, watermark = load_manifest(index_path)
+    remove_unused_segments(index_path, entries)
+
+    name = next_segment_name(index_path, entries)
+    path = segment_path(index_path, name)
+    directory = os.path.dirname(os.path.abspath(index_path))
+
+    # Сегмент начинается сразу за диапазоном doc_id последнего сегмента
+    last = entries[-1]
+    base = last.base + max_doc_id(segment_path(index_path, last.name))
+
+    stale_ids = None
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        if tsv_path is None:
+            from export_for_indexer_tsv import export_changes, read_deletes
+
+            tsv_path = os.path.join(tmp, 'delta.docs')
+            exported, deleted, watermark = export_changes(tsv_path, watermark, base)
+            print(f"Изменено документов: {exported}, удалено: {deleted}")
+
+            # Прежние версии и удаленные роботом страницы - doc_id из реестра
+            stale_ids = read_deletes(tsv_path)
+            if exported == 0:
+                delete_documents(segments_of(index_path, entries), stale_ids)
+                write_manifest(index_path, entries, watermark)
+                return None
+
+        cmd = [BUILD_INDEX, tsv_path, path] + build_options(index_path, entries)
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+    # Новые версии скрывают старые: отметки в .deleted пишутся до манифеста,
+    # поисковые процессы перезагружаются по новому манифесту и видят все сразу
+    with IndexReader(path) as reader:
+        docs = [(doc.doc_id, doc.url) for doc in reader.iter_documents()]
+
+    # Повторы URL внутри самого сегмента (входной TSV): виден последний
+    latest = {url: doc_id for doc_id, url in docs}
+    stale = [doc_id for doc_id, url in docs if latest[url] != doc_id]
+    if stale:
+        write_deleted(path, stale)
+
+    urls = list(latest)
+    if stale_ids is None:
+        stale_ids = find_urls(segments_of(index_path, entries), urls)
+    replaced = delete_documents(segments_of(index_path, entries), stale_ids)
+
+    entries.append(SegmentEntry(base, name))
+    write_manifest(index_path, entries, watermark)
+
+    print(f"Добавлен сегмент {name}: {len(urls)} документов, base {base}, "
+          f"скрыто прежних версий: {replaced}")
+    return name
+
+
+def delete_urls(index_path, urls):
+    """Скрыть документы с данными URL во всех сегментах (doc_id - из реестра)"""
+    from pymongo import MongoClient
+    from doc_registry import DocIdRegistry
+
+    entries, watermark = load_manifest(index_path)
+    client = MongoClient('localhost', 27017)
+    try:
+        doc_ids = DocIdRegistry(client['turkish_wiki_search']).lookup(urls)
+    finally:
+        client.close()
+    marked = delete_documents(segments_of(index_path, entries), doc_ids.values())
+
+    if marked:
+        # Новый манифест - сигнал веб-интерфейсу перезапустить поиск
+        write_manifest(index_path, entries, watermark)
+    print(f"Отмечено удаленными: {marked}")
+    return marked
+
+
+def tier(docs):
+    level = 0
+    limit = MIN_SEGMENT_DOCS
+    while docs >= limit:
+        level += 1
+        limit *= MERGE_FACTOR
+    return level
+
+
+def find_merge(index_path, entries):
+    """Номера сегментов в манифесте для следующего слияния: первые MERGE_FACTOR
+    соседних сегментов одного уровня или один сегмент с большой долей
+    удаленных документов"""
+    run = []
+    run_tier = None
+
+    for i, entry in enumerate(entries):
+        path = segment_path(index_path, entry.name)
+        metadata = read_metadata(f"{path}.meta")
+
+        # Сжатый основной индекс в слиянии не участвует
+        if metadata.flags & (FLAG_COMPRESSED | FLAG_BITMAPS):
+            run = []
+            continue
+
+        deleted = len(read_deleted(path))
+        if deleted and deleted >= metadata.total_documents * COMPACT_RATIO:
+            return [i]
+
+        level = tier(metadata.total_documents - deleted)
+        if run and level != run_tier:
+            run = []
+        run.append(i)
+        run_tier = level
+
+        if len(run) == MERGE_FACTOR:
+            return run
+
+    return None
+
+
+def merge_segments(index_path):
+    """Слить сегменты по уровням, пока есть что сливать; число слияний"""
+    entries, watermark = load_manifest(index_path)
+    remove_unused_segments(index_path, entries)
+    merges = 0
+
+    while True:
+        run = find_merge(index_path, entries)
+        if run is None:
+            return merges
+
+        first = entries[run[0]]
+        name = next_segment_name(index_path, entries)
+        cmd = [BUILD_INDEX, '--merge', segment_path(index_path, name)]
+
+        for i in run:
+            entry = entries[i]
+            cmd += ['--doc-id-offset', str(entry.base - first.base),
+                    segment_path(index_path, entry.name)]
+        cmd += build_options(index_path, entries)
+
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+        merged = [entries[i].name for i in run]
+        entries[run[0]:run[-1] + 1] = [SegmentEntry(first.base, name)]
+        write_manifest(index_path, entries, watermark)
+        merges += 1
+
+        if len(merged) == 1:
+            print(f"Удаленные документы вычищены: {merged[0]} -> {name}")
+        else:
+            print(f"Слиты {', '.join(merged)} -> {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Инкрементальное обновление индекса')
+    parser.add_argument('command', choices=['init', 'add', 'merge', 'watch', 'delete', 'rebuild'])
+    parser.add_argument('index', help='базовое имя основного индекса')
+    parser.add_argument('urls', nargs='*', help='delete: URL удаленных страниц')
+    parser.add_argument('--since', type=int, help='init: watermark (unix time)')
+    parser.add_argument('--tsv', help='add, rebuild: готовый TSV вместо выгрузки из MongoDB')
+    parser.add_argument('--interval', type=int, default=60, help='watch: период (сек)')
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        init(args.index, args.since)
+        return
+
+    if args.command == 'watch':
+        print(f"Обновление {args.index} каждые {args.interval} сек (Ctrl+C - остановка)")
+        while True:
+            try:
+                with SegmentLock(args.index):
+                    add_segment(args.index)
+                    merge_segments(args.index)
+            except Exception as e:
+                # MongoDB или диск недоступны - повторим в следующий раз
+                print(f"Ошибка обновления: {e}")
+            time.sleep(args.interval)
+
+    with SegmentLock(args.index):
+        if args.command == 'add':
+            add_segment(args.index, args.tsv)
+        elif args.command == 'delete':
+            delete_urls(args.index, args.urls)
+        elif args.command == 'rebuild':
+            rebuild(args.index, args.tsv)
+        else:
+            merge_segments(args.index)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пакетная загрузка статей через MediaWiki API
+
+action=parse отдает HTML только одной страницы за запрос. action=query с
+prop=revisions принимает до BATCH_TITLES названий через "|" и возвращает
+викитекст последней версии каждой страницы, так что пачка случайных
+статей или старых документов для переобкачки скачивается одним-двумя
+запросами вместо BATCH_TITLES. (prop=extracts с полным текстом статьи
+отдает только одну страницу за запрос, поэтому для пакетов не подходит.)
+
+Если викитекст пачки не помещается в один ответ, API возвращает часть
+страниц и блок continue; запросы повторяются с его параметрами, пока у всех
+страниц не будет текста. Перенаправления и нормализация названий
+сопоставляются обратно с запрошенными названиями.
+"""
+
+import itertools
+import urllib.parse
+
+BATCH_TITLES = 50       # предел titles для prop=revisions с содержимым
+
+
+def batches(items, size=BATCH_TITLES):
+    """items (список или курсор) списками по size"""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _resolve(title, query):
+    """Название страницы, в которую API превратил запрошенное title"""
+    for key in ('normalized', 'redirects'):
+        for entry in query.get(key, []):
+            if entry['from'] == title:
+                title = entry['to']
+    return title
+
+
+def fetch_revisions(get_json, base_url, titles):
+    """{запрошенное название: статья} для не более BATCH_TITLES названий
+
+    Статья - {'wikitext', 'title', 'pageid', 'revid'} или {'missing': True}
+    для страниц, которых в Википедии нет. get_json(url) - JSON ответа
+    (HttpClient.get_json); сетевые ошибки не перехватываются.
+    """
+    params = {
+        'action': 'query',
+        'format': 'json',
+        'formatversion': 2,
+        'prop': 'revisions',
+        'rvprop': 'ids|content',
+        'rvslots': 'main',
+        'redirects': 1,
+        'titles': '|'.join(titles),
+    }
+
+    pages = {}
+    query = {}
+    continuation = {}
+
+    while True:
+        url = base_url + '?' + urllib.parse.urlencode({**params, **continuation})
+        data = get_json(url)
+        if 'error' in data:
+            raise IOError(f"MediaWiki API: {data['error'].get('info', data['error'])}")
+
+        part = data.get('query', {})
+        for key in ('normalized', 'redirects'):
+            query.setdefault(key, []).extend(part.get(key, []))
+
+        for page in part.get('pages', []):
+            known = pages.setdefault(page['title'], page)
+            if 'revisions' in page:
+                known['revisions'] = page['revisions']
+
+        continuation = data.get('continue')
+        if not continuation:
+            break
+
+    articles = {}
+    for title in titles:
+        page = pages.get(_resolve(title, query))
+        if page is None:
+            continue
+        if page.get('missing') or page.get('invalid'):
+            articles[title] = {'missing': True}
+            continue
+        if not page.get('revisions'):
+            continue
+
+        revision = page['revisions'][0]
+        articles[title] = {
+            'wikitext': revision['slots']['main'].get('content', ''),
+            'title': page['title'],
+            'pageid': page['pageid'],
+            'revid': revision['revid'],
+        }
+
+    return articles
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пул долгоживущих процессов ./search для веб-интерфейса
+
+Каждый процесс один раз загружает индекс и дальше работает в
+интерактивном режиме (--window --json): строка "<offset> <limit> <запрос>"
+пишется в stdin, ответ с нужным окном результатов приходит из stdout
+одной строкой JSON. Упавшие процессы перезапускаются.
+"""
+
+import json
+import os
+import queue
+import select
+import subprocess
+import time
+
+# Размер буфера строки в search.cpp (char line[1024]) с учетом '\n'
+MAX_LINE_BYTES = 1022
+
+
+class SearchError(Exception):
+    """Поисковый процесс не смог ответить на запрос"""
+
+
+class SearchTimeout(SearchError):
+    """Поисковый процесс не ответил за отведенное время"""
+
+
+class SearchWorker:
+    """Один процесс ./search, обслуживающий запросы через pipe"""
+
+    def __init__(self, search_bin, index_path):
+        self.search_bin = search_bin
+        self.index_path = index_path
+        self.proc = None
+        self._buffer = b''
+        self.start()
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            [self.search_bin, self.index_path, '--window', '--json'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self._buffer = b''
+        self._ready = False
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        if self.proc:
+            self.proc.stdin.close()
+            self.proc.stdout.close()
+        self.proc = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def _read_json(self, deadline):
+        fd = self.proc.stdout.fileno()
+
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise SearchTimeout("Запрос выполнялся слишком долго (таймаут)")
+
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise SearchError("Поисковый процесс завершился")
+            self._buffer += chunk
+
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        try:
+            return json.loads(line.decode('utf-8', errors='replace'))
+        except ValueError:
+            raise SearchError("Некорректный ответ поискового процесса")
+
+    def query(self, line, timeout):
+        deadline = time.time() + timeout
+
+        try:
+            self.proc.stdin.write(line + b'\n')
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise SearchError(f"Поисковый процесс недоступен: {e}")
+
+        if not self._ready:
+            # Первая строка - {"documents": ..., "terms": ...} после загрузки индекса
+            self._read_json(deadline)
+            self._ready = True
+
+        response = self._read_json(deadline)
+        if 'error' in response:
+            raise SearchError(response['error'])
+
+        for item in response['results']:
+            item['title'] = item['title'][:200]
+
+        return {
+            'total': response['total'],
+            'engine_time_ms': response['time_ms'],
+            'results': response['results']
+        }
+
+
+class SearchPool:
+    """Пул процессов ./search с раздачей запросов свободным процессам"""
+
+    def __init__(self, search_bin, index_path, size):
+        self.size = max(1, size)
+        self._closed = False
+        self._idle = queue.Queue()
+
+        for _ in range(self.size):
+            self._idle.put(SearchWorker(search_bin, index_path))
+
+    def search(self, query, offset=0, limit=50, timeout=5):
+        """Всего найдено и результаты из окна [offset, offset + limit)"""
+        query = query.replace('\r', ' ').replace('\n', ' ')
+
+        if not query:
+            return {'total': 0, 'engine_time_ms': 0.0, 'results': []}
+
+        line = f"{offset} {limit} {query}".encode('utf-8')
+        if len(line) > MAX_LINE_BYTES:
+            raise SearchError("Слишком длинный запрос")
+
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise SearchTimeout("Все поисковые процессы заняты (таймаут)")
+
+        try:
+            if not worker.is_alive():
+                worker.restart()
+            return worker.query(line, timeout)
+        except SearchError:
+            # Состояние pipe после сбоя неизвестно - начинаем с чистого процесса
+            if not self._closed:
+                worker.restart()
+            raise
+        finally:
+            if self._closed:
+                worker.stop()
+            else:
+                self._idle.put(worker)
+
+    def close(self):
+        """Остановить свободные процессы; занятые остановятся после ответа"""
+        self._closed = True
+
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
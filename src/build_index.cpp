@@ -3,40 +3,132 @@
 #include <cstring>
 #include <ctime>
 #include <sys/time.h>
+#include <zlib.h>
 
-bool parse_tsv_line(const char* line, uint32_t& doc_id, char* url, char* title, char* content) {
-    const char* p = line;
+// Поток документов на входе build_index (форматы - scripts/doc_stream.py):
+// TSV "doc_id\turl\ttitle\tcontent" по строке на документ или кадры
+// [u32 doc_id][u32 url_len][u32 title_len][u32 content_len][url][title][content]
+// после заголовка DOCS_MAGIC. Оба варианта могут быть сжаты gzip (zlib
+// распаковывает прозрачно, в том числе склеенные gzip-члены); "-" - stdin.
+// Длина документа ничем не ограничена: буфер растет под самый длинный.
+static const char DOCS_MAGIC[8] = {'S', 'D', 'O', 'C', 'S', '\0', '\1', '\n'};
+static const uint32_t MAX_FIELD_LENGTH = 1u << 30;
+
+struct DocumentReader {
+    gzFile file;
+    bool framed;
+    char* buffer;
+    size_t capacity;
     
-    doc_id = atoi(p);
+    DocumentReader() : file(nullptr), framed(false), buffer(nullptr), capacity(0) {}
     
-    while (*p && *p != '\t') p++;
-    if (!*p) return false;
-    p++;
+    ~DocumentReader() {
+        if (file) gzclose(file);
+        free(buffer);
+    }
     
-    int i = 0;
-    while (*p && *p != '\t' && i < 511) {
-        url[i++] = *p++;
+    bool open(const char* path) {
+        file = strcmp(path, "-") == 0 ? gzdopen(0, "rb") : gzopen(path, "rb");
+        if (!file) return false;
+        gzbuffer(file, 1 << 20);
+        
+        // Строка TSV начинается с цифры, поток кадров - с DOCS_MAGIC
+        int c = gzgetc(file);
+        if (c == DOCS_MAGIC[0]) {
+            char magic[sizeof(DOCS_MAGIC)];
+            magic[0] = (char)c;
+            if (gzread(file, magic + 1, sizeof(magic) - 1) != (int)sizeof(magic) - 1 ||
+                memcmp(magic, DOCS_MAGIC, sizeof(magic)) != 0) {
+                fprintf(stderr, "Неизвестный формат входного файла: %s\n", path);
+                return false;
+            }
+            framed = true;
+        } else if (c != -1) {
+            gzungetc(c, file);
+        }
+        return true;
     }
-    url[i] = '\0';
-    if (!*p) return false;
-    p++;
     
-    i = 0;
-    while (*p && *p != '\t' && i < 511) {
-        title[i++] = *p++;
+    bool reserve(size_t size) {
+        if (size <= capacity) return true;
+        size_t new_capacity = capacity ? capacity : 1 << 16;
+        while (new_capacity < size) new_capacity *= 2;
+        
+        char* grown = (char*)realloc(buffer, new_capacity);
+        if (!grown) return false;
+        buffer = grown;
+        capacity = new_capacity;
+        return true;
     }
-    title[i] = '\0';
-    if (!*p) return false;
-    p++;
     
-    i = 0;
-    while (*p && *p != '\n' && *p != '\r' && i < 99999) {
-        content[i++] = *p++;
+    // 1 - документ прочитан, 0 - конец входа, -1 - запись пропущена (ошибка
+    // разбора), -2 - вход оборван или поврежден. Строки живут до следующего next
+    int next(uint32_t& doc_id, const char*& url, const char*& title, const char*& content) {
+        return framed ? next_frame(doc_id, url, title, content)
+                      : next_line(doc_id, url, title, content);
     }
-    content[i] = '\0';
     
-    return doc_id > 0 && url[0] && content[0];
-}
+    int next_frame(uint32_t& doc_id, const char*& url, const char*& title, const char*& content) {
+        uint32_t header[4];
+        int got = gzread(file, header, sizeof(header));
+        if (got == 0) return 0;
+        if (got != (int)sizeof(header) || header[1] > MAX_FIELD_LENGTH ||
+            header[2] > MAX_FIELD_LENGTH || header[3] > MAX_FIELD_LENGTH) {
+            return -2;
+        }
+        
+        size_t lengths[3] = {header[1], header[2], header[3]};
+        if (!reserve(lengths[0] + lengths[1] + lengths[2] + 3)) return -2;
+        
+        char* fields[3];
+        size_t pos = 0;
+        for (int i = 0; i < 3; i++) {
+            fields[i] = buffer + pos;
+            if (lengths[i] > 0 && gzread(file, fields[i], (unsigned)lengths[i]) != (int)lengths[i]) {
+                return -2;
+            }
+            fields[i][lengths[i]] = '\0';
+            pos += lengths[i] + 1;
+        }
+        
+        doc_id = header[0];
+        url = fields[0];
+        title = fields[1];
+        content = fields[2];
+        return doc_id > 0 && url[0] && content[0] ? 1 : -1;
+    }
+    
+    int next_line(uint32_t& doc_id, const char*& url, const char*& title, const char*& content) {
+        // Строка целиком, сколько бы она ни занимала
+        size_t length = 0;
+        for (;;) {
+            if (!reserve(length + (1 << 16))) return -2;
+            if (!gzgets(file, buffer + length, (int)(capacity - length))) break;
+            length += strlen(buffer + length);
+            if (length > 0 && buffer[length - 1] == '\n') break;
+        }
+        if (length == 0) return 0;
+        
+        while (length > 0 && (buffer[length - 1] == '\n' || buffer[length - 1] == '\r')) {
+            buffer[--length] = '\0';
+        }
+        
+        char* fields[4];
+        fields[0] = buffer;
+        for (int i = 1; i < 4; i++) {
+            char* tab = strchr(fields[i - 1], '\t');
+            if (!tab) return -1;
+            *tab = '\0';
+            fields[i] = tab + 1;
+        }
+        
+        doc_id = strtoul(fields[0], nullptr, 10);
+        url = fields[1];
+        title = fields[2];
+        content = fields[3];
+        return doc_id > 0 && url[0] && content[0] ? 1 : -1;
+    }
+};
 
 double get_time() {
     struct timeval tv;
@@ -44,14 +136,85 @@ double get_time() {
     return tv.tv_sec + tv.tv_usec / 1000000.0;
 }
 
+// Слияние индексов-шардов, построенных по непересекающимся диапазонам
+// документов: build_index --merge <output> <shard> [<shard> ...] [опции].
+// --doc-id-offset N перед шардом сдвигает его doc_id на N
+int merge_shards(int argc, char** argv) {
+    const char* output_base = argv[2];
+    IndexOptions opts;
+    opts.run_prefix = output_base;
+    
+    for (int i = 3; i < argc; i++) {
+        if (strcmp(argv[i], "--stemming") == 0) {
+            opts.use_stemming = true;
+        } else if (strcmp(argv[i], "--compress") == 0) {
+            opts.use_compression = true;
+        } else if (strcmp(argv[i], "--bitmaps") == 0) {
+            opts.use_bitmaps = true;
+        }
+    }
+    
+    printf("=== СЛИЯНИЕ ШАРДОВ ===\n");
+    printf("Базовое имя индекса: %s\n", output_base);
+    
+    Indexer indexer;
+    indexer.set_options(opts);
+    
+    double start_time = get_time();
+    int shards = 0;
+    uint32_t doc_id_offset = 0;
+    
+    for (int i = 3; i < argc; i++) {
+        if (strcmp(argv[i], "--doc-id-offset") == 0 && i + 1 < argc) {
+            doc_id_offset = strtoul(argv[++i], nullptr, 10);
+            continue;
+        }
+        if (strncmp(argv[i], "--", 2) == 0) continue;
+        
+        if (!indexer.add_shard(argv[i], doc_id_offset)) {
+            return 1;
+        }
+        doc_id_offset = 0;
+        shards++;
+    }
+    
+    if (shards == 0) {
+        fprintf(stderr, "Не заданы шарды для слияния\n");
+        return 1;
+    }
+    printf("Шардов: %d\n\n", shards);
+    
+    if (!indexer.save_to_file(output_base)) {
+        fprintf(stderr, "Ошибка сохранения индекса\n");
+        return 1;
+    }
+    
+    printf("Время слияния: %.2f сек\n", get_time() - start_time);
+    printf("\nИндекс построен успешно!\n");
+    
+    return 0;
+}
+
 int main(int argc, char** argv) {
+    if (argc >= 4 && strcmp(argv[1], "--merge") == 0) {
+        return merge_shards(argc, argv);
+    }
+    
     if (argc < 3) {
-        printf("Использование: %s <input.tsv> <output_index_base> [--stemming]\n", argv[0]);
+        printf("Использование: %s <input.tsv|input.docs[.gz]|-> <output_index_base> [--stemming] [--compress] [--bitmaps] [--memory-budget MB]\n", argv[0]);
         printf("\nПример:\n");
         printf("  %s indexer_input.tsv index\n", argv[0]);
         printf("  %s indexer_input.tsv index_stemmed --stemming\n", argv[0]);
+        printf("  %s indexer_input.docs.gz index_stemmed --stemming\n", argv[0]);
         printf("\nОпции:\n");
         printf("  --stemming  Включить стемминг (ЛР5)\n");
+        printf("  --compress  Сжатые постинг-листы (блоки дельт в varint)\n");
+        printf("  --bitmaps   Частые термы (в каждом 16-м документе и чаще) - битовыми картами\n");
+        printf("  --memory-budget MB  Ограничить память под обратный индекс: частичные\n");
+        printf("              индексы пишутся в <output>.run<N> и сливаются в конце\n");
+        printf("\nСлияние шардов (индексов без --compress и --bitmaps, построенных\n");
+        printf("по идущим подряд диапазонам документов):\n");
+        printf("  %s --merge <output_index_base> [--doc-id-offset N] <shard_base> ... [--stemming] [--compress] [--bitmaps]\n", argv[0]);
         printf("\nСоздаст файлы: <output>.meta, <output>.forward, <output>.inverted\n");
         return 1;
     }
@@ -59,35 +222,53 @@ int main(int argc, char** argv) {
     const char* input_file = argv[1];
     const char* output_base = argv[2];
     bool use_stemming = false;
+    bool use_compression = false;
+    bool use_bitmaps = false;
+    size_t memory_budget_mb = 0;
     
     for (int i = 3; i < argc; i++) {
         if (strcmp(argv[i], "--stemming") == 0) {
             use_stemming = true;
+        } else if (strcmp(argv[i], "--compress") == 0) {
+            use_compression = true;
+        } else if (strcmp(argv[i], "--bitmaps") == 0) {
+            use_bitmaps = true;
+        } else if (strcmp(argv[i], "--memory-budget") == 0 && i + 1 < argc) {
+            memory_budget_mb = strtoul(argv[++i], nullptr, 10);
         }
     }
     
     printf("=== ПОСТРОЕНИЕ ИНДЕКСА ===\n");
     printf("Входной файл: %s\n", input_file);
     printf("Базовое имя индекса: %s\n", output_base);
-    printf("Стемминг: %s\n\n", use_stemming ? "ВКЛ" : "ВЫКЛ");
+    printf("Стемминг: %s\n", use_stemming ? "ВКЛ" : "ВЫКЛ");
+    printf("Сжатие постингов: %s\n", use_compression ? "ВКЛ" : "ВЫКЛ");
+    printf("Битовые карты: %s\n", use_bitmaps ? "ВКЛ" : "ВЫКЛ");
+    if (memory_budget_mb) {
+        printf("Бюджет памяти: %zu МБ\n\n", memory_budget_mb);
+    } else {
+        printf("Бюджет памяти: без ограничения\n\n");
+    }
     
-    FILE* f = fopen(input_file, "r");
-    if (!f) {
+    DocumentReader reader;
+    if (!reader.open(input_file)) {
         fprintf(stderr, "Ошибка открытия файла: %s\n", input_file);
         return 1;
     }
     
     Indexer indexer;
     
-    if (use_stemming) {
-        IndexOptions opts;
-        opts.use_stemming = true;
-        indexer.set_options(opts);
-    }
+    IndexOptions opts;
+    opts.use_stemming = use_stemming;
+    opts.use_compression = use_compression;
+    opts.use_bitmaps = use_bitmaps;
+    opts.memory_budget = memory_budget_mb * 1024 * 1024;
+    opts.run_prefix = output_base;
+    indexer.set_options(opts);
     
-    char line[200000];
-    char url[512], title[512];
-    char* content = new char[100000];
+    const char* url;
+    const char* title;
+    const char* content;
     uint32_t doc_id;
     
     int processed = 0;
@@ -98,8 +279,13 @@ int main(int argc, char** argv) {
     
     printf("Чтение и индексация документов...\n");
     
-    while (fgets(line, sizeof(line), f)) {
-        if (parse_tsv_line(line, doc_id, url, title, content)) {
+    int status;
+    while ((status = reader.next(doc_id, url, title, content)) != 0) {
+        if (status == -2) {
+            fprintf(stderr, "\nВходной файл оборван или поврежден: %s\n", input_file);
+            return 1;
+        }
+        if (status == 1) {
             indexer.add_document(doc_id, url, title, content);
             processed++;
             
@@ -124,9 +310,6 @@ int main(int argc, char** argv) {
     printf("Время обработки: %.2f сек\n", parse_time);
     printf("Скорость: %.1f док/сек\n\n", processed / parse_time);
     
-    fclose(f);
-    delete[] content;
-    
     printf("Сортировка индекса...\n");
     double sort_start = get_time();
     indexer.sort_index();
@@ -13,6 +13,19 @@ int main(int argc, char** argv) {
     const char* base_path = argv[1];
     char path[512];
     
+    // Флаги формата из метаданных (сжатые постинги и битовые карты
+    // хранят размер payload)
+    IndexMetadata metadata;
+    snprintf(path, sizeof(path), "%s.meta", base_path);
+    FILE* meta_file = fopen(path, "rb");
+    if (!meta_file || fread(&metadata, sizeof(metadata), 1, meta_file) != 1 ||
+        metadata.magic != INDEX_MAGIC || metadata.version != INDEX_VERSION) {
+        fprintf(stderr, "Ошибка чтения метаданных: %s\n", path);
+        if (meta_file) fclose(meta_file);
+        return 1;
+    }
+    fclose(meta_file);
+    
     // Загрузка inverted index напрямую
     snprintf(path, sizeof(path), "%s.inverted", base_path);
     FILE* f = fopen(path, "rb");
@@ -36,7 +49,7 @@ int main(int argc, char** argv) {
     
     printf("Всего термов: %u\n\n", num_terms);
     printf("Первые 100 термов:\n");
-    printf("%-40s %10s\n", "Терм", "DF");
+    printf("%-40s %10s %8s\n", "Терм", "DF", "Формат");
     printf("%s\n", "-------------------------------------------------------------");
     
     // Читаем первые 100 термов
@@ -51,10 +64,23 @@ int main(int argc, char** argv) {
         uint32_t df;
         if (fread(&df, 4, 1, f) != 1) break;
         
-        printf("%-40s %10u\n", term, df);
+        uint8_t encoding = POSTING_LIST;
+        if ((metadata.flags & FLAG_BITMAPS) && fread(&encoding, 1, 1, f) != 1) break;
+        
+        printf("%-40s %10u %8s\n", term, df, encoding == POSTING_BITMAP ? "карта" : "список");
         
         // Пропускаем doc IDs
-        fseek(f, df * 4, SEEK_CUR);
+        if (encoding == POSTING_BITMAP) {
+            uint32_t payload_size;
+            if (fread(&payload_size, 4, 1, f) != 1) break;
+            fseek(f, payload_size, SEEK_CUR);
+        } else if (metadata.flags & FLAG_COMPRESSED) {
+            uint32_t payload_size;
+            if (!read_varint(f, payload_size)) break;
+            fseek(f, payload_size, SEEK_CUR);
+        } else {
+            fseek(f, df * 4, SEEK_CUR);
+        }
     }
     
     fclose(f);
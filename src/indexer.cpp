@@ -5,13 +5,17 @@
 #include <ctime>
 #include <cctype>
 
-Indexer::Indexer() : inverted_index(100000) {
+Indexer::Indexer() : inverted_index(100000), index_memory(0), run_error(false) {
     metadata.magic = INDEX_MAGIC;
     metadata.version = INDEX_VERSION;
-    metadata.flags = 0;
+    metadata.flags = FLAG_DOC_TABLE | FLAG_TERM_TABLE;
     metadata.total_documents = 0;
     metadata.total_unique_terms = 0;
     metadata.timestamp = time(nullptr);
+    metadata.forward_offset = 0;
+    metadata.forward_size = 0;
+    metadata.inverted_offset = 0;
+    metadata.inverted_size = 0;
     memset(metadata.reserved, 0, sizeof(metadata.reserved));
 }
 
@@ -20,6 +24,16 @@ Indexer::~Indexer() {
         if (documents[i].url) delete[] documents[i].url;
         if (documents[i].title) delete[] documents[i].title;
     }
+    
+    for (size_t i = 0; i < run_paths.size; i++) {
+        remove(run_paths[i]);
+        delete[] run_paths[i];
+    }
+    
+    for (size_t i = 0; i < shards.size; i++) {
+        delete[] shards[i].inverted_path;
+        free(shards[i].deleted);
+    }
 }
 
 void Indexer::set_options(const IndexOptions& opts) {
@@ -27,6 +41,12 @@ void Indexer::set_options(const IndexOptions& opts) {
     if (options.use_stemming) {
         metadata.flags |= FLAG_STEMMED;
     }
+    if (options.use_compression) {
+        metadata.flags |= FLAG_COMPRESSED;
+    }
+    if (options.use_bitmaps) {
+        metadata.flags |= FLAG_BITMAPS;
+    }
 }
 
 bool Indexer::is_using_stemming() const {
@@ -94,6 +114,34 @@ void Indexer::add_document(uint32_t doc_id, const char* url, const char* title,
     tokenize_and_index(doc_id, title);
     
     metadata.total_documents++;
+    
+    // SPIMI: бюджет исчерпан - накопленный обратный индекс уходит на диск
+    if (options.memory_budget && index_memory >= options.memory_budget && !run_error) {
+        if (!flush_run()) run_error = true;
+    }
+}
+
+void Indexer::add_posting(const char* term, uint32_t doc_id) {
+    size_t terms_before = inverted_index.size();
+    DynamicArray<uint32_t>* doc_list = inverted_index.get_or_create(term);
+    
+    if (inverted_index.size() != terms_before) {
+        index_memory += sizeof(HashNode) + sizeof(DynamicArray<uint32_t>) + strlen(term) + 1;
+    }
+    
+    bool already_added = false;
+    for (size_t j = 0; j < doc_list->size; j++) {
+        if ((*doc_list)[j] == doc_id) {
+            already_added = true;
+            break;
+        }
+    }
+    
+    if (!already_added) {
+        size_t capacity_before = doc_list->capacity;
+        doc_list->push_back(doc_id);
+        index_memory += (doc_list->capacity - capacity_before) * sizeof(uint32_t);
+    }
 }
 
 void Indexer::tokenize_and_index(uint32_t doc_id, const char* text) {
@@ -126,20 +174,7 @@ void Indexer::tokenize_and_index(uint32_t doc_id, const char* text) {
                 }
                 
                 if (is_valid_term(token)) {
-                    DynamicArray<uint32_t>* doc_list = inverted_index.get_or_create(token);
-                    
-                    bool already_added = false;
-                    for (size_t j = 0; j < doc_list->size; j++) {
-                        if ((*doc_list)[j] == doc_id) {
-                            already_added = true;
-                            break;
-                        }
-                    }
-                    
-                    if (!already_added) {
-                        doc_list->push_back(doc_id);
-                    }
-                    
+                    add_posting(token, doc_id);
                     documents[documents.size - 1].token_count++;
                 }
             }
@@ -152,17 +187,7 @@ void Indexer::tokenize_and_index(uint32_t doc_id, const char* text) {
         token[token_pos] = '\0';
         to_lowercase(token);
         if (is_valid_term(token)) {
-            DynamicArray<uint32_t>* doc_list = inverted_index.get_or_create(token);
-            bool already_added = false;
-            for (size_t j = 0; j < doc_list->size; j++) {
-                if ((*doc_list)[j] == doc_id) {
-                    already_added = true;
-                    break;
-                }
-            }
-            if (!already_added) {
-                doc_list->push_back(doc_id);
-            }
+            add_posting(token, doc_id);
             documents[documents.size - 1].token_count++;
         }
     }
@@ -194,8 +219,412 @@ void Indexer::sort_index() {
     }
     
     metadata.total_unique_terms = inverted_index.size();
-    printf("Сортировка завершена. Уникальных термов: %u\n", 
-           metadata.total_unique_terms);
+    if (run_paths.size > 0) {
+        printf("Сортировка завершена. Частичных индексов на диске: %zu, "
+               "термов в памяти: %u\n", run_paths.size, metadata.total_unique_terms);
+    } else {
+        printf("Сортировка завершена. Уникальных термов: %u\n", 
+               metadata.total_unique_terms);
+    }
+}
+
+// Узлы inverted_index в порядке strcmp по термам, постинг-листы отсортированы
+HashNode** Indexer::sorted_terms(uint32_t& num_terms) {
+    num_terms = inverted_index.size();
+    HashNode** term_array = new HashNode*[num_terms];
+    uint32_t idx = 0;
+    
+    HashMap::Iterator it = inverted_index.get_iterator();
+    while (it.has_next()) {
+        HashNode* node = it.next();
+        if (node) {
+            qsort(node->doc_ids->data, node->doc_ids->size, sizeof(uint32_t), compare_uint32);
+            term_array[idx++] = node;
+        }
+    }
+    
+    qsort(term_array, num_terms, sizeof(HashNode*), compare_terms);
+    return term_array;
+}
+
+// Частичный индекс в формате несжатого .inverted: [u32 num_terms][u32 num_terms],
+// затем [u16 len][term][u32 df][u32 doc_ids[df]] в порядке strcmp по термам
+bool Indexer::flush_run() {
+    char path[512];
+    snprintf(path, sizeof(path), "%s.run%zu", options.run_prefix, run_paths.size);
+    
+    FILE* f = fopen(path, "wb");
+    if (!f) {
+        fprintf(stderr, "Ошибка создания частичного индекса: %s\n", path);
+        return false;
+    }
+    
+    uint32_t num_terms;
+    HashNode** term_array = sorted_terms(num_terms);
+    
+    bool ok = fwrite(&num_terms, sizeof(uint32_t), 1, f) == 1 &&
+              fwrite(&num_terms, sizeof(uint32_t), 1, f) == 1;
+    for (uint32_t i = 0; i < num_terms && ok; i++) {
+        HashNode* node = term_array[i];
+        uint16_t term_len = strlen(node->key);
+        uint32_t df = node->doc_ids->size;
+        
+        ok = fwrite(&term_len, sizeof(uint16_t), 1, f) == 1 &&
+             fwrite(node->key, 1, term_len, f) == term_len &&
+             fwrite(&df, sizeof(uint32_t), 1, f) == 1 &&
+             fwrite(node->doc_ids->data, sizeof(uint32_t), df, f) == df;
+    }
+    
+    delete[] term_array;
+    if (fclose(f) != 0) ok = false;
+    
+    char* saved_path = new char[strlen(path) + 1];
+    strcpy(saved_path, path);
+    run_paths.push_back(saved_path);
+    
+    if (!ok) {
+        fprintf(stderr, "Ошибка записи частичного индекса: %s\n", path);
+        return false;
+    }
+    
+    printf("\n  Частичный индекс %zu: %u термов, ~%.1f МБ -> %s\n",
+           run_paths.size, num_terms, index_memory / (1024.0 * 1024.0), path);
+    
+    inverted_index.clear();
+    index_memory = 0;
+    return true;
+}
+
+// Запись терма в .inverted в формате, заданном опциями; true - битовая карта
+bool Indexer::write_postings(FILE* inverted_file, const char* term, const uint32_t* doc_ids,
+                             uint32_t df, uint32_t max_doc_id, DynamicArray<uint8_t>& encoded) {
+    uint16_t term_len = strlen(term);
+    term_offsets.push_back(ftell(inverted_file));
+    
+    fwrite(&term_len, sizeof(uint16_t), 1, inverted_file);
+    fwrite(term, 1, term_len, inverted_file);
+    fwrite(&df, sizeof(uint32_t), 1, inverted_file);
+    
+    bool list_encoded = false;
+    if (options.use_bitmaps) {
+        // Карта пишется, только если она не длиннее постинг-листа того же
+        // терма: массивы контейнеров (2 байта на документ) проигрывают
+        // varint-дельтам сжатого списка, пока документы не идут подряд
+        bool bitmap = false;
+        if (use_bitmap_postings(df, max_doc_id)) {
+            bitmap_encoded.size = 0;
+            encode_bitmap(doc_ids, df, bitmap_encoded);
+            
+            size_t list_size = (size_t)df * sizeof(uint32_t);
+            if (options.use_compression) {
+                encoded.size = 0;
+                encode_postings(doc_ids, df, encoded);
+                list_encoded = true;
+                
+                uint8_t size_bytes[VARINT_MAX_BYTES];
+                list_size = write_varint(size_bytes, encoded.size) + encoded.size;
+            }
+            bitmap = sizeof(uint32_t) + bitmap_encoded.size <= list_size;
+        }
+        
+        uint8_t encoding = bitmap ? POSTING_BITMAP : POSTING_LIST;
+        fwrite(&encoding, 1, 1, inverted_file);
+        
+        if (bitmap) {
+            uint32_t payload_size = bitmap_encoded.size;
+            fwrite(&payload_size, sizeof(uint32_t), 1, inverted_file);
+            fwrite(bitmap_encoded.data, 1, payload_size, inverted_file);
+            return true;
+        }
+    }
+    
+    if (options.use_compression) {
+        if (!list_encoded) {
+            encoded.size = 0;
+            encode_postings(doc_ids, df, encoded);
+        }
+        
+        uint8_t size_bytes[VARINT_MAX_BYTES];
+        fwrite(size_bytes, 1, write_varint(size_bytes, encoded.size), inverted_file);
+        fwrite(encoded.data, 1, encoded.size, inverted_file);
+    } else {
+        fwrite(doc_ids, sizeof(uint32_t), df, inverted_file);
+    }
+    
+    return false;
+}
+
+// Текущий терм частичного индекса при слиянии
+struct RunReader {
+    FILE* file;
+    uint32_t remaining;
+    char term[256];
+    uint32_t df;
+    size_t order;
+    uint32_t doc_id_offset;
+    const uint64_t* deleted;
+    size_t deleted_words;
+    
+    // Прочитать заголовок следующего терма; false - частичный индекс закончился
+    bool next(bool& error) {
+        if (remaining == 0) return false;
+        remaining--;
+        
+        uint16_t term_len;
+        if (fread(&term_len, sizeof(uint16_t), 1, file) != 1 || term_len >= sizeof(term) ||
+            fread(term, 1, term_len, file) != term_len ||
+            fread(&df, sizeof(uint32_t), 1, file) != 1) {
+            error = true;
+            return false;
+        }
+        term[term_len] = '\0';
+        return true;
+    }
+};
+
+static bool run_less(const RunReader* a, const RunReader* b) {
+    int cmp = strcmp(a->term, b->term);
+    return cmp < 0 || (cmp == 0 && a->order < b->order);
+}
+
+static void sift_down(RunReader** heap, size_t size, size_t i) {
+    while (true) {
+        size_t smallest = i;
+        size_t left = 2 * i + 1;
+        size_t right = left + 1;
+        
+        if (left < size && run_less(heap[left], heap[smallest])) smallest = left;
+        if (right < size && run_less(heap[right], heap[smallest])) smallest = right;
+        if (smallest == i) return;
+        
+        RunReader* tmp = heap[i];
+        heap[i] = heap[smallest];
+        heap[smallest] = tmp;
+        i = smallest;
+    }
+}
+
+// k-путевое слияние частичных индексов и шардов: в памяти одновременно
+// только заголовки k термов и постинг-лист одного терма
+bool Indexer::merge_runs(FILE* inverted_file, uint32_t max_doc_id,
+                         uint32_t& num_terms, uint32_t& bitmap_terms) {
+    size_t num_runs = run_paths.size + shards.size;
+    RunReader* runs = new RunReader[num_runs];
+    RunReader** heap = new RunReader*[num_runs];
+    size_t heap_size = 0;
+    bool error = false;
+    
+    for (size_t i = 0; i < num_runs; i++) {
+        const ShardSource* shard = i < run_paths.size ? nullptr : &shards[i - run_paths.size];
+        const char* path = shard ? shard->inverted_path : run_paths[i];
+        uint32_t reserved;
+        
+        runs[i].file = fopen(path, "rb");
+        runs[i].remaining = 0;
+        runs[i].order = i;
+        runs[i].doc_id_offset = shard ? shard->doc_id_offset : 0;
+        runs[i].deleted = shard ? shard->deleted : nullptr;
+        runs[i].deleted_words = shard ? shard->deleted_words : 0;
+        
+        if (!runs[i].file || fread(&runs[i].remaining, sizeof(uint32_t), 1, runs[i].file) != 1 ||
+            fread(&reserved, sizeof(uint32_t), 1, runs[i].file) != 1) {
+            fprintf(stderr, "Ошибка чтения частичного индекса: %s\n", path);
+            error = true;
+            continue;
+        }
+        if (runs[i].next(error)) heap[heap_size++] = &runs[i];
+    }
+    
+    for (size_t i = heap_size; i-- > 0;) {
+        sift_down(heap, heap_size, i);
+    }
+    
+    printf("Слияние частичных индексов: %zu\n", num_runs);
+    
+    char term[256];
+    DynamicArray<uint32_t> postings;
+    DynamicArray<uint8_t> encoded;
+    num_terms = 0;
+    bitmap_terms = 0;
+    
+    while (heap_size > 0 && !error) {
+        strcpy(term, heap[0]->term);
+        postings.size = 0;
+        bool sorted = true;
+        
+        while (heap_size > 0 && strcmp(heap[0]->term, term) == 0) {
+            RunReader* run = heap[0];
+            
+            size_t start = postings.size;
+            postings.reserve(start + run->df);
+            if (fread(postings.data + start, sizeof(uint32_t), run->df, run->file) != run->df) {
+                error = true;
+                break;
+            }
+            postings.size = start + run->df;
+            
+            // Удаленные документы шарда в слитый индекс не попадают
+            if (run->deleted) {
+                size_t kept = start;
+                for (size_t i = start; i < postings.size; i++) {
+                    if (!is_deleted(run->deleted, run->deleted_words, postings[i])) {
+                        postings[kept++] = postings[i];
+                    }
+                }
+                postings.size = kept;
+            }
+            
+            if (run->doc_id_offset) {
+                for (size_t i = start; i < postings.size; i++) {
+                    postings[i] += run->doc_id_offset;
+                }
+            }
+            
+            if (start > 0 && postings.size > start && postings[start] <= postings[start - 1]) {
+                sorted = false;
+            }
+            
+            if (run->next(error)) {
+                sift_down(heap, heap_size, 0);
+            } else {
+                heap[0] = heap[--heap_size];
+                sift_down(heap, heap_size, 0);
+            }
+        }
+        
+        if (error) break;
+        if (postings.size == 0) continue;
+        
+        // Частичные индексы идут в порядке входного файла; если doc_id в нем
+        // не возрастают, список терма сортируется и очищается от повторов
+        if (!sorted) {
+            qsort(postings.data, postings.size, sizeof(uint32_t), compare_uint32);
+            size_t unique = 0;
+            for (size_t i = 0; i < postings.size; i++) {
+                if (unique == 0 || postings[i] != postings[unique - 1]) {
+                    postings[unique++] = postings[i];
+                }
+            }
+            postings.size = unique;
+        }
+        
+        if (write_postings(inverted_file, term, postings.data, postings.size, max_doc_id, encoded)) {
+            bitmap_terms++;
+        }
+        num_terms++;
+    }
+    
+    for (size_t i = 0; i < num_runs; i++) {
+        if (runs[i].file) fclose(runs[i].file);
+    }
+    delete[] runs;
+    delete[] heap;
+    
+    if (error) {
+        fprintf(stderr, "Ошибка слияния частичных индексов\n");
+    }
+    return !error;
+}
+
+// Готовый несжатый индекс-шард как источник для слияния: документы из
+// .forward добавляются в прямой индекс, .inverted сливается при сохранении
+// наравне с частичными индексами. doc_id шарда сдвигаются на doc_id_offset
+// (слияние сегментов со своими диапазонами doc_id); документы, помеченные
+// в <shard>.deleted, отбрасываются
+bool Indexer::add_shard(const char* base_path, uint32_t doc_id_offset) {
+    char path[512];
+    IndexMetadata shard_metadata;
+    
+    snprintf(path, sizeof(path), "%s.meta", base_path);
+    FILE* f = fopen(path, "rb");
+    if (!f || fread(&shard_metadata, sizeof(IndexMetadata), 1, f) != 1 ||
+        shard_metadata.magic != INDEX_MAGIC || shard_metadata.version != INDEX_VERSION) {
+        fprintf(stderr, "Ошибка чтения метаданных шарда: %s\n", path);
+        if (f) fclose(f);
+        return false;
+    }
+    fclose(f);
+    
+    if (shard_metadata.flags & (FLAG_COMPRESSED | FLAG_BITMAPS)) {
+        fprintf(stderr, "Шард %s: для слияния нужен индекс без --compress и --bitmaps\n", base_path);
+        return false;
+    }
+    if (((shard_metadata.flags & FLAG_STEMMED) != 0) != options.use_stemming) {
+        fprintf(stderr, "Шард %s построен с другим режимом стемминга\n", base_path);
+        return false;
+    }
+    
+    ShardSource shard;
+    shard.doc_id_offset = doc_id_offset;
+    if (!read_deleted_docs(base_path, shard.deleted, shard.deleted_words)) {
+        return false;
+    }
+    
+    snprintf(path, sizeof(path), "%s.forward", base_path);
+    f = fopen(path, "rb");
+    
+    uint32_t num_docs, max_doc_id;
+    if (!f || fread(&num_docs, sizeof(uint32_t), 1, f) != 1 ||
+        fread(&max_doc_id, sizeof(uint32_t), 1, f) != 1) {
+        fprintf(stderr, "Ошибка чтения прямого индекса шарда: %s\n", path);
+        if (f) fclose(f);
+        free(shard.deleted);
+        return false;
+    }
+    
+    if (shard_metadata.flags & FLAG_DOC_TABLE) {
+        fseek(f, ((long)max_doc_id + 1) * sizeof(uint32_t), SEEK_CUR);
+    }
+    
+    for (uint32_t i = 0; i < num_docs; i++) {
+        Document doc;
+        doc.url = nullptr;
+        doc.title = nullptr;
+        
+        bool ok = fread(&doc.doc_id, sizeof(uint32_t), 1, f) == 1 &&
+                  fread(&doc.url_length, sizeof(uint16_t), 1, f) == 1;
+        if (ok) {
+            doc.url = new char[doc.url_length + 1];
+            ok = fread(doc.url, 1, doc.url_length, f) == doc.url_length &&
+                 fread(&doc.title_length, sizeof(uint16_t), 1, f) == 1;
+            doc.url[doc.url_length] = '\0';
+        }
+        if (ok) {
+            doc.title = new char[doc.title_length + 1];
+            ok = fread(doc.title, 1, doc.title_length, f) == doc.title_length &&
+                 fread(&doc.content_length, sizeof(uint32_t), 1, f) == 1 &&
+                 fread(&doc.token_count, sizeof(uint32_t), 1, f) == 1 &&
+                 fread(&doc.unique_terms, sizeof(uint32_t), 1, f) == 1;
+            doc.title[doc.title_length] = '\0';
+        }
+        
+        if (!ok) {
+            fprintf(stderr, "Поврежден прямой индекс шарда: %s\n", path);
+            if (doc.url) delete[] doc.url;
+            if (doc.title) delete[] doc.title;
+            fclose(f);
+            free(shard.deleted);
+            return false;
+        }
+        
+        if (shard.deleted && is_deleted(shard.deleted, shard.deleted_words, doc.doc_id)) {
+            delete[] doc.url;
+            delete[] doc.title;
+            continue;
+        }
+        
+        doc.doc_id += doc_id_offset;
+        documents.push_back(doc);
+        metadata.total_documents++;
+    }
+    fclose(f);
+    
+    snprintf(path, sizeof(path), "%s.inverted", base_path);
+    shard.inverted_path = new char[strlen(path) + 1];
+    strcpy(shard.inverted_path, path);
+    shards.push_back(shard);
+    
+    return true;
 }
 
 bool Indexer::save_to_file(const char* base_path) {
@@ -204,26 +633,54 @@ bool Indexer::save_to_file(const char* base_path) {
     snprintf(forward_path, sizeof(forward_path), "%s.forward", base_path);
     snprintf(inverted_path, sizeof(inverted_path), "%s.inverted", base_path);
     
+    // Файлы пишутся под временными именами и заменяют старые через rename():
+    // процессы, у которых старый индекс отображен в память (query_eval.py в
+    // веб-сервере), продолжают читать прежние inode, а не обрезанный файл
+    char meta_tmp[520], forward_tmp[520], inverted_tmp[520];
+    snprintf(meta_tmp, sizeof(meta_tmp), "%s.tmp", meta_path);
+    snprintf(forward_tmp, sizeof(forward_tmp), "%s.tmp", forward_path);
+    snprintf(inverted_tmp, sizeof(inverted_tmp), "%s.tmp", inverted_path);
+    
     printf("Сохранение индекса...\n");
     
-    FILE* meta_file = fopen(meta_path, "wb");
-    if (!meta_file) {
-        fprintf(stderr, "Ошибка создания файла метаданных\n");
+    if (run_error) {
+        fprintf(stderr, "Частичные индексы записаны с ошибкой\n");
         return false;
     }
     
-    fwrite(&metadata, sizeof(IndexMetadata), 1, meta_file);
-    fclose(meta_file);
-    
-    FILE* forward_file = fopen(forward_path, "wb");
+    FILE* forward_file = fopen(forward_tmp, "wb");
     if (!forward_file) {
         fprintf(stderr, "Ошибка создания файла прямого индекса\n");
         return false;
     }
     
+    // Заголовок: число документов и максимальный doc_id, затем таблица
+    // смещений записей offsets[0..max_doc_id] (0 - документа нет),
+    // по которой читатель сразу переходит к записи документа
     uint32_t num_docs = documents.size;
+    uint32_t max_doc_id = 0;
+    for (size_t i = 0; i < documents.size; i++) {
+        if (documents[i].doc_id > max_doc_id) max_doc_id = documents[i].doc_id;
+    }
+    
     fwrite(&num_docs, sizeof(uint32_t), 1, forward_file);
-    fwrite(&num_docs, sizeof(uint32_t), 1, forward_file);
+    fwrite(&max_doc_id, sizeof(uint32_t), 1, forward_file);
+    
+    uint32_t* doc_offsets = new uint32_t[max_doc_id + 1];
+    memset(doc_offsets, 0, (max_doc_id + 1) * sizeof(uint32_t));
+    
+    uint32_t record_offset = 2 * sizeof(uint32_t) + (max_doc_id + 1) * sizeof(uint32_t);
+    for (size_t i = 0; i < documents.size; i++) {
+        Document& doc = documents[i];
+        if (doc_offsets[doc.doc_id] == 0) {
+            doc_offsets[doc.doc_id] = record_offset;
+        }
+        record_offset += sizeof(uint32_t) + sizeof(uint16_t) + doc.url_length +
+                         sizeof(uint16_t) + doc.title_length + 3 * sizeof(uint32_t);
+    }
+    
+    fwrite(doc_offsets, sizeof(uint32_t), max_doc_id + 1, forward_file);
+    delete[] doc_offsets;
     
     for (size_t i = 0; i < documents.size; i++) {
         Document& doc = documents[i];
@@ -239,44 +696,89 @@ bool Indexer::save_to_file(const char* base_path) {
     
     fclose(forward_file);
     
-    FILE* inverted_file = fopen(inverted_path, "wb");
+    FILE* inverted_file = fopen(inverted_tmp, "wb");
     if (!inverted_file) {
         fprintf(stderr, "Ошибка создания файла инвертированного индекса\n");
         return false;
     }
     
+    // Число термов при слиянии известно только в конце - заголовок
+    // перезаписывается после записи всех термов
     uint32_t num_terms = inverted_index.size();
     fwrite(&num_terms, sizeof(uint32_t), 1, inverted_file);
     fwrite(&num_terms, sizeof(uint32_t), 1, inverted_file);
     
-    HashNode** term_array = new HashNode*[num_terms];
-    uint32_t idx = 0;
+    uint32_t bitmap_terms = 0;
+    term_offsets.size = 0;
     
-    HashMap::Iterator it = inverted_index.get_iterator();
-    while (it.has_next()) {
-        HashNode* node = it.next();
-        if (node) {
-            term_array[idx++] = node;
+    if (run_paths.size > 0 || shards.size > 0) {
+        if (inverted_index.size() > 0 && !flush_run()) {
+            fclose(inverted_file);
+            return false;
+        }
+        
+        bool merged = merge_runs(inverted_file, max_doc_id, num_terms, bitmap_terms);
+        
+        for (size_t i = 0; i < run_paths.size; i++) {
+            remove(run_paths[i]);
+            delete[] run_paths[i];
+        }
+        run_paths.size = 0;
+        
+        if (!merged) {
+            fclose(inverted_file);
+            return false;
         }
+        
+        fseek(inverted_file, 0, SEEK_SET);
+        fwrite(&num_terms, sizeof(uint32_t), 1, inverted_file);
+        fwrite(&num_terms, sizeof(uint32_t), 1, inverted_file);
+        printf("Уникальных термов после слияния: %u\n", num_terms);
+    } else {
+        printf("Сортировка термов для сохранения...\n");
+        HashNode** term_array = sorted_terms(num_terms);
+        DynamicArray<uint8_t> encoded;
+        
+        for (uint32_t i = 0; i < num_terms; i++) {
+            HashNode* node = term_array[i];
+            if (write_postings(inverted_file, node->key, node->doc_ids->data,
+                               node->doc_ids->size, max_doc_id, encoded)) {
+                bitmap_terms++;
+            }
+        }
+        
+        delete[] term_array;
     }
     
-    printf("Сортировка термов для сохранения...\n");
-    qsort(term_array, num_terms, sizeof(HashNode*), compare_terms);
+    // Таблица смещений термов (FLAG_TERM_TABLE): index_reader.py отображает
+    // ее через mmap и не проходит по словарю при открытии индекса
+    fseek(inverted_file, 0, SEEK_END);
+    fwrite(term_offsets.data, sizeof(uint64_t), term_offsets.size, inverted_file);
     
-    for (uint32_t i = 0; i < num_terms; i++) {
-        HashNode* node = term_array[i];
-        uint16_t term_len = strlen(node->key);
-        uint32_t df = node->doc_ids->size;
-        
-        fwrite(&term_len, sizeof(uint16_t), 1, inverted_file);
-        fwrite(node->key, 1, term_len, inverted_file);
-        fwrite(&df, sizeof(uint32_t), 1, inverted_file);
-        fwrite(node->doc_ids->data, sizeof(uint32_t), df, inverted_file);
+    fclose(inverted_file);
+    
+    // Метаданные пишутся последними: индекс готов, когда обновлен .meta
+    metadata.total_unique_terms = num_terms;
+    
+    FILE* meta_file = fopen(meta_tmp, "wb");
+    if (!meta_file) {
+        fprintf(stderr, "Ошибка создания файла метаданных\n");
+        return false;
     }
     
-    delete[] term_array;
-    fclose(inverted_file);
+    fwrite(&metadata, sizeof(IndexMetadata), 1, meta_file);
+    fclose(meta_file);
+    
+    // .meta - последним: по нему веб-интерфейс замечает новое поколение
+    if (rename(forward_tmp, forward_path) != 0 || rename(inverted_tmp, inverted_path) != 0 ||
+        rename(meta_tmp, meta_path) != 0) {
+        fprintf(stderr, "Ошибка замены файлов индекса %s\n", base_path);
+        return false;
+    }
     
+    if (options.use_bitmaps) {
+        printf("Термов в виде битовых карт: %u\n", bitmap_terms);
+    }
     printf("Индекс сохранен успешно:\n");
     printf("  %s\n", meta_path);
     printf("  %s\n", forward_path);
@@ -3,19 +3,35 @@
 
 #include <cstdint>
 #include <cstddef>
+#include <cstdio>
 #include <cstring>
 #include <cstdlib>
 
 #define INDEX_MAGIC 0x49444558
-#define INDEX_VERSION 0x0001
+// 0x0002: в заголовке .forward - max_doc_id и таблица смещений записей,
+// в конце .inverted - таблица смещений термов. Читатели отказываются
+// открывать индекс другой версии
+#define INDEX_VERSION 0x0002
 #define FLAG_COMPRESSED  0x0001
 #define FLAG_STEMMED     0x0002
 #define FLAG_POSITIONAL  0x0004
+#define FLAG_DOC_TABLE   0x0008  // в .forward есть таблица смещений записей по doc_id
+#define FLAG_BITMAPS     0x0010  // частые термы хранятся битовыми картами
+#define FLAG_TERM_TABLE  0x0020  // в конце .inverted - u64 смещения записей термов
 
 struct IndexOptions {
     bool use_stemming;
+    bool use_compression;
+    bool use_bitmaps;
     
-    IndexOptions() : use_stemming(false) {}
+    // Бюджет памяти под обратный индекс в байтах (0 - без ограничения).
+    // При превышении накопленные постинги сбрасываются в файлы
+    // <run_prefix>.run<N>, которые сливаются при сохранении индекса
+    size_t memory_budget;
+    const char* run_prefix;
+    
+    IndexOptions() : use_stemming(false), use_compression(false), use_bitmaps(false),
+                     memory_budget(0), run_prefix("index") {}
 };
 
 struct IndexMetadata {
@@ -48,6 +64,7 @@ struct Term {
     uint16_t term_length;
     uint32_t document_frequency;
     uint32_t* doc_ids;
+    uint64_t* bitmap;   // вместо doc_ids для термов, хранимых битовой картой
 };
 
 template<typename T>
@@ -101,6 +118,21 @@ struct DynamicArray {
         capacity = new_capacity;
     }
     
+    // Обмен содержимым без копирования элементов
+    void swap(DynamicArray& other) {
+        T* other_data = other.data;
+        size_t other_size = other.size;
+        size_t other_capacity = other.capacity;
+        
+        other.data = data;
+        other.size = size;
+        other.capacity = capacity;
+        
+        data = other_data;
+        size = other_size;
+        capacity = other_capacity;
+    }
+    
     void push_back(const T& value) {
         if (size >= capacity) {
             reserve(capacity == 0 ? 8 : capacity * 2);
@@ -195,6 +227,19 @@ public:
     
     size_t size() const { return item_count; }
     
+    void clear() {
+        for (size_t i = 0; i < bucket_count; i++) {
+            HashNode* node = buckets[i];
+            while (node) {
+                HashNode* next = node->next;
+                delete node;
+                node = next;
+            }
+            buckets[i] = nullptr;
+        }
+        item_count = 0;
+    }
+    
     class Iterator {
     private:
         HashMap* map;
@@ -240,6 +285,300 @@ public:
     }
 };
 
+// Сжатые постинг-листы (FLAG_COMPRESSED)
+//
+// Запись терма: [u16 term_length][term][u32 df][varint payload_size][payload]
+// payload - одно из трех, вид задается размером:
+//   payload_size == df * 4     - doc_id без сжатия (u32), если varint-дельты
+//                                не короче: редкие термы с большими doc_id
+//   df <= POSTING_BLOCK_SIZE   - varint дельты без заголовка блока
+//   иначе блоки по POSTING_BLOCK_SIZE doc_id:
+//                                [u32 last_doc_id][u16 block_size][varint дельты]
+// Сжатый payload всегда короче df * 4, поэтому вид определяется однозначно.
+// Первая дельта блока считается от last_doc_id предыдущего блока, поэтому
+// блок можно пропустить по заголовку, не декодируя его.
+#define POSTING_BLOCK_SIZE 128
+#define POSTING_BLOCK_HEADER 6
+#define VARINT_MAX_BYTES 5
+
+inline void append_varint(DynamicArray<uint8_t>& out, uint32_t value) {
+    while (value >= 0x80) {
+        out.push_back((uint8_t)(value | 0x80));
+        value >>= 7;
+    }
+    out.push_back((uint8_t)value);
+}
+
+// Varint в buffer (не больше VARINT_MAX_BYTES байт); длина записи
+inline size_t write_varint(uint8_t* buffer, uint32_t value) {
+    size_t length = 0;
+    while (value >= 0x80) {
+        buffer[length++] = (uint8_t)(value | 0x80);
+        value >>= 7;
+    }
+    buffer[length++] = (uint8_t)value;
+    return length;
+}
+
+inline bool read_varint(FILE* f, uint32_t& value) {
+    value = 0;
+    for (int shift = 0; shift <= 28; shift += 7) {
+        int b = fgetc(f);
+        if (b == EOF) return false;
+        value |= (uint32_t)(b & 0x7F) << shift;
+        if (!(b & 0x80)) return true;
+    }
+    return false;
+}
+
+inline void encode_postings(const uint32_t* doc_ids, uint32_t count, DynamicArray<uint8_t>& out) {
+    size_t payload_start = out.size;
+    uint32_t prev = 0;
+    
+    for (uint32_t start = 0; start < count; start += POSTING_BLOCK_SIZE) {
+        uint32_t end = start + POSTING_BLOCK_SIZE;
+        if (end > count) end = count;
+        
+        // Список из одного блока пишется без заголовка: пропускать нечего
+        size_t header_pos = out.size;
+        if (count > POSTING_BLOCK_SIZE) {
+            for (int i = 0; i < POSTING_BLOCK_HEADER; i++) out.push_back(0);
+        }
+        
+        for (uint32_t i = start; i < end; i++) {
+            append_varint(out, doc_ids[i] - prev);
+            prev = doc_ids[i];
+        }
+        
+        if (count > POSTING_BLOCK_SIZE) {
+            uint32_t last_doc_id = doc_ids[end - 1];
+            uint16_t block_size = out.size - header_pos - POSTING_BLOCK_HEADER;
+            memcpy(&out.data[header_pos], &last_doc_id, 4);
+            memcpy(&out.data[header_pos + 4], &block_size, 2);
+        }
+    }
+    
+    // varint не выиграл - doc_id как есть
+    if (out.size - payload_start >= (size_t)count * 4) {
+        out.size = payload_start;
+        out.reserve(payload_start + (size_t)count * 4);
+        memcpy(&out.data[payload_start], doc_ids, (size_t)count * 4);
+        out.size += (size_t)count * 4;
+    }
+}
+
+// Декодирует count doc_id из payload; false, если данные повреждены
+inline bool decode_postings(const uint8_t* data, size_t size, uint32_t* doc_ids, uint32_t count) {
+    if (size == (size_t)count * 4) {
+        memcpy(doc_ids, data, size);
+        return true;
+    }
+    
+    size_t pos = 0;
+    uint32_t prev = 0;
+    uint32_t n = 0;
+    
+    while (n < count) {
+        if (count > POSTING_BLOCK_SIZE) {
+            if (pos + POSTING_BLOCK_HEADER > size) return false;
+            pos += POSTING_BLOCK_HEADER;
+        }
+        
+        uint32_t end = n + POSTING_BLOCK_SIZE;
+        if (end > count) end = count;
+        
+        for (; n < end; n++) {
+            uint32_t delta = 0;
+            int shift = 0;
+            
+            while (true) {
+                if (pos >= size || shift > 28) return false;
+                uint8_t b = data[pos++];
+                delta |= (uint32_t)(b & 0x7F) << shift;
+                if (!(b & 0x80)) break;
+                shift += 7;
+            }
+            
+            prev += delta;
+            doc_ids[n] = prev;
+        }
+    }
+    
+    return pos == size;
+}
+
+// Битовые карты для частых термов (FLAG_BITMAPS)
+//
+// С этим флагом после df в записи терма идет [u8 encoding]:
+//   POSTING_LIST   - постинг-лист как без флага (сжатый при FLAG_COMPRESSED)
+//   POSTING_BITMAP - [u32 payload_size][u32 num_containers] и контейнеры
+// Контейнер покрывает 65536 doc_id с одинаковыми старшими 16 битами:
+//   [u16 chunk][u16 type][u32 cardinality] и данные
+//   BITMAP_CONTAINER_ARRAY - u16 low[cardinality], младшие биты по возрастанию
+//   BITMAP_CONTAINER_WORDS - u64 words[1024], бит low установлен у документа
+// Массив выбирается, пока он не больше карты (до 4096 документов в чанке).
+// Кандидаты в битовые карты - термы, встречающиеся хотя бы в каждом
+// BITMAP_DENSITY-м документе; карта пишется, только если она не больше
+// постинг-листа (сжатого при FLAG_COMPRESSED).
+#define POSTING_LIST    0
+#define POSTING_BITMAP  1
+
+#define BITMAP_CONTAINER_ARRAY 0
+#define BITMAP_CONTAINER_WORDS 1
+
+#define BITMAP_CHUNK_BITS 16
+#define BITMAP_CHUNK_WORDS 1024
+#define BITMAP_ARRAY_MAX 4096
+#define BITMAP_DENSITY 16
+
+inline bool use_bitmap_postings(uint32_t df, uint32_t max_doc_id) {
+    return (uint64_t)df * BITMAP_DENSITY > max_doc_id;
+}
+
+inline void append_bytes(DynamicArray<uint8_t>& out, const void* data, size_t size) {
+    const uint8_t* bytes = (const uint8_t*)data;
+    for (size_t i = 0; i < size; i++) out.push_back(bytes[i]);
+}
+
+inline void encode_bitmap(const uint32_t* doc_ids, uint32_t count, DynamicArray<uint8_t>& out) {
+    size_t count_pos = out.size;
+    uint32_t num_containers = 0;
+    append_bytes(out, &num_containers, 4);
+    
+    uint64_t words[BITMAP_CHUNK_WORDS];
+    uint32_t start = 0;
+    
+    while (start < count) {
+        uint16_t chunk = doc_ids[start] >> BITMAP_CHUNK_BITS;
+        uint32_t end = start;
+        while (end < count && (doc_ids[end] >> BITMAP_CHUNK_BITS) == chunk) end++;
+        
+        uint32_t cardinality = end - start;
+        uint16_t type = cardinality <= BITMAP_ARRAY_MAX ? BITMAP_CONTAINER_ARRAY : BITMAP_CONTAINER_WORDS;
+        
+        append_bytes(out, &chunk, 2);
+        append_bytes(out, &type, 2);
+        append_bytes(out, &cardinality, 4);
+        
+        if (type == BITMAP_CONTAINER_ARRAY) {
+            for (uint32_t i = start; i < end; i++) {
+                uint16_t low = doc_ids[i] & 0xFFFF;
+                append_bytes(out, &low, 2);
+            }
+        } else {
+            memset(words, 0, sizeof(words));
+            for (uint32_t i = start; i < end; i++) {
+                uint16_t low = doc_ids[i] & 0xFFFF;
+                words[low >> 6] |= (uint64_t)1 << (low & 63);
+            }
+            append_bytes(out, words, sizeof(words));
+        }
+        
+        num_containers++;
+        start = end;
+    }
+    
+    memcpy(&out.data[count_pos], &num_containers, 4);
+}
+
+// Раскладывает контейнеры в плоскую карту words[num_words] (обнуленную
+// заранее); false, если данные повреждены или не совпадают с count
+inline bool decode_bitmap(const uint8_t* data, size_t size, uint64_t* words,
+                          size_t num_words, uint32_t count) {
+    if (size < 4) return false;
+    
+    uint32_t num_containers;
+    memcpy(&num_containers, data, 4);
+    size_t pos = 4;
+    uint64_t total = 0;
+    
+    for (uint32_t c = 0; c < num_containers; c++) {
+        if (pos + 8 > size) return false;
+        
+        uint16_t chunk, type;
+        uint32_t cardinality;
+        memcpy(&chunk, data + pos, 2);
+        memcpy(&type, data + pos + 2, 2);
+        memcpy(&cardinality, data + pos + 4, 4);
+        pos += 8;
+        
+        size_t base = (size_t)chunk << (BITMAP_CHUNK_BITS - 6);
+        
+        if (type == BITMAP_CONTAINER_ARRAY) {
+            if (pos + (size_t)cardinality * 2 > size) return false;
+            
+            for (uint32_t i = 0; i < cardinality; i++) {
+                uint16_t low;
+                memcpy(&low, data + pos + i * 2, 2);
+                size_t word = base + (low >> 6);
+                if (word >= num_words) return false;
+                words[word] |= (uint64_t)1 << (low & 63);
+            }
+            pos += (size_t)cardinality * 2;
+        } else if (type == BITMAP_CONTAINER_WORDS) {
+            if (pos + BITMAP_CHUNK_WORDS * 8 > size) return false;
+            
+            for (size_t i = 0; i < BITMAP_CHUNK_WORDS; i++) {
+                uint64_t bits;
+                memcpy(&bits, data + pos + i * 8, 8);
+                if (!bits) continue;
+                if (base + i >= num_words) return false;
+                words[base + i] = bits;
+            }
+            pos += BITMAP_CHUNK_WORDS * 8;
+        } else {
+            return false;
+        }
+        
+        total += cardinality;
+    }
+    
+    return pos == size && total == count;
+}
+
+// Удаленные документы индекса (<index>.deleted):
+// [u32 max_doc_id][u64 words[max_doc_id / 64 + 1]], установленный бит doc_id -
+// документ удален (или заменен новой версией) и в результаты не попадает.
+// Файла нет - bits = nullptr; false - файл есть, но поврежден
+inline bool read_deleted_docs(const char* base_path, uint64_t*& bits, size_t& words) {
+    char path[512];
+    snprintf(path, sizeof(path), "%s.deleted", base_path);
+    bits = nullptr;
+    words = 0;
+    
+    FILE* f = fopen(path, "rb");
+    if (!f) return true;
+    
+    uint32_t max_doc_id;
+    bool ok = fread(&max_doc_id, sizeof(uint32_t), 1, f) == 1;
+    if (ok) {
+        words = ((size_t)max_doc_id >> 6) + 1;
+        bits = (uint64_t*)malloc(words * sizeof(uint64_t));
+        ok = fread(bits, sizeof(uint64_t), words, f) == words;
+    }
+    fclose(f);
+    
+    if (!ok) {
+        fprintf(stderr, "Поврежден файл удаленных документов: %s\n", path);
+        free(bits);
+        bits = nullptr;
+        words = 0;
+    }
+    return ok;
+}
+
+inline bool is_deleted(const uint64_t* bits, size_t words, uint32_t doc_id) {
+    return (doc_id >> 6) < words && (bits[doc_id >> 6] >> (doc_id & 63)) & 1;
+}
+
+// Индекс-шард, подключенный к слиянию (Indexer::add_shard)
+struct ShardSource {
+    char* inverted_path;
+    uint32_t doc_id_offset;
+    uint64_t* deleted;      // удаленные документы шарда (<shard>.deleted) или nullptr
+    size_t deleted_words;
+};
+
 class Indexer {
 private:
     DynamicArray<Document> documents;
@@ -247,8 +586,27 @@ private:
     IndexMetadata metadata;
     IndexOptions options;
     
+    // Память под inverted_index (узлы, ключи, емкость постинг-листов)
+    size_t index_memory;
+    // Частичные индексы на диске (SPIMI), в порядке записи; удаляются
+    // после слияния
+    DynamicArray<char*> run_paths;
+    // Готовые шарды (add_shard), сливаются после частичных индексов
+    DynamicArray<ShardSource> shards;
+    bool run_error;
+    // Смещения записей термов в .inverted - таблица в конце файла
+    DynamicArray<uint64_t> term_offsets;
+    // Битовая карта терма-кандидата, сравнивается по размеру с постинг-листом
+    DynamicArray<uint8_t> bitmap_encoded;
+    
     void to_lowercase(char* str);
     bool is_valid_term(const char* term);
+    void add_posting(const char* term, uint32_t doc_id);
+    HashNode** sorted_terms(uint32_t& num_terms);
+    bool flush_run();
+    bool merge_runs(FILE* inverted_file, uint32_t max_doc_id, uint32_t& num_terms, uint32_t& bitmap_terms);
+    bool write_postings(FILE* inverted_file, const char* term, const uint32_t* doc_ids,
+                        uint32_t df, uint32_t max_doc_id, DynamicArray<uint8_t>& encoded);
     
 public:
     Indexer();
@@ -259,6 +617,7 @@ public:
     void add_document(uint32_t doc_id, const char* url, const char* title, const char* content);
     void tokenize_and_index(uint32_t doc_id, const char* text);
     void sort_index();
+    bool add_shard(const char* base_path, uint32_t doc_id_offset = 0);
     bool save_to_file(const char* base_path);
     bool load_from_file(const char* base_path);
     void print_statistics() const;
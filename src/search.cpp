@@ -10,6 +10,36 @@ double get_time() {
     return tv.tv_sec + tv.tv_usec / 1000000.0;
 }
 
+enum QueryNodeType {
+    NODE_TERM,
+    NODE_AND,
+    NODE_OR,
+    NODE_NOT,
+    NODE_EMPTY
+};
+
+// Узел дерева запроса. cost - оценка числа документов в результате,
+// по ней планировщик упорядочивает операнды
+struct QueryNode {
+    QueryNodeType type;
+    const Term* term;
+    DynamicArray<QueryNode*> children;
+    uint64_t cost;
+    
+    QueryNode(QueryNodeType t) : type(t), term(nullptr), cost(0) {}
+    
+    QueryNode(const QueryNode&) = delete;
+    QueryNode& operator=(const QueryNode&) = delete;
+    
+    ~QueryNode() {
+        for (size_t i = 0; i < children.size; i++) {
+            delete children[i];
+        }
+    }
+};
+
+// Разбор запроса в дерево, планирование по document_frequency и вычисление.
+// Грамматика прежняя: неявное И, &&, ||, ! и скобки
 class QueryEvaluator {
 private:
     BooleanQueryParser* parser;
@@ -20,46 +50,66 @@ private:
         current_token = parser->next_token();
     }
     
-    DynamicArray<uint32_t> parse_expression() {
-        DynamicArray<uint32_t> left = parse_term();
+    // a && (b && c) -> AND(a, b, c); то же для ||
+    static void add_child(QueryNode* node, QueryNode* child) {
+        if (child->type == node->type) {
+            for (size_t i = 0; i < child->children.size; i++) {
+                node->children.push_back(child->children[i]);
+            }
+            child->children.size = 0;
+            delete child;
+        } else {
+            node->children.push_back(child);
+        }
+    }
+    
+    QueryNode* parse_expression() {
+        QueryNode* left = parse_term();
+        if (current_token.type != TOKEN_OR) return left;
+        
+        QueryNode* node = new QueryNode(NODE_OR);
+        add_child(node, left);
         
         while (current_token.type == TOKEN_OR) {
             advance();
-            DynamicArray<uint32_t> right = parse_term();
-            left = union_postings(left.data, left.size, right.data, right.size);
+            add_child(node, parse_term());
         }
         
-        return left;
+        return node;
     }
     
-    DynamicArray<uint32_t> parse_term() {
-        DynamicArray<uint32_t> left = parse_factor();
+    QueryNode* parse_term() {
+        QueryNode* left = parse_factor();
+        if (current_token.type != TOKEN_AND && current_token.type != TOKEN_WORD) return left;
+        
+        QueryNode* node = new QueryNode(NODE_AND);
+        add_child(node, left);
         
         while (current_token.type == TOKEN_AND || current_token.type == TOKEN_WORD) {
             if (current_token.type == TOKEN_AND) {
                 advance();
             }
-            DynamicArray<uint32_t> right = parse_factor();
-            left = intersect_postings(left.data, left.size, right.data, right.size);
+            add_child(node, parse_factor());
         }
         
-        return left;
+        return node;
     }
     
-    DynamicArray<uint32_t> parse_factor() {
+    QueryNode* parse_factor() {
         if (current_token.type == TOKEN_NOT) {
             advance();
-            DynamicArray<uint32_t> operand = parse_factor();
-            return negate_postings(operand.data, operand.size, loader->get_total_documents());
+            QueryNode* node = new QueryNode(NODE_NOT);
+            node->children.push_back(parse_factor());
+            return node;
         }
         
         if (current_token.type == TOKEN_LPAREN) {
             advance();
-            DynamicArray<uint32_t> result = parse_expression();
+            QueryNode* node = parse_expression();
             if (current_token.type == TOKEN_RPAREN) {
                 advance();
             }
-            return result;
+            return node;
         }
         
         if (current_token.type == TOKEN_WORD) {
@@ -67,38 +117,317 @@ private:
             advance();
             
             if (term) {
-                DynamicArray<uint32_t> result;
-                for (uint32_t i = 0; i < term->document_frequency; i++) {
-                    result.push_back(term->doc_ids[i]);
-                }
-                return result;
+                QueryNode* node = new QueryNode(NODE_TERM);
+                node->term = term;
+                return node;
+            }
+        }
+        
+        return new QueryNode(NODE_EMPTY);
+    }
+    
+    // Сортировка операндов по возрастанию стоимости (вставками - их мало)
+    static void sort_children(QueryNode* node) {
+        DynamicArray<QueryNode*>& children = node->children;
+        
+        for (size_t i = 1; i < children.size; i++) {
+            QueryNode* child = children[i];
+            size_t j = i;
+            while (j > 0 && children[j - 1]->cost > child->cost) {
+                children[j] = children[j - 1];
+                j--;
+            }
+            children[j] = child;
+        }
+    }
+    
+    // Оценка размера результата снизу вверх; операнды И и ИЛИ
+    // упорядочиваются от самого короткого
+    void plan(QueryNode* node) {
+        uint64_t total = loader->get_total_documents();
+        
+        for (size_t i = 0; i < node->children.size; i++) {
+            plan(node->children[i]);
+        }
+        
+        switch (node->type) {
+        case NODE_TERM:
+            node->cost = node->term->document_frequency;
+            break;
+        case NODE_NOT: {
+            uint64_t operand = node->children[0]->cost;
+            node->cost = operand < total ? total - operand : 0;
+            break;
+        }
+        case NODE_AND:
+            sort_children(node);
+            node->cost = node->children[0]->cost;
+            break;
+        case NODE_OR:
+            sort_children(node);
+            node->cost = 0;
+            for (size_t i = 0; i < node->children.size; i++) {
+                node->cost += node->children[i]->cost;
+            }
+            if (node->cost > total) node->cost = total;
+            break;
+        case NODE_EMPTY:
+            node->cost = 0;
+            break;
+        }
+    }
+    
+    void evaluate_node(const QueryNode* node, PostingList& result) {
+        switch (node->type) {
+        case NODE_TERM:
+            if (node->term->bitmap) {
+                result.borrow_bitmap(node->term->bitmap, loader->get_bitmap_words(),
+                                     node->term->document_frequency);
             } else {
-                DynamicArray<uint32_t> empty;
-                return empty;
+                result.borrow(node->term->doc_ids, node->term->document_frequency);
             }
+            return;
+            
+        case NODE_NOT: {
+            PostingList operand;
+            evaluate_node(node->children[0], operand);
+            complement(operand, result);
+            return;
         }
+            
+        case NODE_AND: {
+            // Самый короткий операнд первым; пустой промежуточный
+            // результат останавливает вычисление остальных
+            bool started = false;
+            
+            for (size_t i = 0; i < node->children.size; i++) {
+                const QueryNode* child = node->children[i];
+                if (child->type == NODE_NOT) continue;
+                
+                if (!started) {
+                    evaluate_node(child, result);
+                    started = true;
+                } else {
+                    PostingList right, merged;
+                    evaluate_node(child, right);
+                    intersect_lists(result, right, merged);
+                    result.take(merged);
+                }
+                
+                if (result.size == 0) return;
+            }
+            
+            if (!started) {
+                // Одни отрицания: !a && !b = !(a || b)
+                PostingList excluded;
+                evaluate_excluded(node, excluded);
+                complement(excluded, result);
+                return;
+            }
+            
+            // A && !B - разность A и B, без построения дополнения B
+            for (size_t i = 0; i < node->children.size && result.size > 0; i++) {
+                const QueryNode* child = node->children[i];
+                if (child->type != NODE_NOT) continue;
+                
+                PostingList operand, rest;
+                evaluate_node(child->children[0], operand);
+                difference_lists(result, operand, rest);
+                result.take(rest);
+            }
+            return;
+        }
+            
+        case NODE_OR:
+            evaluate_node(node->children[0], result);
+            for (size_t i = 1; i < node->children.size; i++) {
+                PostingList right, merged;
+                evaluate_node(node->children[i], right);
+                if (right.size == 0) continue;
+                if (result.size == 0) {
+                    result.take(right);
+                    continue;
+                }
+                union_lists(result, right, merged);
+                result.take(merged);
+            }
+            return;
+            
+        case NODE_EMPTY:
+            result.clear();
+            return;
+        }
+    }
+    
+    // Узел - отрицание: !x или И из одних отрицаний
+    static bool is_negation(const QueryNode* node) {
+        if (node->type == NODE_NOT) return true;
+        if (node->type != NODE_AND) return false;
         
-        DynamicArray<uint32_t> empty;
-        return empty;
+        for (size_t i = 0; i < node->children.size; i++) {
+            if (node->children[i]->type != NODE_NOT) return false;
+        }
+        return true;
+    }
+    
+    // Что исключает отрицание: операнд !x или объединение операндов !a && !b
+    void evaluate_excluded(const QueryNode* node, PostingList& excluded) {
+        if (node->type == NODE_NOT) {
+            evaluate_node(node->children[0], excluded);
+            return;
+        }
+        
+        evaluate_node(node->children[0]->children[0], excluded);
+        for (size_t i = 1; i < node->children.size; i++) {
+            PostingList right, merged;
+            evaluate_node(node->children[i]->children[0], right);
+            if (right.size == 0) continue;
+            if (excluded.size == 0) {
+                excluded.take(right);
+                continue;
+            }
+            union_lists(excluded, right, merged);
+            excluded.take(merged);
+        }
+    }
+    
+    // Дополнение до существующих документов - битовая карта
+    void complement(const PostingList& operand, PostingList& result) {
+        PostingList bitmap;
+        complement_list(operand, loader->get_doc_bitmap(), loader->get_bitmap_words(), bitmap);
+        result.take(bitmap);
     }
     
 public:
     QueryEvaluator(BooleanQueryParser* p, IndexLoader* l) : parser(p), loader(l) {}
     
-    DynamicArray<uint32_t> evaluate() {
+    void evaluate(PostingList& result) {
         parser->reset();
         advance();
-        return parse_expression();
+        
+        QueryNode* root = parse_expression();
+        plan(root);
+        
+        if (is_negation(root)) {
+            // Запрос целиком - отрицание: дополнение списка не строится, окно
+            // результатов вычисляется при выводе (PostingList::window);
+            // дополнение битовой карты дешево и строится сразу
+            evaluate_excluded(root, result);
+            if (result.is_bitmap()) {
+                complement(result, result);
+            } else {
+                const DynamicArray<uint32_t>& doc_ids = loader->get_doc_ids();
+                result.set_complement((uint32_t)doc_ids.size,
+                                      loader->is_dense() ? nullptr : doc_ids.data);
+            }
+        } else {
+            evaluate_node(root, result);
+        }
+        delete root;
     }
 };
 
+// Запрос по всем сегментам индекса: в каждом сегменте свое дерево и план
+// (document_frequency в сегментах разные), старые версии документов
+// убираются из результата сегмента
+void evaluate_query(SegmentSet& segments, const char* query, SegmentResults& results) {
+    for (size_t s = 0; s < segments.size(); s++) {
+        Segment& segment = segments[s];
+        
+        BooleanQueryParser parser(query);
+        QueryEvaluator evaluator(&parser, &segment.loader);
+        PostingList& part = results.add(segment.base);
+        evaluator.evaluate(part);
+        exclude_hidden(part, segment.hidden);
+    }
+}
+
+// Вывод окна результатов [offset, offset + limit): title/url ищутся
+// только для выводимых документов
+void print_results(const SegmentSet& segments, const SegmentResults& results,
+                   size_t offset, size_t limit, const char* separator) {
+    size_t total = results.count();
+    if (offset > total) offset = total;
+    
+    DynamicArray<uint32_t> page;
+    results.window(offset, limit, page);
+    
+    for (size_t i = 0; i < page.size; i++) {
+        const Document* doc = segments.get_document(page[i]);
+        if (doc) {
+            printf("%3zu. %s\n", offset + i + 1, doc->title);
+            printf("     %s\n%s", doc->url, separator);
+        }
+    }
+    
+    size_t end = offset + page.size;
+    if (total > end) {
+        printf("... и еще %zu документов\n", total - end);
+    }
+}
+
+// Строка JSON: кавычки, обратный слэш и управляющие символы экранируются,
+// байты UTF-8 выводятся как есть
+void print_json_string(const char* str) {
+    putchar('"');
+    for (const unsigned char* p = (const unsigned char*)str; *p; p++) {
+        if (*p == '"' || *p == '\\') {
+            putchar('\\');
+            putchar(*p);
+        } else if (*p < 0x20) {
+            printf("\\u%04x", *p);
+        } else {
+            putchar(*p);
+        }
+    }
+    putchar('"');
+}
+
+// Ответ на запрос одной строкой NDJSON:
+// {"query":..., "total":N, "time_ms":T, "offset":O, "results":[{"doc_id":..., "title":..., "url":...}]}
+void print_results_json(const SegmentSet& segments, const char* query,
+                        const SegmentResults& results, double elapsed_ms,
+                        size_t offset, size_t limit) {
+    size_t total = results.count();
+    if (offset > total) offset = total;
+    
+    DynamicArray<uint32_t> page;
+    results.window(offset, limit, page);
+    
+    printf("{\"query\":");
+    print_json_string(query);
+    printf(",\"total\":%zu,\"time_ms\":%.3f,\"offset\":%zu,\"results\":[",
+           total, elapsed_ms, offset);
+    
+    bool first = true;
+    for (size_t i = 0; i < page.size; i++) {
+        const Document* doc = segments.get_document(page[i]);
+        if (!doc) continue;
+        
+        printf("%s{\"doc_id\":%u,\"title\":", first ? "" : ",", page[i]);
+        print_json_string(doc->title);
+        printf(",\"url\":");
+        print_json_string(doc->url);
+        putchar('}');
+        first = false;
+    }
+    
+    printf("]}\n");
+}
+
 int main(int argc, char** argv) {
     if (argc < 2) {
-        printf("Использование: %s <index_base> [query]\n", argv[0]);
+        printf("Использование: %s <index_base> [--offset N] [--limit N] [--window] [--json] [query]\n", argv[0]);
         printf("\nПримеры:\n");
         printf("  %s index                     # Интерактивный режим\n", argv[0]);
         printf("  %s index < queries.txt       # Пакетная обработка\n", argv[0]);
         printf("  %s index \"osmanlı\"           # Один запрос\n", argv[0]);
+        printf("  %s index --offset 50 \"osmanlı\"  # Вторая страница результатов\n", argv[0]);
+        printf("\nОпции:\n");
+        printf("  --offset N  Пропустить первые N результатов (по умолчанию 0)\n");
+        printf("  --limit N   Вывести не более N результатов (по умолчанию 50)\n");
+        printf("  --window    Интерактивный режим, строки вида \"<offset> <limit> <запрос>\"\n");
+        printf("  --json      Машиночитаемый вывод: один JSON-объект на строку (NDJSON)\n");
         printf("\nСинтаксис запросов:\n");
         printf("  пробел или && - логическое И\n");
         printf("  || - логическое ИЛИ\n");
@@ -112,101 +441,151 @@ int main(int argc, char** argv) {
     }
     
     const char* index_path = argv[1];
+    const char* cli_query = nullptr;
+    size_t cli_offset = 0;
+    size_t cli_limit = 50;
+    bool window_mode = false;
+    bool json_output = false;
+    
+    for (int i = 2; i < argc; i++) {
+        if (strcmp(argv[i], "--offset") == 0 && i + 1 < argc) {
+            cli_offset = strtoul(argv[++i], nullptr, 10);
+        } else if (strcmp(argv[i], "--limit") == 0 && i + 1 < argc) {
+            cli_limit = strtoul(argv[++i], nullptr, 10);
+        } else if (strcmp(argv[i], "--window") == 0) {
+            window_mode = true;
+        } else if (strcmp(argv[i], "--json") == 0) {
+            json_output = true;
+        } else if (!cli_query) {
+            cli_query = argv[i];
+        }
+    }
     
-    printf("Загрузка индекса: %s\n", index_path);
+    if (!json_output) {
+        printf("Загрузка индекса: %s\n", index_path);
+    }
     double load_start = get_time();
     
-    IndexLoader loader;
-    if (!loader.load(index_path)) {
+    // Основной индекс и дельта-сегменты из <index>.segments, если он есть
+    SegmentSet segments;
+    if (!segments.load(index_path)) {
         fprintf(stderr, "Ошибка загрузки индекса!\n");
         return 1;
     }
     
     double load_time = get_time() - load_start;
-    printf("Индекс загружен за %.3f сек\n", load_time);
-    printf("Документов: %u, Термов: %u\n\n", 
-           loader.get_total_documents(), loader.get_total_terms());
+    if (json_output) {
+        // Первая строка - признак готовности процесса
+        printf("{\"documents\":%u,\"terms\":%u,\"load_time_ms\":%.3f}\n",
+               segments.get_total_documents(), segments.get_total_terms(), load_time * 1000);
+    } else {
+        printf("Индекс загружен за %.3f сек\n", load_time);
+        printf("Документов: %u, Термов: %u\n\n", 
+               segments.get_total_documents(), segments.get_total_terms());
+        if (segments.size() > 1) {
+            printf("Сегментов: %zu\n\n", segments.size());
+        }
+    }
+    fflush(stdout);
     
-    if (argc >= 3) {
-        const char* query = argv[2];
+    if (cli_query) {
+        const char* query = cli_query;
         
-        printf("Запрос: %s\n", query);
         double start = get_time();
         
-        BooleanQueryParser parser(query);
-        QueryEvaluator evaluator(&parser, &loader);
-        DynamicArray<uint32_t> results = evaluator.evaluate();
+        SegmentResults results;
+        evaluate_query(segments, query, results);
         
         double elapsed = get_time() - start;
         
-        printf("Найдено документов: %zu (%.3f мс)\n\n", results.size, elapsed * 1000);
-        
-        for (size_t i = 0; i < results.size && i < 50; i++) {
-            const Document* doc = loader.get_document(results[i]);
-            if (doc) {
-                printf("%3zu. %s\n", i+1, doc->title);
-                printf("     %s\n\n", doc->url);
-            }
+        if (json_output) {
+            print_results_json(segments, query, results, elapsed * 1000, cli_offset, cli_limit);
+            return 0;
         }
         
-        if (results.size > 50) {
-            printf("... и еще %zu документов\n", results.size - 50);
-        }
+        printf("Запрос: %s\n", query);
+        printf("Найдено документов: %zu (%.3f мс)\n\n", results.count(), elapsed * 1000);
+        
+        print_results(segments, results, cli_offset, cli_limit, "\n");
         
         return 0;
     }
     
-    char query[1024];
+    char line[1024];
+    
+    // Количество выводимых результатов в интерактивном режиме
+    size_t results_limit = 10;
+    if (getenv("SEARCH_RESULTS_LIMIT")) {
+        results_limit = strtoul(getenv("SEARCH_RESULTS_LIMIT"), nullptr, 10);
+    }
     
-    if (isatty(fileno(stdin))) {
+    bool prompt = isatty(fileno(stdin)) && !json_output;
+    
+    if (prompt) {
         printf("Интерактивный режим. Введите запрос (Ctrl+D для выхода):\n");
     }
     
     while (true) {
-        if (isatty(fileno(stdin))) {
+        if (prompt) {
             printf("> ");
             fflush(stdout);
         }
         
-        if (!fgets(query, sizeof(query), stdin)) {
+        if (!fgets(line, sizeof(line), stdin)) {
             break;
         }
         
         // Удаление перевода строки
-        size_t len = strlen(query);
-        if (len > 0 && query[len-1] == '\n') {
-            query[len-1] = '\0';
+        size_t len = strlen(line);
+        if (len > 0 && line[len-1] == '\n') {
+            line[len-1] = '\0';
             len--;
         }
         
         if (len == 0) continue;
         
+        const char* query = line;
+        size_t offset = 0;
+        size_t limit = results_limit;
+        
+        if (window_mode) {
+            // Строка вида "<offset> <limit> <запрос>" (пул процессов web_search.py)
+            int consumed = 0;
+            if (sscanf(line, "%zu %zu %n", &offset, &limit, &consumed) < 2 || consumed == 0) {
+                if (json_output) {
+                    printf("{\"error\":\"expected <offset> <limit> <query>\"}\n");
+                } else {
+                    printf("Ошибка: ожидается \"<offset> <limit> <запрос>\"\n\n");
+                }
+                fflush(stdout);
+                continue;
+            }
+            query = line + consumed;
+        }
+        
         double start = get_time();
         
-        BooleanQueryParser parser(query);
-        QueryEvaluator evaluator(&parser, &loader);
-        DynamicArray<uint32_t> results = evaluator.evaluate();
+        SegmentResults results;
+        evaluate_query(segments, query, results);
         
         double elapsed = get_time() - start;
         
-        printf("Запрос: %s\n", query);
-        printf("Найдено: %zu документов (%.3f мс)\n", results.size, elapsed * 1000);
-        
-        for (size_t i = 0; i < results.size && i < 10; i++) {
-            const Document* doc = loader.get_document(results[i]);
-            if (doc) {
-                printf("%3zu. %s\n", i+1, doc->title);
-                printf("     %s\n", doc->url);
-            }
+        if (json_output) {
+            print_results_json(segments, query, results, elapsed * 1000, offset, limit);
+            fflush(stdout);
+            continue;
         }
         
-        if (results.size > 10) {
-            printf("... и еще %zu документов\n", results.size - 10);
-        }
+        printf("Запрос: %s\n", query);
+        printf("Найдено: %zu документов (%.3f мс)\n", results.count(), elapsed * 1000);
+        
+        print_results(segments, results, offset, limit, "");
         
+        // Пустая строка - конец ответа; сбрасываем буфер, чтобы ответ
+        // сразу дошел до читателя на другом конце pipe
         printf("\n");
+        fflush(stdout);
     }
     
     return 0;
 }
-
@@ -13,8 +13,22 @@ private:
     Document* documents;
     Term* terms;
     
+    // Прямая адресация: doc_index[doc_id] - номер документа + 1 (0 - нет)
+    uint32_t* doc_index;
+    uint32_t max_doc_id;
+    
+    // Размер плоских битовых карт в словах: биты 0..max(max_doc_id, total_documents)
+    size_t bitmap_words;
+    
+    // Существующие doc_id по возрастанию и их битовая карта (bitmap_words
+    // слов). Отрицание дополняет до них, а не до 1..total_documents: после
+    // слияния с удалением и при doc_id из реестра в нумерации есть пропуски
+    DynamicArray<uint32_t> doc_ids;
+    uint64_t* doc_bitmap;
+    
 public:
-    IndexLoader() : documents(nullptr), terms(nullptr) {
+    IndexLoader() : documents(nullptr), terms(nullptr), doc_index(nullptr), max_doc_id(0),
+                    bitmap_words(0), doc_bitmap(nullptr) {
         memset(&metadata, 0, sizeof(metadata));
     }
     
@@ -30,10 +44,14 @@ public:
             delete[] documents;
         }
         
+        if (doc_index) delete[] doc_index;
+        free(doc_bitmap);
+        
         if (terms) {
             for (uint32_t i = 0; i < metadata.total_unique_terms; i++) {
                 if (terms[i].term) free(terms[i].term);
                 if (terms[i].doc_ids) free(terms[i].doc_ids);
+                if (terms[i].bitmap) free(terms[i].bitmap);
             }
             delete[] terms;
         }
@@ -60,6 +78,11 @@ public:
             return false;
         }
         
+        doc_bitmap = (uint64_t*)calloc(bitmap_words, sizeof(uint64_t));
+        for (size_t i = 0; i < doc_ids.size; i++) {
+            doc_bitmap[doc_ids[i] >> 6] |= (uint64_t)1 << (doc_ids[i] & 63);
+        }
+        
         return true;
     }
     
@@ -96,12 +119,10 @@ public:
     }
     
     const Document* get_document(uint32_t doc_id) const {
-        for (uint32_t i = 0; i < metadata.total_documents; i++) {
-            if (documents[i].doc_id == doc_id) {
-                return &documents[i];
-            }
+        if (doc_id > max_doc_id || doc_index[doc_id] == 0) {
+            return nullptr;
         }
-        return nullptr;
+        return &documents[doc_index[doc_id] - 1];
     }
     
     uint32_t get_total_documents() const {
@@ -112,6 +133,28 @@ public:
         return metadata.total_unique_terms;
     }
     
+    size_t get_bitmap_words() const {
+        return bitmap_words;
+    }
+    
+    uint32_t get_max_doc_id() const {
+        return max_doc_id;
+    }
+    
+    // doc_id всех документов по возрастанию
+    const DynamicArray<uint32_t>& get_doc_ids() const {
+        return doc_ids;
+    }
+    
+    const uint64_t* get_doc_bitmap() const {
+        return doc_bitmap;
+    }
+    
+    // doc_id идут подряд 1..N без пропусков
+    bool is_dense() const {
+        return doc_ids.size == max_doc_id;
+    }
+    
 private:
     bool load_metadata(const char* path) {
         FILE* f = fopen(path, "rb");
@@ -123,6 +166,11 @@ private:
         if (read != 1 || metadata.magic != INDEX_MAGIC) {
             return false;
         }
+        if (metadata.version != INDEX_VERSION) {
+            fprintf(stderr, "Версия индекса %s: 0x%04x, поддерживается 0x%04x - перестройте индекс\n",
+                    path, metadata.version, INDEX_VERSION);
+            return false;
+        }
         
         return true;
     }
@@ -137,6 +185,12 @@ private:
             return false;
         }
         
+        // Таблица смещений нужна читателям через mmap; здесь все записи
+        // читаются подряд, поэтому она пропускается
+        if (metadata.flags & FLAG_DOC_TABLE) {
+            fseek(f, ((long)reserved + 1) * 4, SEEK_CUR);
+        }
+        
         documents = new Document[num_docs];
         for (uint32_t i = 0; i < num_docs; i++) {
             documents[i].url = nullptr;
@@ -159,9 +213,24 @@ private:
             if (fread(&documents[i].content_length, 4, 1, f) != 1) goto error;
             if (fread(&documents[i].token_count, 4, 1, f) != 1) goto error;
             if (fread(&documents[i].unique_terms, 4, 1, f) != 1) goto error;
+            
+            if (documents[i].doc_id > max_doc_id) max_doc_id = documents[i].doc_id;
         }
         
         fclose(f);
+        
+        doc_index = new uint32_t[max_doc_id + 1];
+        memset(doc_index, 0, (max_doc_id + 1) * sizeof(uint32_t));
+        for (uint32_t i = 0; i < num_docs; i++) {
+            if (doc_index[documents[i].doc_id] == 0) {
+                doc_index[documents[i].doc_id] = i + 1;
+            }
+        }
+        
+        for (uint32_t doc_id = 1; doc_id <= max_doc_id; doc_id++) {
+            if (doc_index[doc_id]) doc_ids.push_back(doc_id);
+        }
+        
         return true;
         
     error:
@@ -169,6 +238,20 @@ private:
         return false;
     }
     
+    // [u32 payload_size][payload] битовой карты или [varint payload_size][payload]
+    // сжатого списка в buffer, который растет по необходимости
+    static bool read_payload(FILE* f, bool varint_size, uint8_t*& buffer, uint32_t& capacity,
+                             uint32_t& size) {
+        if (varint_size ? !read_varint(f, size) : fread(&size, 4, 1, f) != 1) return false;
+        
+        if (size > capacity) {
+            free(buffer);
+            capacity = size;
+            buffer = (uint8_t*)malloc(capacity);
+        }
+        return fread(buffer, 1, size, f) == size;
+    }
+    
     bool load_inverted_index(const char* path) {
         FILE* f = fopen(path, "rb");
         if (!f) return false;
@@ -183,8 +266,17 @@ private:
         for (uint32_t i = 0; i < num_terms; i++) {
             terms[i].term = nullptr;
             terms[i].doc_ids = nullptr;
+            terms[i].bitmap = nullptr;
         }
         
+        uint32_t max_bit = max_doc_id > metadata.total_documents ? max_doc_id : metadata.total_documents;
+        bitmap_words = (max_bit >> 6) + 1;
+        
+        // Буфер под сжатый постинг-лист или битовую карту
+        uint8_t* buffer = nullptr;
+        uint32_t buffer_capacity = 0;
+        uint32_t payload_size = 0;
+        
         for (uint32_t i = 0; i < num_terms; i++) {
             if (fread(&terms[i].term_length, 2, 1, f) != 1) goto error;
             
@@ -194,22 +286,111 @@ private:
             
             if (fread(&terms[i].document_frequency, 4, 1, f) != 1) goto error;
             
+            if (metadata.flags & FLAG_BITMAPS) {
+                uint8_t encoding;
+                if (fread(&encoding, 1, 1, f) != 1) goto error;
+                
+                if (encoding == POSTING_BITMAP) {
+                    if (!read_payload(f, false, buffer, buffer_capacity, payload_size)) goto error;
+                    
+                    terms[i].bitmap = (uint64_t*)calloc(bitmap_words, sizeof(uint64_t));
+                    if (!decode_bitmap(buffer, payload_size, terms[i].bitmap, bitmap_words,
+                                       terms[i].document_frequency)) goto error;
+                    continue;
+                }
+            }
+            
             terms[i].doc_ids = (uint32_t*)malloc(terms[i].document_frequency * sizeof(uint32_t));
-            if (fread(terms[i].doc_ids, 4, terms[i].document_frequency, f) != terms[i].document_frequency) goto error;
+            
+            if (metadata.flags & FLAG_COMPRESSED) {
+                if (!read_payload(f, true, buffer, buffer_capacity, payload_size)) goto error;
+                if (!decode_postings(buffer, payload_size, terms[i].doc_ids,
+                                     terms[i].document_frequency)) goto error;
+            } else {
+                if (fread(terms[i].doc_ids, 4, terms[i].document_frequency, f) != terms[i].document_frequency) goto error;
+            }
         }
         
+        free(buffer);
         fclose(f);
         return true;
         
     error:
+        free(buffer);
         fclose(f);
         return false;
     }
 };
 
+// Если один список длиннее другого в GALLOP_RATIO раз и больше,
+// пересечение идет галопом по длинному списку вместо слияния
+#define GALLOP_RATIO 16
+
+// Первая позиция pos >= from в отсортированном list, где list[pos] >= value:
+// экспоненциальный шаг от from, затем бинарный поиск в найденном интервале
+inline uint32_t gallop_to(const uint32_t* list, uint32_t size, uint32_t from, uint32_t value) {
+    if (from >= size || list[from] >= value) return from;
+    
+    // Инвариант: list[low] < value, list[high] >= value или high == size
+    uint32_t low = from;
+    uint32_t step = 1;
+    uint32_t high = from + 1;
+    
+    while (high < size && list[high] < value) {
+        low = high;
+        step <<= 1;
+        high = (size - low > step) ? low + step : size;
+    }
+    
+    low++;
+    while (low < high) {
+        uint32_t mid = low + (high - low) / 2;
+        if (list[mid] < value) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    
+    return low;
+}
+
+// Каждый doc_id короткого списка ищется галопом в длинном:
+// O(m log(n/m)) вместо O(m + n)
+DynamicArray<uint32_t> gallop_intersect(const uint32_t* small, uint32_t small_size,
+                                         const uint32_t* large, uint32_t large_size) {
+    DynamicArray<uint32_t> result;
+    uint32_t j = 0;
+    
+    for (uint32_t i = 0; i < small_size && j < large_size; i++) {
+        j = gallop_to(large, large_size, j, small[i]);
+        if (j < large_size && large[j] == small[i]) {
+            result.push_back(small[i]);
+            j++;
+        }
+    }
+    
+    return result;
+}
+
 DynamicArray<uint32_t> intersect_postings(const uint32_t* list1, uint32_t size1,
                                            const uint32_t* list2, uint32_t size2) {
+    if (size1 > size2) {
+        const uint32_t* list = list1;
+        list1 = list2;
+        list2 = list;
+        uint32_t size = size1;
+        size1 = size2;
+        size2 = size;
+    }
+    
     DynamicArray<uint32_t> result;
+    if (size1 == 0) return result;
+    
+    if ((uint64_t)size1 * GALLOP_RATIO <= size2) {
+        return gallop_intersect(list1, size1, list2, size2);
+    }
+    
     uint32_t i = 0, j = 0;
     
     while (i < size1 && j < size2) {
@@ -252,22 +433,580 @@ DynamicArray<uint32_t> union_postings(const uint32_t* list1, uint32_t size1,
     return result;
 }
 
-DynamicArray<uint32_t> negate_postings(const uint32_t* list, uint32_t size,
-                                        uint32_t total_docs) {
+// Элементы list1, которых нет в list2, за один проход; если list2 намного
+// длиннее, он проходится галопом
+DynamicArray<uint32_t> difference_postings(const uint32_t* list1, uint32_t size1,
+                                            const uint32_t* list2, uint32_t size2) {
     DynamicArray<uint32_t> result;
+    bool gallop = (uint64_t)size1 * GALLOP_RATIO <= size2;
     uint32_t j = 0;
     
-    for (uint32_t doc_id = 1; doc_id <= total_docs; doc_id++) {
-        if (j < size && list[j] == doc_id) {
+    for (uint32_t i = 0; i < size1; i++) {
+        if (gallop) {
+            j = gallop_to(list2, size2, j, list1[i]);
+        } else {
+            while (j < size2 && list2[j] < list1[i]) j++;
+        }
+        
+        if (j < size2 && list2[j] == list1[i]) {
             j++;
         } else {
-            result.push_back(doc_id);
+            result.push_back(list1[i]);
         }
     }
     
     return result;
 }
 
+// Первая позиция в list, где list[pos] >= value
+inline size_t lower_bound_postings(const uint32_t* list, size_t size, uint64_t value) {
+    size_t low = 0, high = size;
+    while (low < high) {
+        size_t mid = low + (high - low) / 2;
+        if (list[mid] < value) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    return low;
+}
+
+// Промежуточный результат запроса: постинг-лист или битовая карта терма
+// из индекса используются напрямую, без копирования; собственный массив
+// нужен только для результатов операций. size - число документов при
+// любом представлении.
+// Результат запроса верхнего уровня вида !x хранится лениво: complement
+// означает "документы сегмента, которых нет в data" - doc_id 1..universe,
+// а при пропусках в нумерации universe doc_id из universe_ids. data -
+// подмножество существующих doc_id (постинги и удаленные документы)
+struct PostingList {
+    const uint32_t* data;
+    size_t size;
+    DynamicArray<uint32_t> owned;
+    const uint64_t* bits;
+    size_t words;
+    DynamicArray<uint64_t> owned_bits;
+    bool complement;
+    uint32_t universe;
+    const uint32_t* universe_ids;
+    
+    PostingList() : data(nullptr), size(0), bits(nullptr), words(0),
+                    complement(false), universe(0), universe_ids(nullptr) {}
+    
+    PostingList(const PostingList&) = delete;
+    PostingList& operator=(const PostingList&) = delete;
+    
+    bool is_bitmap() const {
+        return bits != nullptr;
+    }
+    
+    bool contains(uint32_t doc_id) const {
+        return (doc_id >> 6) < words && (bits[doc_id >> 6] >> (doc_id & 63)) & 1;
+    }
+    
+    void borrow(const uint32_t* list, size_t count) {
+        data = list;
+        size = count;
+        bits = nullptr;
+    }
+    
+    void borrow_bitmap(const uint64_t* bitmap, size_t num_words, size_t count) {
+        bits = bitmap;
+        words = num_words;
+        size = count;
+        data = nullptr;
+    }
+    
+    // Забрать массив array (он получает прежнее содержимое owned)
+    void take(DynamicArray<uint32_t>& array) {
+        owned.swap(array);
+        borrow(owned.data, owned.size);
+    }
+    
+    void take_bitmap(DynamicArray<uint64_t>& bitmap, size_t count) {
+        owned_bits.swap(bitmap);
+        borrow_bitmap(owned_bits.data, owned_bits.size, count);
+    }
+    
+    void take(PostingList& other) {
+        if (other.bits) {
+            if (other.bits == other.owned_bits.data) {
+                take_bitmap(other.owned_bits, other.size);
+            } else {
+                borrow_bitmap(other.bits, other.words, other.size);
+            }
+        } else if (other.data == other.owned.data && other.owned.data) {
+            take(other.owned);
+        } else {
+            borrow(other.data, other.size);
+        }
+    }
+    
+    void clear() {
+        data = nullptr;
+        bits = nullptr;
+        size = 0;
+    }
+    
+    // Дополнение до doc_id 1..total_docs или, если ids не nullptr, до
+    // total_docs отсортированных doc_id из ids
+    void set_complement(uint32_t total_docs, const uint32_t* ids = nullptr) {
+        complement = true;
+        universe = total_docs;
+        universe_ids = ids;
+    }
+    
+    // Число документов в результате
+    size_t count() const {
+        if (!complement) return size;
+        if (universe_ids) return universe > size ? universe - size : 0;
+        
+        size_t first = lower_bound_postings(data, size, 1);
+        size_t last = lower_bound_postings(data, size, (uint64_t)universe + 1);
+        return universe - (last - first);
+    }
+    
+    // Окно результата [offset, offset + limit) в page; для дополнения
+    // начало окна находится бинарным поиском, без обхода 1..offset,
+    // для битовой карты - по числу единиц в словах
+    void window(size_t offset, size_t limit, DynamicArray<uint32_t>& page) const {
+        if (bits) {
+            size_t skipped = 0;
+            size_t w = 0;
+            
+            for (; w < words; w++) {
+                size_t ones = __builtin_popcountll(bits[w]);
+                if (skipped + ones > offset) break;
+                skipped += ones;
+            }
+            
+            for (; w < words && page.size < limit; w++) {
+                uint64_t word = bits[w];
+                while (word && page.size < limit) {
+                    uint32_t bit = __builtin_ctzll(word);
+                    word &= word - 1;
+                    if (skipped++ < offset) continue;
+                    page.push_back((uint32_t)(w * 64 + bit));
+                }
+            }
+            return;
+        }
+        
+        if (!complement) {
+            for (size_t i = offset; i < size && i - offset < limit; i++) {
+                page.push_back(data[i]);
+            }
+            return;
+        }
+        
+        if (universe_ids) {
+            // Среди universe_ids[0..k] в результат попадают k + 1 минус число
+            // элементов data <= universe_ids[k]; ищем первое k, где их больше
+            // offset
+            size_t low = 0, high = universe;
+            while (low < high) {
+                size_t mid = low + (high - low) / 2;
+                size_t taken = lower_bound_postings(data, size, (uint64_t)universe_ids[mid] + 1);
+                if (mid + 1 <= offset + taken) {
+                    low = mid + 1;
+                } else {
+                    high = mid;
+                }
+            }
+            
+            size_t j = low < universe ? lower_bound_postings(data, size, universe_ids[low]) : size;
+            for (size_t k = low; k < universe && page.size < limit; k++) {
+                if (j < size && data[j] == universe_ids[k]) {
+                    j++;
+                } else {
+                    page.push_back(universe_ids[k]);
+                }
+            }
+            return;
+        }
+        
+        size_t first = lower_bound_postings(data, size, 1);
+        size_t last = lower_bound_postings(data, size, (uint64_t)universe + 1);
+        
+        // Перед data[j] пропущено data[j] - (j - first) - 1 документов;
+        // ищем, сколько элементов data лежит до документа номер offset
+        size_t low = first, high = last;
+        while (low < high) {
+            size_t mid = low + (high - low) / 2;
+            if (data[mid] - (mid - first) - 1 <= offset) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        
+        size_t j = low;
+        uint64_t doc_id = (uint64_t)offset + 1 + (low - first);
+        
+        while (page.size < limit && doc_id <= universe) {
+            if (j < last && data[j] == doc_id) {
+                j++;
+            } else {
+                page.push_back((uint32_t)doc_id);
+            }
+            doc_id++;
+        }
+    }
+};
+
+// Операции над результатами с любым представлением операндов: два списка
+// сливаются как раньше, две битовые карты обрабатываются по 64 документа
+// за операцию, список с картой - проверкой битов для элементов списка
+
+inline void alloc_bitmap(DynamicArray<uint64_t>& bitmap, size_t words) {
+    bitmap.reserve(words);
+    memset(bitmap.data, 0, words * sizeof(uint64_t));
+    bitmap.size = words;
+}
+
+inline void copy_bitmap(const PostingList& list, DynamicArray<uint64_t>& bitmap) {
+    alloc_bitmap(bitmap, list.words);
+    memcpy(bitmap.data, list.bits, list.words * sizeof(uint64_t));
+}
+
+void intersect_lists(const PostingList& a, const PostingList& b, PostingList& out) {
+    if (a.bits && b.bits) {
+        DynamicArray<uint64_t> bitmap;
+        alloc_bitmap(bitmap, a.words);
+        size_t count = 0;
+        
+        for (size_t w = 0; w < a.words; w++) {
+            bitmap.data[w] = a.bits[w] & b.bits[w];
+            count += __builtin_popcountll(bitmap.data[w]);
+        }
+        out.take_bitmap(bitmap, count);
+        return;
+    }
+    
+    if (a.bits || b.bits) {
+        const PostingList& list = a.bits ? b : a;
+        const PostingList& bitmap = a.bits ? a : b;
+        DynamicArray<uint32_t> result;
+        
+        for (size_t i = 0; i < list.size; i++) {
+            if (bitmap.contains(list.data[i])) result.push_back(list.data[i]);
+        }
+        out.take(result);
+        return;
+    }
+    
+    DynamicArray<uint32_t> result = intersect_postings(a.data, a.size, b.data, b.size);
+    out.take(result);
+}
+
+void union_lists(const PostingList& a, const PostingList& b, PostingList& out) {
+    if (a.bits && b.bits) {
+        DynamicArray<uint64_t> bitmap;
+        alloc_bitmap(bitmap, a.words);
+        size_t count = 0;
+        
+        for (size_t w = 0; w < a.words; w++) {
+            bitmap.data[w] = a.bits[w] | b.bits[w];
+            count += __builtin_popcountll(bitmap.data[w]);
+        }
+        out.take_bitmap(bitmap, count);
+        return;
+    }
+    
+    if (a.bits || b.bits) {
+        const PostingList& list = a.bits ? b : a;
+        const PostingList& source = a.bits ? a : b;
+        DynamicArray<uint64_t> bitmap;
+        copy_bitmap(source, bitmap);
+        size_t count = source.size;
+        
+        for (size_t i = 0; i < list.size; i++) {
+            uint32_t doc_id = list.data[i];
+            uint64_t mask = (uint64_t)1 << (doc_id & 63);
+            if (!(bitmap.data[doc_id >> 6] & mask)) {
+                bitmap.data[doc_id >> 6] |= mask;
+                count++;
+            }
+        }
+        out.take_bitmap(bitmap, count);
+        return;
+    }
+    
+    DynamicArray<uint32_t> result = union_postings(a.data, a.size, b.data, b.size);
+    out.take(result);
+}
+
+// Документы a, которых нет в b
+void difference_lists(const PostingList& a, const PostingList& b, PostingList& out) {
+    if (!a.bits && !b.bits) {
+        DynamicArray<uint32_t> result = difference_postings(a.data, a.size, b.data, b.size);
+        out.take(result);
+        return;
+    }
+    
+    if (!a.bits) {
+        DynamicArray<uint32_t> result;
+        for (size_t i = 0; i < a.size; i++) {
+            if (!b.contains(a.data[i])) result.push_back(a.data[i]);
+        }
+        out.take(result);
+        return;
+    }
+    
+    DynamicArray<uint64_t> bitmap;
+    size_t count = 0;
+    
+    if (b.bits) {
+        alloc_bitmap(bitmap, a.words);
+        for (size_t w = 0; w < a.words; w++) {
+            bitmap.data[w] = a.bits[w] & ~b.bits[w];
+            count += __builtin_popcountll(bitmap.data[w]);
+        }
+    } else {
+        copy_bitmap(a, bitmap);
+        count = a.size;
+        
+        for (size_t i = 0; i < b.size; i++) {
+            uint32_t doc_id = b.data[i];
+            uint64_t mask = (uint64_t)1 << (doc_id & 63);
+            if ((doc_id >> 6) < bitmap.size && (bitmap.data[doc_id >> 6] & mask)) {
+                bitmap.data[doc_id >> 6] &= ~mask;
+                count--;
+            }
+        }
+    }
+    out.take_bitmap(bitmap, count);
+}
+
+// Дополнение до существующих документов (их битовая карта universe из words
+// слов, IndexLoader::get_doc_bitmap) - всегда битовая карта из words слов
+void complement_list(const PostingList& a, const uint64_t* universe, size_t words, PostingList& out) {
+    DynamicArray<uint64_t> bitmap;
+    alloc_bitmap(bitmap, words);
+    memcpy(bitmap.data, universe, words * sizeof(uint64_t));
+    
+    if (a.bits) {
+        for (size_t w = 0; w < words && w < a.words; w++) bitmap.data[w] &= ~a.bits[w];
+    } else {
+        for (size_t i = 0; i < a.size; i++) {
+            uint32_t doc_id = a.data[i];
+            if ((doc_id >> 6) < words) {
+                bitmap.data[doc_id >> 6] &= ~((uint64_t)1 << (doc_id & 63));
+            }
+        }
+    }
+    
+    size_t count = 0;
+    for (size_t w = 0; w < words; w++) count += __builtin_popcountll(bitmap.data[w]);
+    out.take_bitmap(bitmap, count);
+}
+
+// Сегменты индекса (инкрементальная индексация)
+//
+// Манифест <index>.segments перечисляет сегменты от старых к новым строками
+// "<base> <имя>" (имя - относительно каталога индекса, '#' - комментарий).
+// Глобальный doc_id = base + локальный doc_id сегмента; диапазоны doc_id
+// сегментов не пересекаются и идут по возрастанию - SegmentSet::load
+// отказывается загружать манифест, где это не так (основной индекс
+// перестроен мимо update_index.py rebuild). Удаленные документы и
+// старые версии замененных (<сегмент>.deleted) попадают в hidden и в
+// результаты не выходят. Без манифеста индекс - один сегмент с base 0.
+struct Segment {
+    IndexLoader loader;
+    uint32_t base;
+    DynamicArray<uint32_t> hidden;
+    
+    Segment() : base(0) {}
+    
+    // Загрузить сегмент и отсортированный список его удаленных doc_id
+    bool load(const char* path) {
+        if (!loader.load(path)) return false;
+        
+        uint64_t* deleted;
+        size_t words;
+        if (!read_deleted_docs(path, deleted, words)) return false;
+        
+        for (size_t w = 0; w < words; w++) {
+            uint64_t word = deleted[w];
+            while (word) {
+                hidden.push_back((uint32_t)(w * 64 + __builtin_ctzll(word)));
+                word &= word - 1;
+            }
+        }
+        free(deleted);
+        return true;
+    }
+};
+
+class SegmentSet {
+private:
+    DynamicArray<Segment*> segments;
+    uint32_t total_documents;
+    uint32_t total_terms;
+    
+public:
+    SegmentSet() : total_documents(0), total_terms(0) {}
+    
+    SegmentSet(const SegmentSet&) = delete;
+    SegmentSet& operator=(const SegmentSet&) = delete;
+    
+    ~SegmentSet() {
+        for (size_t i = 0; i < segments.size; i++) {
+            delete segments[i];
+        }
+    }
+    
+    bool load(const char* index_path) {
+        char path[512];
+        snprintf(path, sizeof(path), "%s.segments", index_path);
+        
+        FILE* f = fopen(path, "r");
+        if (!f) {
+            Segment* segment = new Segment();
+            segments.push_back(segment);
+            if (!segment->load(index_path)) return false;
+        } else {
+            const char* slash = strrchr(index_path, '/');
+            int dir_length = slash ? (int)(slash - index_path + 1) : 0;
+            
+            char line[1024];
+            char name[256];
+            char segment_path[400];
+            unsigned long base;
+            bool ok = true;
+            
+            while (ok && fgets(line, sizeof(line), f)) {
+                if (line[0] == '#' || sscanf(line, "%lu %255s", &base, name) != 2) continue;
+                
+                snprintf(segment_path, sizeof(segment_path), "%.*s%s", dir_length, index_path, name);
+                Segment* segment = new Segment();
+                segment->base = (uint32_t)base;
+                segments.push_back(segment);
+                ok = segment->load(segment_path);
+            }
+            fclose(f);
+            
+            if (!ok) return false;
+            if (segments.size == 0) {
+                fprintf(stderr, "В манифесте нет сегментов: %s.segments\n", index_path);
+                return false;
+            }
+        }
+        
+        for (size_t s = 0; s + 1 < segments.size; s++) {
+            uint64_t end = (uint64_t)segments[s]->base + segments[s]->loader.get_max_doc_id();
+            if (end > segments[s + 1]->base) {
+                fprintf(stderr, "Сегмент %zu (doc_id до %llu) пересекается со следующим (base %u): "
+                        "перестройте индекс через update_index.py rebuild\n",
+                        s, (unsigned long long)end, segments[s + 1]->base);
+                return false;
+            }
+        }
+        
+        for (size_t s = 0; s < segments.size; s++) {
+            total_documents += segments[s]->loader.get_total_documents() - segments[s]->hidden.size;
+            total_terms += segments[s]->loader.get_total_terms();
+        }
+        return true;
+    }
+    
+    size_t size() const {
+        return segments.size;
+    }
+    
+    Segment& operator[](size_t index) {
+        return *segments[index];
+    }
+    
+    // Документ по глобальному doc_id
+    const Document* get_document(uint32_t doc_id) const {
+        for (size_t s = segments.size; s-- > 0;) {
+            if (doc_id > segments[s]->base) {
+                return segments[s]->loader.get_document(doc_id - segments[s]->base);
+            }
+        }
+        return nullptr;
+    }
+    
+    // Видимые документы всех сегментов
+    uint32_t get_total_documents() const {
+        return total_documents;
+    }
+    
+    // Сумма словарей сегментов (общие термы считаются в каждом)
+    uint32_t get_total_terms() const {
+        return total_terms;
+    }
+};
+
+// Убрать из результата сегмента удаленные документы
+void exclude_hidden(PostingList& result, const DynamicArray<uint32_t>& hidden) {
+    if (hidden.size == 0) return;
+    
+    PostingList excluded;
+    excluded.borrow(hidden.data, hidden.size);
+    
+    PostingList rest;
+    if (result.complement) {
+        // Ленивое !x остается ленивым: дополнение к x и скрытым
+        union_lists(result, excluded, rest);
+    } else {
+        difference_lists(result, excluded, rest);
+    }
+    result.take(rest);
+}
+
+// Результат запроса по всем сегментам: по PostingList на сегмент в
+// локальных doc_id; count и window - по всем сегментам в глобальных doc_id
+struct SegmentResults {
+    DynamicArray<PostingList*> parts;
+    DynamicArray<uint32_t> bases;
+    
+    SegmentResults() {}
+    
+    SegmentResults(const SegmentResults&) = delete;
+    SegmentResults& operator=(const SegmentResults&) = delete;
+    
+    ~SegmentResults() {
+        for (size_t i = 0; i < parts.size; i++) {
+            delete parts[i];
+        }
+    }
+    
+    PostingList& add(uint32_t base) {
+        PostingList* part = new PostingList();
+        parts.push_back(part);
+        bases.push_back(base);
+        return *part;
+    }
+    
+    size_t count() const {
+        size_t total = 0;
+        for (size_t i = 0; i < parts.size; i++) {
+            total += parts[i]->count();
+        }
+        return total;
+    }
+    
+    void window(size_t offset, size_t limit, DynamicArray<uint32_t>& page) const {
+        for (size_t i = 0; i < parts.size && page.size < limit; i++) {
+            size_t part_count = parts[i]->count();
+            if (offset >= part_count) {
+                offset -= part_count;
+                continue;
+            }
+            
+            DynamicArray<uint32_t> local;
+            parts[i]->window(offset, limit - page.size, local);
+            for (size_t j = 0; j < local.size; j++) {
+                page.push_back(bases[i] + local[j]);
+            }
+            offset = 0;
+        }
+    }
+};
+
 enum TokenType {
     TOKEN_WORD,
     TOKEN_AND,
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Сверка query_eval.py с ./search на запросах из tests/search_queries.txt"""
+
+import json
+import subprocess
+import sys
+
+from query_eval import InProcessSearcher
+
+INDEX_PATH = sys.argv[1] if len(sys.argv) > 1 else 'index_stemmed'
+QUERIES_FILE = 'tests/search_queries.txt'
+
+def load_queries(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f
+                if line.strip() and not line.startswith('#')]
+
+def run_cli(query):
+    """Всего найдено и все doc_id результата из JSON-вывода ./search"""
+    result = subprocess.run(
+        ['./search', INDEX_PATH, '--json', '--limit', str(2 ** 32 - 1), query],
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+
+    # Первая строка - сведения об индексе, вторая - ответ на запрос
+    response = json.loads(result.stdout.split('\n')[1])
+    return response['total'], [item['doc_id'] for item in response['results']]
+
+print("=== СВЕРКА query_eval.py С ./search ===\n")
+
+searcher = InProcessSearcher(INDEX_PATH)
+failed = 0
+
+for q in load_queries(QUERIES_FILE):
+    expected_total, expected_ids = run_cli(q)
+    result = searcher.search(q, limit=searcher.total_documents)
+    doc_ids = [item['doc_id'] for item in result['results']]
+
+    if result['total'] == expected_total and doc_ids == expected_ids:
+        print(f"  OK {q}: {result['total']}")
+    else:
+        print(f"  ОШИБКА {q}: {result['total']} (ожидалось {expected_total})")
+        failed += 1
+
+print()
+if failed:
+    print(f"Расхождений: {failed}")
+    sys.exit(1)
+
+print("Все запросы совпадают с ./search")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Перестроение индекса под работающим веб-сервером (SEARCH_BACKEND=inprocess)
+
+InProcessSearcher держит .forward/.inverted отображенными в память.
+build_index заменяет файлы через rename(), поэтому старый поисковик
+дочитывает прежнюю версию, а run_search после смены .meta переходит на
+новую - без SIGBUS от обрезанного файла.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+os.environ['SEARCH_BACKEND'] = 'inprocess'
+
+import web_search
+from query_cache import QueryCache
+
+
+def build(tsv_path, index_path, docs, words):
+    with open(tsv_path, 'w', encoding='utf-8') as f:
+        for doc_id in range(1, docs + 1):
+            f.write(f"{doc_id}\tu{doc_id}\tdoc {doc_id}\t{words}\n")
+    subprocess.run(['./build_index', tsv_path, index_path], check=True, stdout=subprocess.DEVNULL)
+
+
+def total(query):
+    return web_search.run_search(query, 0, 10)['total']
+
+
+print("=== ПЕРЕСТРОЕНИЕ ИНДЕКСА ПОД РАБОТАЮЩИМ СЕРВЕРОМ ===\n")
+
+failed = 0
+
+with tempfile.TemporaryDirectory() as tmp:
+    index_path = os.path.join(tmp, 'index')
+    tsv_path = os.path.join(tmp, 'input.tsv')
+    build(tsv_path, index_path, 500, 'alpha beta')
+
+    web_search.INDEX_PATH = index_path
+    web_search.query_cache = QueryCache(index_path, check_interval=0)
+
+    before = total('alpha')
+    old_searcher = web_search.get_searcher()
+
+    # Новый индекс меньше старого: запись поверх отображенного файла
+    # обрезала бы его
+    build(tsv_path, index_path, 50, 'gamma')
+
+    checks = [
+        ("старый поисковик читает прежнюю версию", old_searcher.search('alpha')['total'], 500),
+        ("до перестроения", before, 500),
+        ("новая версия: alpha", total('alpha'), 0),
+        ("новая версия: gamma", total('gamma'), 50),
+    ]
+
+    for name, got, want in checks:
+        if got == want:
+            print(f"  OK {name}: {got}")
+        else:
+            print(f"  ОШИБКА {name}: {got} (ожидалось {want})")
+            failed += 1
+
+print()
+if failed:
+    print(f"Ошибок: {failed}")
+    sys.exit(1)
+
+print("Индекс перестроен без остановки сервера")
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Отрицание при doc_id с пропусками
+
+1. Основной индекс из 1000 документов, дельта заменяет первые 400 URL, затем
+   merge (scripts/update_index.py) вычищает старые версии из основного
+   индекса: в нем остаются doc_id с пропусками.
+2. Один индекс полной выгрузки с разреженными doc_id реестра
+   (scripts/doc_registry.py): номера не переиспользуются.
+3. Полное перестроение основного индекса, уже покрывающего doc_id дельты:
+   мимо update_index.py rebuild поиск отказывается загружать пересекающиеся
+   сегменты, rebuild сбрасывает манифест до основного индекса.
+
+Результаты ./search и query_eval.py сверяются с перебором по живым
+документам.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from index_segments import load_segments
+from query_eval import InProcessSearcher
+
+MAIN_DOCS = 1000
+REPLACED = 400
+QUERIES = ['!nothing', '!gamma', '!alpha', 'alpha && !gamma', '!(alpha || beta)']
+
+
+def main_words(i):
+    words = ['alpha'] if i % 10 else ['omega']
+    if i % 3 == 0:
+        words.append('gamma')
+    return words
+
+
+def delta_words(i):
+    words = ['beta']
+    if i % 2 == 0:
+        words.append('alpha')
+    return words
+
+
+def write_tsv(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for doc_id, url, words in records:
+            f.write(f"{doc_id}\t{url}\tdoc {doc_id}\t{' '.join(words)}\n")
+
+
+def expected(live, query):
+    """Перебор по живым документам {doc_id: слова} для запросов из QUERIES"""
+    def has(doc_id, word):
+        return word in live[doc_id]
+
+    checks = {
+        '!nothing': lambda d: True,
+        '!gamma': lambda d: not has(d, 'gamma'),
+        '!alpha': lambda d: not has(d, 'alpha'),
+        'alpha && !gamma': lambda d: has(d, 'alpha') and not has(d, 'gamma'),
+        '!(alpha || beta)': lambda d: not (has(d, 'alpha') or has(d, 'beta')),
+    }
+    return sorted(d for d in live if checks[query](d))
+
+
+def run_cli(index_path, query):
+    """Всего найдено и все doc_id результата из JSON-вывода ./search"""
+    result = subprocess.run(
+        ['./search', index_path, '--json', '--limit', str(2 ** 32 - 1), query],
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+    response = json.loads(result.stdout.strip().split('\n')[-1])
+    return response['total'], [item['doc_id'] for item in response['results']]
+
+
+def check(index_path, live):
+    searcher = InProcessSearcher(index_path)
+    failed = 0
+
+    for q in QUERIES:
+        want = expected(live, q)
+        cli_total, cli_ids = run_cli(index_path, q)
+        result = searcher.search(q, limit=len(live))
+        py_ids = [item['doc_id'] for item in result['results']]
+
+        if cli_total == len(want) and cli_ids == want and \
+                result['total'] == len(want) and py_ids == want:
+            print(f"  OK {q}: {len(want)}")
+        else:
+            print(f"  ОШИБКА {q}: ./search {cli_total}/{len(cli_ids)}, "
+                  f"query_eval {result['total']}/{len(py_ids)} (ожидалось {len(want)})")
+            failed += 1
+
+    return failed
+
+
+def test_merged_segments(tmp):
+    index_path = os.path.join(tmp, 'index')
+    main_tsv = os.path.join(tmp, 'main.tsv')
+    delta_tsv = os.path.join(tmp, 'delta.tsv')
+
+    write_tsv(main_tsv, [(i, f"u{i}", main_words(i)) for i in range(1, MAIN_DOCS + 1)])
+    write_tsv(delta_tsv, [(i, f"u{i}", delta_words(i)) for i in range(1, REPLACED + 1)])
+
+    subprocess.run(['./build_index', main_tsv, index_path], check=True, stdout=subprocess.DEVNULL)
+    for command in (['init', index_path, '--since', '0'],
+                    ['add', index_path, '--tsv', delta_tsv],
+                    ['merge', index_path]):
+        subprocess.run([sys.executable, 'scripts/update_index.py'] + command,
+                       check=True, stdout=subprocess.DEVNULL)
+
+    # Дельта получает doc_id сразу за основным индексом
+    live = {i: main_words(i) for i in range(REPLACED + 1, MAIN_DOCS + 1)}
+    live.update({MAIN_DOCS + i: delta_words(i) for i in range(1, REPLACED + 1)})
+    return check(index_path, live)
+
+
+def test_sparse_ids(tmp):
+    index_path = os.path.join(tmp, 'sparse')
+    tsv = os.path.join(tmp, 'sparse.tsv')
+
+    # Из каждых трех doc_id реестра два освобождены измененными документами
+    live = {i: main_words(i) for i in range(1, 3 * MAIN_DOCS, 3)}
+    write_tsv(tsv, [(i, f"u{i}", words) for i, words in live.items()])
+
+    subprocess.run(['./build_index', tsv, index_path], check=True, stdout=subprocess.DEVNULL)
+    return check(index_path, live)
+
+
+def test_full_rebuild(tmp):
+    index_path = os.path.join(tmp, 'rebuilt')
+    main_tsv = os.path.join(tmp, 'rebuilt_main.tsv')
+    delta_tsv = os.path.join(tmp, 'rebuilt_delta.tsv')
+    full_tsv = os.path.join(tmp, 'rebuilt_full.tsv')
+    docs = 100
+
+    # Дельта с новыми документами получает doc_id 101..110, как в реестре
+    write_tsv(main_tsv, [(i, f"u{i}", main_words(i)) for i in range(1, docs + 1)])
+    write_tsv(delta_tsv, [(i, f"u{docs + i}", main_words(docs + i)) for i in range(1, 11)])
+    write_tsv(full_tsv, [(i, f"u{i}", main_words(i)) for i in range(1, docs + 11)])
+
+    subprocess.run(['./build_index', main_tsv, index_path], check=True, stdout=subprocess.DEVNULL)
+    for command in (['init', index_path, '--since', '0'],
+                    ['add', index_path, '--tsv', delta_tsv]):
+        subprocess.run([sys.executable, 'scripts/update_index.py'] + command,
+                       check=True, stdout=subprocess.DEVNULL)
+
+    # Перестроение мимо rebuild: основной индекс накрывает диапазон сегмента
+    subprocess.run(['./build_index', full_tsv, index_path], check=True, stdout=subprocess.DEVNULL)
+    failed = 0
+
+    cli = subprocess.run(['./search', index_path, '--json', 'alpha'],
+                         capture_output=True, text=True, timeout=10)
+    try:
+        load_segments(index_path)
+        py_refused = False
+    except ValueError:
+        py_refused = True
+
+    if cli.returncode != 0 and py_refused:
+        print("  OK пересекающиеся сегменты не загружаются")
+    else:
+        print(f"  ОШИБКА пересекающиеся сегменты загружены: ./search rc {cli.returncode}, "
+              f"load_segments {'отказ' if py_refused else 'загрузил'}")
+        failed += 1
+
+    subprocess.run([sys.executable, 'scripts/update_index.py', 'rebuild', index_path,
+                    '--tsv', full_tsv], check=True, stdout=subprocess.DEVNULL)
+
+    live = {i: main_words(i) for i in range(1, docs + 11)}
+    return failed + check(index_path, live)
+
+
+print("=== ОТРИЦАНИЕ ПРИ DOC_ID С ПРОПУСКАМИ ===\n")
+
+with tempfile.TemporaryDirectory() as tmp:
+    print("После слияния сегментов:")
+    failed = test_merged_segments(tmp)
+    print("Разреженные doc_id реестра:")
+    failed += test_sparse_ids(tmp)
+    print("Полное перестроение при дельта-сегментах:")
+    failed += test_full_rebuild(tmp)
+
+print()
+if failed:
+    print(f"Расхождений: {failed}")
+    sys.exit(1)
+
+print("Все запросы совпадают с перебором")
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from flask import Flask, render_template, request, jsonify
-import subprocess
+from search_pool import SearchPool, SearchTimeout
+from query_cache import QueryCache, normalize_query
+import threading
+import atexit
 import time
 import os
 
@@ -9,6 +12,59 @@ app = Flask(__name__)
 
 INDEX_PATH = "index_stemmed"
 SEARCH_BIN = "./search"
+# Количество процессов ./search в пуле (по умолчанию - по числу ядер)
+POOL_SIZE = int(os.environ.get('SEARCH_POOL_SIZE', os.cpu_count() or 1))
+# pool - пул процессов ./search, inprocess - поиск в процессе (query_eval.py)
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'pool')
+# Кэш результатов: число запросов и время жизни записи (сек)
+CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 1000))
+CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 300))
+# Максимальный размер окна результатов в /api/search
+MAX_API_LIMIT = 1000
+
+searcher = None
+searcher_lock = threading.Lock()
+
+def get_searcher():
+    global searcher
+    
+    with searcher_lock:
+        if searcher is None:
+            if SEARCH_BACKEND == 'inprocess':
+                from query_eval import InProcessSearcher
+                searcher = InProcessSearcher(INDEX_PATH)
+            else:
+                searcher = SearchPool(SEARCH_BIN, INDEX_PATH, POOL_SIZE)
+                atexit.register(searcher.close)
+    
+    return searcher
+
+def reset_searcher():
+    global searcher
+    
+    with searcher_lock:
+        old_searcher, searcher = searcher, None
+    
+    if isinstance(old_searcher, SearchPool):
+        old_searcher.close()
+
+query_cache = QueryCache(INDEX_PATH, max_entries=CACHE_SIZE, ttl=CACHE_TTL)
+
+def run_search(query, offset, limit):
+    """Окно результатов запроса из кэша или от поискового бэкенда"""
+    if query_cache.refresh():
+        # Индекс перестроен - процессы и mmap держат старую версию
+        reset_searcher()
+    
+    key = (normalize_query(query), offset, limit)
+    result = query_cache.get(key)
+    
+    if result is None:
+        generation = query_cache.generation
+        result = get_searcher().search(query, offset, limit, timeout=5)
+        query_cache.put(key, result, generation)
+    
+    return result
 
 @app.route('/')
 def index():
@@ -17,7 +73,7 @@ def index():
 @app.route('/search')
 def search():
     query = request.args.get('q', '').strip()
-    page = int(request.args.get('page', 1))
+    page = max(1, int(request.args.get('page', 1)))
     per_page = 50
     
     if not query:
@@ -32,52 +88,24 @@ def search():
     start_time = time.time()
     
     try:
-        result = subprocess.run(
-            [SEARCH_BIN, INDEX_PATH, query],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
+        start_idx = (page - 1) * per_page
+        result = run_search(query, start_idx, per_page)
         
         elapsed = (time.time() - start_time) * 1000
         
-        results = []
-        total_found = 0
-        
-        lines = result.stdout.split('\n')
-        for i, line in enumerate(lines):
-            if 'Найдено документов:' in line:
-                parts = line.split()
-                try:
-                    total_found = int(parts[2])
-                except:
-                    pass
-            elif line.strip() and i > 5:
-                if line.strip().startswith(tuple('0123456789')):
-                    title = line.split('.', 1)[1].strip() if '.' in line else line.strip()
-                    if i + 1 < len(lines):
-                        url = lines[i + 1].strip()
-                        if url and not url.startswith(tuple('0123456789')):
-                            results.append({
-                                'title': title[:200],
-                                'url': url
-                            })
-        
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        page_results = results[start_idx:end_idx]
-        total_pages = (len(results) + per_page - 1) // per_page
+        total_found = result['total']
+        total_pages = (total_found + per_page - 1) // per_page
         
         return render_template('search.html',
                              query=query,
-                             results=page_results,
+                             results=result['results'],
                              total=total_found,
                              time=elapsed,
                              page=page,
                              total_pages=total_pages,
                              start_idx=start_idx)
     
-    except subprocess.TimeoutExpired:
+    except SearchTimeout:
         return render_template('search.html',
                              query=query,
                              results=[],
@@ -103,60 +131,54 @@ def api_search():
     if not query:
         return jsonify({'error': 'Empty query'}), 400
     
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'Invalid offset/limit'}), 400
+    
+    if offset < 0 or limit < 1 or limit > MAX_API_LIMIT:
+        return jsonify({'error': f'offset >= 0, 1 <= limit <= {MAX_API_LIMIT}'}), 400
+    
     start_time = time.time()
     
     try:
-        result = subprocess.run(
-            [SEARCH_BIN, INDEX_PATH, query],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
+        result = run_search(query, offset, limit)
         
         elapsed = (time.time() - start_time) * 1000
         
-        results = []
-        total_found = 0
-        
-        lines = result.stdout.split('\n')
-        for i, line in enumerate(lines):
-            if 'Найдено документов:' in line:
-                parts = line.split()
-                try:
-                    total_found = int(parts[2])
-                except:
-                    pass
-            elif line.strip() and i > 5:
-                if line.strip().startswith(tuple('0123456789')):
-                    title = line.split('.', 1)[1].strip() if '.' in line else line.strip()
-                    if i + 1 < len(lines):
-                        url = lines[i + 1].strip()
-                        if url and not url.startswith(tuple('0123456789')):
-                            results.append({
-                                'title': title[:200],
-                                'url': url
-                            })
-        
         return jsonify({
             'query': query,
-            'total': total_found,
+            'total': result['total'],
+            'offset': offset,
+            'limit': limit,
             'time_ms': elapsed,
-            'results': results[:50]
+            'results': result['results']
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cache')
+def api_cache():
+    return jsonify(query_cache.stats())
+
 if __name__ == '__main__':
     if not os.path.exists(f'{INDEX_PATH}.meta'):
         print("ОШИБКА: Индекс не найден!")
         print("Постройте индекс: ./build_index indexer_input.tsv index_stemmed --stemming")
         exit(1)
     
-    if not os.path.exists(SEARCH_BIN):
-        print("ОШИБКА: Поисковик не найден!")
-        print("Скомпилируйте: make search")
-        exit(1)
+    if SEARCH_BACKEND == 'inprocess':
+        print("Поиск в процессе веб-сервера (query_eval.py)")
+    else:
+        if not os.path.exists(SEARCH_BIN):
+            print("ОШИБКА: Поисковик не найден!")
+            print("Скомпилируйте: make search")
+            exit(1)
+        
+        print(f"Запуск пула поисковых процессов: {POOL_SIZE}")
+    get_searcher()
     
     print("Запуск веб-сервера на http://localhost:5000")
     app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)